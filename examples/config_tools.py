@@ -33,7 +33,7 @@ def get_config_parser():
 
 def add_server(config, hostname, login='', JCM_root=None,
                multiplicity_default=1, n_threads_default=1, 
-               stype='Workstation', nickname=None, 
+               stype='Workstation', nickname=None, memory_GB=None,
                **kwargs):
     """Adds a server section to the configuration file.
     
@@ -57,6 +57,10 @@ def add_server(config, hostname, login='', JCM_root=None,
         Type of the resource to use in the JCMsuite daemon utility.
     nickname : str, default None
         Shorthand name to use for this server. If None, the `hostname` is used.
+    memory_GB : float or None, default None
+        The memory in GB which can be used by the jobs on this server. If
+        given, the number of concurrent jobs is limited so that their
+        predicted peak memory fits.
     **kwargs
         Add additional key-value pairs to pass to the daemon functions (which
         are `add_workstation` and `add_queue`) on your own risk.
@@ -82,6 +86,8 @@ def add_server(config, hostname, login='', JCM_root=None,
     if not stype in ['Workstation', 'Queue']:
         raise ValueError('stype must be `Workstation` or `Queue`.')
     config.set(section, 'stype', stype)
+    if memory_GB is not None:
+        config.set(section, 'memory_GB', memory_GB)
     for kw in kwargs:
         config.set(section, kw, kwargs[kw])
 
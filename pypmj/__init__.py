@@ -97,7 +97,13 @@ __logger = __logging.getLogger('init')
 
 # Further imports
 from .parallelization import (read_resources_from_config, DaemonResource, 
-                              ResourceDict)
+                              ResourceDict, StragglerPolicy, RetryPolicy)
+from .hooks import Hook, HookRegistry, ProfilerHook, MemoryTrackerHook
+from .journal import SubmissionJournal
+from .metrics import MetricsExporter
+from .cost_model import CostModel
+from .surrogate import Surrogate
+from .symmetry import SymmetryRule
 from . import utils
 
 # Placeholders for not yet accessible attributes. These will be overwritten
@@ -107,7 +113,9 @@ JCMProject = _JCMPNotLoadedExceptionRaiser('JCMProject')
 Simulation = _JCMPNotLoadedExceptionRaiser('Simulation')
 ResourceManager = _JCMPNotLoadedExceptionRaiser('ResourceManager')
 SimulationSet = _JCMPNotLoadedExceptionRaiser('SimulationSet')
+SimulationSetGroup = _JCMPNotLoadedExceptionRaiser('SimulationSetGroup')
 ConvergenceTest = _JCMPNotLoadedExceptionRaiser('ConvergenceTest')
+AdaptiveScan = _JCMPNotLoadedExceptionRaiser('AdaptiveScan')
 QuantityMinimizer = _JCMPNotLoadedExceptionRaiser('QuantityMinimizer')
 Optimizer = _JCMPNotLoadedExceptionRaiser('Optimizer')
 
@@ -202,11 +210,14 @@ def import_jcmwave(jcm_install_path=None):
     global Simulation
     global ResourceManager
     global SimulationSet
+    global SimulationSetGroup
     global ConvergenceTest
+    global AdaptiveScan
     global QuantityMinimizer
     global Optimizer
     from .core import (JCMProject, Simulation, ResourceManager, SimulationSet,
-                       ConvergenceTest, QuantityMinimizer)
+                       SimulationSetGroup, ConvergenceTest, AdaptiveScan,
+                       QuantityMinimizer)
     from .optimizer import (Optimizer)
 
 def set_log_file(directory='logs', filename='from_date'):
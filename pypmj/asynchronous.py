@@ -0,0 +1,82 @@
+"""Defines an asyncio interface for running `SimulationSet`s and
+`SimulationSetGroup`s, e.g.
+
+    await simuset.run_async(N=4)
+
+or
+
+    async for sim in simuset.iter_results(N=4):
+        ...
+
+The daemon is polled cooperatively, i.e. without blocking, every
+`poll_interval` seconds, so that one event loop can drive several campaigns
+and react to results as they come in. The geometry computation, the result
+processing and the store writes are still executed in the thread of the event
+loop. This module needs Python 3.6 or higher and the new daemon interface.
+It is imported lazily by the `run_async` and `iter_results` methods of the
+core classes.
+
+Authors : Carlo Barth
+
+"""
+
+import asyncio
+import logging
+logger = logging.getLogger(__name__)
+
+
+async def iter_group_results(group, poll_interval=1., **kwargs):
+    """Runs the `SimulationSetGroup` `group` and yields a tuple of the
+    `SimulationSet` and the `Simulation` for each simulation which is
+    finished and stored, or failed without a retry left.
+
+    Parameters
+    ----------
+    group : SimulationSetGroup
+        The group to run.
+    poll_interval : float, default 1.
+        Time in seconds to sleep between polls of the daemon if no result
+        was available.
+
+    The `kwargs` are passed to `SimulationSetGroup.run`.
+
+    """
+    if poll_interval < 0.:
+        raise ValueError('`poll_interval` must not be negative.')
+    if not group.start(**kwargs):
+        return
+    try:
+        while True:
+            handled = group.poll(timeout=0.)
+            if handled is None:
+                break
+            for result in handled:
+                yield result
+            if len(handled) == 0:
+                await asyncio.sleep(poll_interval)
+    finally:
+        group.finish()
+
+
+async def iter_results(simuset, poll_interval=1., **kwargs):
+    """Runs the `SimulationSet` `simuset` and yields each simulation which is
+    finished and stored, or failed without a retry left. See
+    `iter_group_results` for the arguments."""
+    from pypmj.core import SimulationSetGroup
+    group = SimulationSetGroup([simuset])
+    async for _, sim in iter_group_results(group, poll_interval, **kwargs):
+        yield sim
+
+
+async def run_group_async(group, poll_interval=1., **kwargs):
+    """Runs the `SimulationSetGroup` `group` without blocking the event loop.
+    See `iter_group_results` for the arguments."""
+    async for _ in iter_group_results(group, poll_interval, **kwargs):
+        pass
+
+
+async def run_async(simuset, poll_interval=1., **kwargs):
+    """Runs the `SimulationSet` `simuset` without blocking the event loop.
+    See `iter_group_results` for the arguments."""
+    async for _ in iter_results(simuset, poll_interval, **kwargs):
+        pass
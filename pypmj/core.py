@@ -9,12 +9,21 @@ Authors : Carlo Barth
 import logging
 from pypmj import (jcm, daemon, resources, __version__, __jcm_version__,
                    _config, ConfigurationError)
-from pypmj.parallelization import ResourceDict
+from pypmj.parallelization import (ResourceDict, ResourceScheduler,
+                                   StragglerPolicy, RetryPolicy, DAEMON_LOCK,
+                                   get_wait_timeout)
+from pypmj.hooks import HookRegistry
+from pypmj.journal import SubmissionJournal, JOURNAL_FILE_NAME, get_keys_hash
+from pypmj.cost_model import CostModel, MEMORY_COST_COLUMNS
+from pypmj.surrogate import Surrogate
+from pypmj.symmetry import SymmetryRule
 from pypmj.jupyter_tools import JupyterProgressDisplay
+import collections
 from copy import deepcopy
 from datetime import date
 from glob import glob
 import fnmatch
+import hashlib
 import inspect
 from itertools import product
 from numbers import Number
@@ -23,6 +32,7 @@ from shutil import copytree, rmtree, move
 import os
 import pandas as pd
 import pickle
+import re
 from six import string_types
 import sys
 import tempfile
@@ -40,20 +50,38 @@ logger_JCMsolve = logging.getLogger('JCMsolve')
 
 # Global defaults
 SIM_DIR_FMT = 'simulation{0:06d}'
+
+# Suffix of the working directories of speculative duplicates of straggling
+# simulations (see `StragglerPolicy`)
+SPECULATIVE_WDIR_SUFFIX = '_speculative'
 STANDARD_DATE_FORMAT = '%y%m%d'
 _H5_STORABLE_TYPES = (string_types, Number)
+SUBMISSION_ORDERS = ['geometry', 'lpt', 'space_filling']
+# Arguments of `SimulationSet.run` which are not supported by
+# `SimulationSetGroup.run`
+SINGLE_SET_RUN_ARGS = ['memory_per_sim', 'geometry_affinity',
+                       'straggler_policy']
+# Lifecycle events of a simulation for which timestamps are recorded
+# (see `Simulation.record_time`), and the subset of these events which are
+# stored as `t_*`-columns in the HDF5 store if `store_timings` is used
+TIMING_EVENTS = ['geo_start', 'geo_end', 'submit', 'submitted', 'finished',
+                 'processing_start', 'processing_end', 'store_start',
+                 'store_end', 'cleanup_start', 'cleanup_end']
+STORED_TIMING_EVENTS = ['geo_start', 'geo_end', 'submit', 'finished',
+                        'processing_start', 'processing_end', 'store_start']
+TIMING_COLUMN_PREFIX = 't_'
 NEW_DAEMON_DETECTED = hasattr(daemon, 'active_daemon')
 # if not NEW_DAEMON_DETECTED:
 #     logger.warning('Detected old, perhaps buggy daemon interface in JCMsuite.')
 
 # Set warning filters
 warnings.filterwarnings(action='ignore',
-                        message= '.*The\\ Leaf.*is\\ exceeding\\ the\\' + \
-                                 ' maximum\\ recommended\\ rowsize.*\\Z(?ms)')
+                        message= '(?ms).*The\\ Leaf.*is\\ exceeding\\ the\\' + \
+                                 ' maximum\\ recommended\\ rowsize.*\\Z')
 warnings.filterwarnings(action='ignore',
-                        message= '.*your\\ performance\\ may\\ suffer\\ ' + \
+                        message= '(?ms).*your\\ performance\\ may\\ suffer\\ ' + \
                         'as\\ PyTables\\ will\\ pickle\\ object\\ types\\' + \
-                        ' that\\ it\\ cannot.*\\Z(?ms)')
+                        ' that\\ it\\ cannot.*\\Z')
 
 # Set text template for strings replacing class attributes deleted for
 # memory efficiency (occurs if `minimize_memory_usage=True`
@@ -68,6 +96,21 @@ def _default_sim_wdir(storage_dir, sim_number):
     return os.path.join(storage_dir, SIM_DIR_FMT.format(sim_number))
 
 
+def _import_asynchronous():
+    """Returns the `asynchronous` module, which needs Python 3.6 or higher
+    and the new daemon interface."""
+    if sys.version_info < (3, 6):
+        raise RuntimeError('The asynchronous interface needs Python 3.6 ' +
+                           'or higher.')
+        return
+    if not NEW_DAEMON_DETECTED:
+        raise RuntimeError('The asynchronous interface needs the new ' +
+                           'daemon interface of JCMsuite.')
+        return
+    from pypmj import asynchronous
+    return asynchronous
+
+
 # =============================================================================
 class JCMProject(object):
     """Represents a JCMsuite project, initialized using a path specifier (
@@ -248,6 +291,19 @@ class JCMProject(object):
         """Returns the complete path to the project file."""
         return os.path.join(self.working_dir, self.project_file_name)
     
+    def get_fingerprint(self):
+        """Returns a fingerprint of the project, i.e. the SHA1 hex digest of
+        the names and contents of all files of signature *.jcm* in the project
+        source folder. Projects with identical input files have identical
+        fingerprints, which allows to identify HDF5 stores of earlier runs of
+        the same project."""
+        sha = hashlib.sha1()
+        for fpath in sorted(glob(os.path.join(self.source, '*.jcm*'))):
+            sha.update(os.path.basename(fpath).encode('utf-8'))
+            with open(fpath, 'rb') as f:
+                sha.update(f.read())
+        return sha.hexdigest()
+    
     def show_readme(self, try_use_markdown=True):
         """Returns the content of the README.md file, if present. If
         `try_use_markdown` is True, it is tried to display the mark down file
@@ -381,6 +437,8 @@ class Simulation(object):
         self.pass_computational_costs = False
         self.status = 'Pending'
         self._resultbag = resultbag
+        # Monotonic timestamps of the lifecycle events (see `record_time`)
+        self.timestamps = {}
         
         # If no list of stored_keys is provided, use all keys for which values
         # are of types that could be stored to H5
@@ -415,9 +473,14 @@ class Simulation(object):
     def working_dir(self):
         """Returns the name of the working directory, specified by the
         storage_dir and the simulation number.
-        It is constructed using the global SIM_DIR_FMT formatter.
+        It is constructed using the global SIM_DIR_FMT formatter. If the
+        results were computed by a speculative duplicate job (see
+        `StragglerPolicy`), its working directory is returned.
         """
-        return _default_sim_wdir(self.storage_dir, self.number)
+        wdir = _default_sim_wdir(self.storage_dir, self.number)
+        if getattr(self, '_speculative_result', False):
+            return wdir + SPECULATIVE_WDIR_SUFFIX
+        return wdir
     
     def find_file(self, pattern):
         """Finds a file in the working directory (see method `working_dir()`)
@@ -453,6 +516,32 @@ class Simulation(object):
         else:
             raise RuntimeError('Multiple results found:\n\t{}'.format(matches))
     
+    def record_time(self, event):
+        """Records the current (monotonic) time for the lifecycle `event`,
+        which must be one of `TIMING_EVENTS`."""
+        if event not in TIMING_EVENTS:
+            raise ValueError('Unknown timing event: {}. Known events are: {}'.
+                             format(event, TIMING_EVENTS))
+            return
+        self.timestamps[event] = utils.monotonic()
+
+    def get_timings(self, t_ref, events=None):
+        """Returns a dict with the times of the lifecycle `events` relative to
+        the reference time `t_ref` (as returned by `utils.monotonic`). The keys
+        are the event names prefixed with 't_'. Events that were not recorded
+        have the value NaN. If `events` is None, all `TIMING_EVENTS` are used.
+        """
+        if events is None:
+            events = TIMING_EVENTS
+        timings = {}
+        for event in events:
+            if event in self.timestamps:
+                timings[TIMING_COLUMN_PREFIX + event] = \
+                                            self.timestamps[event] - t_ref
+            else:
+                timings[TIMING_COLUMN_PREFIX + event] = np.nan
+        return timings
+
     def set_pass_computational_costs(self, val):
         """Sets the value of `pass_computational_costs`.""" 
         if not isinstance(val, bool):
@@ -491,6 +580,7 @@ class Simulation(object):
             del jcm_kwargs['resultbag']
 
         # Make directories if necessary
+        self._speculative_result = False
         wdir = self.working_dir()
         if not os.path.exists(wdir):
             os.makedirs(wdir)
@@ -516,8 +606,14 @@ class Simulation(object):
                              for k in set(self.keys) | set(additional_keys) }
         
         # Start to solve
-        self.job_id = jcm.solve(project_file, keys=pass_keys,
-                                working_dir=wdir, mode=mode, **jcm_kwargs)
+        if mode == 'solve':
+            self.record_time('submit')
+        with DAEMON_LOCK:
+            self.job_id = jcm.solve(project_file, keys=pass_keys,
+                                    working_dir=wdir, mode=mode,
+                                    **jcm_kwargs)
+        if mode == 'solve':
+            self.record_time('submitted')
         return self.job_id
 
     def _set_jcm_results_and_logs(self, results, logs=None):
@@ -525,6 +621,7 @@ class Simulation(object):
         JCMsolve.
         This also sets the status to `Failed` or `Finished`.
         """
+        self.record_time('finished')
         if NEW_DAEMON_DETECTED:
             if logs is not None:
                 self.logger.warning('`logs` should be None if using the ' +
@@ -835,6 +932,7 @@ class Simulation(object):
         # Run jcm.geo. The cd-fix is necessary because the
         # project_dir/working_dir functionality seems to be broken in the
         # current python interface!
+        self.record_time('geo_start')
         _thisdir = os.getcwd()
         os.chdir(self.project.working_dir)
         with utils.Capturing() as output:
@@ -845,6 +943,7 @@ class Simulation(object):
         for line in output:
             logger_JCMgeo.debug(line)
         os.chdir(_thisdir)
+        self.record_time('geo_end')
     
     def solve_standalone(self, processing_func=None, wdir_mode='keep',
                          run_post_process_files=None, resource_manager=None,
@@ -884,51 +983,34 @@ class Simulation(object):
             automatically (ignored if provided).
         """
         
+        # With the new daemon, only the jobs of this simulation are waited for
+        if NEW_DAEMON_DETECTED:
+            return self.submit(processing_func=processing_func,
+                               wdir_mode=wdir_mode,
+                               run_post_process_files=run_post_process_files,
+                               resource_manager=resource_manager,
+                               additional_keys_for_pps=additional_keys_for_pps,
+                               jcm_solve_kwargs=jcm_solve_kwargs).result()
+
         if jcm_solve_kwargs is None:
             jcm_solve_kwargs = {}
-        
-        if wdir_mode not in ['keep', 'delete']:
-            raise ValueError('Unknown wdir_mode: {}'.format(wdir_mode))
-            return
-        
-        if resource_manager is None:
-            resource_manager = ResourceManager()
+        self._prepare_standalone(wdir_mode, resource_manager)
 
-        # Add the resources if they are not ready yet
-        if not resource_manager._resources_ready():
-            resource_manager.add_resources()
-        
-        # Copy project to its working directory
-        self._prepare_project()
-
-        # Solve the simulation and wait for it to finish. Output is captured
-        # and passed to the logger
-        # ---
-        # This is the new daemon style version
-        if NEW_DAEMON_DETECTED:
+        # Solve the simulation and wait for it to finish using the old daemon
+        # interface. Output is captured and passed to the logger
+        with utils.Capturing() as output:
             self.solve(**jcm_solve_kwargs)
-            if hasattr(jcm, 'Resultbag'):
-                results = daemon.wait(resultbag=self._resultbag)
-            else:
-                results = daemon.wait()
-            result = results.values()[0]
-            self._set_jcm_results_and_logs(result)
-            ret1, ret2 = (result['results'], result['logs'])
-        
-        # This is the old daemon style version
-        else:
-            with utils.Capturing() as output:
-                self.solve(**jcm_solve_kwargs)
+            with DAEMON_LOCK:
                 if hasattr(jcm, 'Resultbag'):
                     results, logs = daemon.wait(resultbag=self._resultbag)
                 else:
                     results, logs = daemon.wait()
-            for line in output:
-                logger_JCMsolve.debug(line)
-    
-            # Set the results and logs in the Simulation-instance
-            self._set_jcm_results_and_logs(results[0], logs[0])
-            ret1, ret2 = (results[0], logs[0])
+        for line in output:
+            logger_JCMsolve.debug(line)
+
+        # Set the results and logs in the Simulation-instance
+        self._set_jcm_results_and_logs(results[0], logs[0])
+        ret1, ret2 = (results[0], logs[0])
         
         if run_post_process_files is None:
             if not self.status == 'Failed':
@@ -946,33 +1028,20 @@ class Simulation(object):
         # Iterate over all given post process files
         for f in run_post_process_files:
             if os.path.isfile(f):
-                # This is the new daemon style version
-                if NEW_DAEMON_DETECTED:
+                with utils.Capturing() as output:
                     self.solve(pp_file=f,
                                additional_keys=additional_keys_for_pps,
                                **jcm_solve_kwargs)
-                    if hasattr(jcm, 'Resultbag'):
-                        pp_results = daemon.wait(resultbag=self._resultbag)
-                    else:
-                        pp_results = daemon.wait()
-                    pp_result = pp_results.values()[0]
-                    # Add the post process results
-                    self._add_post_process_results(pp_result)
-                # This is the old daemon style version
-                else:
-                    with utils.Capturing() as output:
-                        self.solve(pp_file=f,
-                                   additional_keys=additional_keys_for_pps,
-                                   **jcm_solve_kwargs)
+                    with DAEMON_LOCK:
                         if hasattr(jcm, 'Resultbag'):
                             pp_results, pp_logs = daemon.wait(
                                         resultbag=self._resultbag)
                         else:
                             pp_results, pp_logs = daemon.wait()
-                    for line in output:
-                        logger_JCMsolve.debug(line)
-                    # Add the post process results
-                    self._add_post_process_results(pp_results[0], pp_logs[0])
+                for line in output:
+                    logger_JCMsolve.debug(line)
+                # Add the post process results
+                self._add_post_process_results(pp_results[0], pp_logs[0])
             else:
                 self.logger.warn('Given post process file "{}" '.format(f) +
                                  'does not exist. Skipping.')
@@ -982,6 +1051,102 @@ class Simulation(object):
             if wdir_mode == 'delete':
                 self.remove_working_directory()
         return ret1, ret2
+
+    def submit(self, processing_func=None, wdir_mode='keep',
+               run_post_process_files=None, resource_manager=None,
+               additional_keys_for_pps=None, jcm_solve_kwargs=None):
+        """Submits this simulation (and the subsequent post processes) and
+        returns immediately with a `concurrent.futures.Future`. The future
+        is set to the tuple of the results and logs of the solve run (as
+        returned by `solve_standalone`) once all jobs are finished and the
+        results are processed, or to the exception which occurred.
+
+        The jobs are waited for by a background thread which is shared by all
+        simulations (see `pypmj.harvester`), so that several simulations
+        can be solved in parallel, e.g.
+
+            futures = [sim.submit() for sim in simulations]
+            for future in concurrent.futures.as_completed(futures):
+                ...
+
+        Note that the `processing_func` is called in this background thread.
+        Requires the new daemon interface. See `solve_standalone` for the
+        parameters.
+        """
+        if not NEW_DAEMON_DETECTED:
+            raise RuntimeError('`submit` needs the new daemon interface. ' +
+                               'Please use `solve_standalone`.')
+            return
+        from pypmj.harvester import get_harvester, new_future
+
+        if jcm_solve_kwargs is None:
+            jcm_solve_kwargs = {}
+        if run_post_process_files is None:
+            run_post_process_files = []
+        elif not isinstance(run_post_process_files, list):
+            run_post_process_files = [run_post_process_files]
+        pp_files = []
+        for f in run_post_process_files:
+            if os.path.isfile(f):
+                pp_files.append(f)
+            else:
+                self.logger.warn('Given post process file "{}" '.format(f) +
+                                 'does not exist. Skipping.')
+        self._prepare_standalone(wdir_mode, resource_manager)
+
+        harvester = get_harvester()
+        future = new_future()
+        ret = []
+        resultbag = None
+        if hasattr(jcm, 'Resultbag'):
+            resultbag = self._resultbag
+
+        def _on_job_done(job_future):
+            # Handles the result of a finished job and submits the next post
+            # process, or finishes the `future`
+            try:
+                result = job_future.result()
+                if len(ret) == 0:
+                    self._set_jcm_results_and_logs(result)
+                    ret.extend([result['results'], result['logs']])
+                else:
+                    self._add_post_process_results(result)
+                if len(pp_files) > 0:
+                    harvester.submit(self.solve, resultbag=resultbag,
+                                     pp_file=pp_files.pop(0),
+                                     additional_keys=additional_keys_for_pps,
+                                     **jcm_solve_kwargs).add_done_callback(
+                                                                _on_job_done)
+                    return
+                if not self.status == 'Failed':
+                    self.process_results(processing_func, True)
+                if wdir_mode == 'delete':
+                    self.remove_working_directory()
+                future.set_result(tuple(ret))
+            except Exception as e:
+                future.set_exception(e)
+
+        harvester.submit(self.solve, resultbag=resultbag,
+                         **jcm_solve_kwargs).add_done_callback(_on_job_done)
+        return future
+
+    def _prepare_standalone(self, wdir_mode, resource_manager):
+        """Checks the `wdir_mode`, adds the resources of the
+        `resource_manager` if necessary and copies the project to its working
+        directory, as needed before a standalone solve."""
+        if wdir_mode not in ['keep', 'delete']:
+            raise ValueError('Unknown wdir_mode: {}'.format(wdir_mode))
+            return
+        
+        if resource_manager is None:
+            resource_manager = ResourceManager()
+
+        # Add the resources if they are not ready yet
+        if not resource_manager._resources_ready():
+            resource_manager.add_resources()
+        
+        # Copy project to its working directory
+        self._prepare_project()
     
     def _forget_attr(self, attr_name):
         if not hasattr(self, attr_name):
@@ -991,6 +1156,15 @@ class Simulation(object):
     def forget_jcm_results_and_logs(self):
         for attr_name in ['jcm_results', 'logs']:
             self._forget_attr(attr_name)
+    
+    def _copy_results_from(self, sim):
+        """Sets the results, logs and status of the Simulation `sim`, which
+        has identical keys, on this instance."""
+        for attr_name in ['logs', 'exit_code', 'jcm_results', 'resource_id',
+                          '_results_dict']:
+            if hasattr(sim, attr_name):
+                setattr(self, attr_name, getattr(sim, attr_name))
+        self.status = sim.status
 
 
 # =============================================================================
@@ -1100,14 +1274,28 @@ class ResourceManager(object):
         # Restrict the current resources to this resource
         self.use_only_resources(resource_nick)
     
-    def add_resources(self, n_shots=10, wait_seconds=5, ignore_fail=False):
+    def add_resources(self, n_shots=10, wait_seconds=5, ignore_fail=False,
+                      concurrent=True, min_resources=1):
         """Tries to add all resources configured in the configuration using the
-        JCMdaemon."""
-        self.resources.add_all_repeatedly(n_shots, wait_seconds, ignore_fail)
+        JCMdaemon.
+        If `concurrent` is True, the resources are added in parallel with an
+        exponentially growing waiting time between the trials, and this
+        method returns as soon as `min_resources` resources are available.
+        The remaining ones are added in the background (see
+        `ResourceDict.add_all_concurrently`). Otherwise, they are added one
+        after another.
+        """
+        if concurrent:
+            self.resources.add_all_concurrently(n_shots, wait_seconds,
+                                                ignore_fail, min_resources)
+        else:
+            self.resources.add_all_repeatedly(n_shots, wait_seconds,
+                                              ignore_fail)
 
     def _resources_ready(self):
         """Returns whether the resources are already added."""
-        return daemon.daemonCheck(warn=False)
+        with DAEMON_LOCK:
+            return daemon.daemonCheck(warn=False)
     
     def reset_daemon(self):
         """Resets the JCMdaemon, i.e. disconnects it and resets the queue."""
@@ -1116,7 +1304,9 @@ class ResourceManager(object):
 #             if not daemon.queue.is_empty():
 #                 daemon.queue.reset()
 #         else:
-        daemon.shutdown()
+        self.resources.stop_adding()
+        with DAEMON_LOCK:
+            daemon.shutdown()
 
 
 # =============================================================================
@@ -1213,6 +1403,28 @@ class SimulationSet(object):
         the results and logs are kept for each simulation. Set this parameter
         to true to minimize the memory usage. Caution: you will loose all the
         `jcm_results` and `logs` in the `Simulation`-instances.
+    hooks : HookRegistry, Hook, list of Hooks or NoneType, default None
+        Hooks which are called on the events occurring during the scheduling
+        and the run (see `pypmj.hooks`), e.g. a `ProfilerHook`. A new
+        `HookRegistry` is created if None, a `Hook` or a list is given. Hooks
+        can also be added later using the `hooks`-attribute.
+    constraints : callable, str, list of these or NoneType, default None
+        Constraints which all simulations must fulfill, e.g. to skip
+        physically invalid combinations of the `combination_mode`
+        'product'. Each constraint is evaluated once for all combinations,
+        using a pandas DataFrame with one row per combination and one column
+        per `parameters` and `geometry` key. A callable must return a boolean
+        array (e.g. `lambda k: k['d'] < k['p']`), a str is evaluated using
+        `DataFrame.eval` (e.g. `'d < p'`). Combinations which violate any
+        constraint are removed before the simulations are created. Keys
+        added using `append_simulations` are not checked.
+    symmetries : SymmetryRule, list of SymmetryRule-instances or NoneType,
+        default None
+        Symmetries of the project (see `pypmj.symmetry`). If the transformed
+        keys of a simulation match the keys of another simulation, only one
+        of them is solved and the results of the other are synthesized using
+        the result mapping of the rule. Rules are also applied repeatedly,
+        e.g. `phi -> phi+60` relates all multiples of 60 degrees.
     """
 
     # Names of the groups in the HDF5 store which are used to store metadata
@@ -1224,13 +1436,46 @@ class SimulationSet(object):
                  use_resultbag=False, transitional_storage_base=None,
                  combination_mode='product', check_version_match=True,
                  resource_manager=None, store_logs=False, 
-                 minimize_memory_usage=False):
+                 minimize_memory_usage=False, hooks=None, constraints=None,
+                 symmetries=None):
         self.logger = logging.getLogger('core.' + self.__class__.__name__)
 
         # Save initialization arguments into namespace
         self.combination_mode = combination_mode
+        if constraints is None:
+            constraints = []
+        elif not isinstance(constraints, (list, tuple)):
+            constraints = [constraints]
+        self.constraints = list(constraints)
+        if symmetries is None:
+            symmetries = []
+        elif isinstance(symmetries, SymmetryRule):
+            symmetries = [symmetries]
+        for rule in symmetries:
+            if not isinstance(rule, SymmetryRule):
+                raise TypeError('`symmetries` must be `SymmetryRule`-' +
+                                'instances, not {}.'.format(type(rule)))
+        self.symmetries = list(symmetries)
         self.store_logs = store_logs
         self.minimize_memory_usage = minimize_memory_usage
+        if isinstance(hooks, HookRegistry):
+            self.hooks = hooks
+        else:
+            self.hooks = HookRegistry(hooks)
+        self.cost_model = None
+        self._resource_scheduler = None
+        self._straggler_policy = None
+        self._retry_policy = None
+        self._retry_queue = []
+        self._additional_keys = None
+        self._journal = None
+        self._run_end_pending = False
+        self.excluded_sim_numbers = []
+        self.surrogate_predictions = None
+        self._duplicate_of = {}
+        self._duplicates = {}
+        self._symmetric_of = {}
+        self._symmetric = {}
         
         # Analyze the provided keys
         self._check_keys(keys)
@@ -1695,6 +1940,83 @@ class SimulationSet(object):
         else:
             self.store.append(dbase_tab, data)
 
+    def _get_timing_columns(self):
+        """Returns the names of the `t_*`-columns which are used to store the
+        lifecycle timings."""
+        return [TIMING_COLUMN_PREFIX + e for e in STORED_TIMING_EVENTS]
+
+    def _store_has_timing_columns(self):
+        """Returns True if the data in the HDF5 store contains the `t_*`-
+        columns of the lifecycle timings, False if not and None if the store
+        is empty."""
+        if self.is_store_empty():
+            return None
+        columns = self.store[self._get_dbase_tab_name()].columns
+        return all([c in columns for c in self._get_timing_columns()])
+
+    def _append_simulation_to_store(self, sim):
+        """Appends the data of the simulation `sim` to the HDF5 store. The
+        lifecycle timings are added as `t_*`-columns (in seconds relative to the
+        start of the run) if `store_timings` was set in `run`."""
+        sim.record_time('store_start')
+        data = sim._get_DataFrame()
+        if getattr(self, '_store_timings', False):
+            timings = sim.get_timings(self._t_run_start,
+                                      events=STORED_TIMING_EVENTS)
+            for col in self._get_timing_columns():
+                data[col] = timings[col]
+        self.append_store(data)
+        self._fan_out_to_duplicates(sim, data)
+        self._synthesize_symmetric(sim, data)
+        sim.record_time('store_end')
+
+    def _fan_out_to_duplicates(self, sim, data, copy_results=True):
+        """Appends the stored `data` of the simulation `sim` to the HDF5 store
+        for each unfinished duplicate of `sim` (see
+        `make_simulation_schedule`), using the simulation number of the
+        duplicate as the index, and marks the duplicates as finished. If
+        `copy_results` is True, the results of `sim` are also set on the
+        duplicates."""
+        for n in self._duplicates.get(sim.number, []):
+            if n in self.finished_sim_numbers:
+                continue
+            dup_data = data.copy()
+            dup_data.index = pd.Index([n], name=data.index.name)
+            self.append_store(dup_data)
+            if copy_results:
+                self.simulations[n]._copy_results_from(sim)
+            self.finished_sim_numbers.append(n)
+
+    def _synthesize_symmetric(self, sim, data):
+        """Appends rows for the unfinished simulations which are symmetric to
+        the simulation `sim` (see the `symmetries`) to the HDF5 store. They
+        are synthesized from the stored `data` of `sim` using the result
+        mappings of the rules, and are fanned out to duplicates."""
+        for n in self._symmetric.get(sim.number, []):
+            if n in self.finished_sim_numbers:
+                continue
+            _, rules = self._symmetric_of[n]
+            sym_data = data.copy()
+            for rule in rules:
+                sym_data = rule.map_results(sym_data)
+            for key in self.stored_keys:
+                sym_data[key] = self.simulation_properties.at[n, key]
+            sym_data.index = pd.Index([n], name=data.index.name)
+            self.append_store(sym_data)
+            member = self.simulations[n]
+            member._results_dict = {c: sym_data.at[n, c]
+                                    for c in sym_data.columns
+                                    if c not in self.stored_keys}
+            member.status = 'Finished and processed'
+            self.finished_sim_numbers.append(n)
+            self._fan_out_to_duplicates(member, sym_data)
+
+    def _is_derived(self, number):
+        """Returns whether the results of the simulation with `number` are
+        derived from another simulation, i.e. if it is a duplicate of or
+        symmetric to another simulation, instead of being solved."""
+        return number in self._duplicate_of or number in self._symmetric_of
+
     def _get_duplicate_H5_rows(self, check_index_only=False):
         """Find duplicate rows in the HDF5 store based on stored keys if
         `check_index_only=False`, else only the index (i.e. sim_number) is
@@ -1706,7 +2028,13 @@ class SimulationSet(object):
             dupl_index = pd.Int64Index(sim_nums[sim_nums.duplicated()].values,
                                        name=u'number')
         else:
-            dupl_index = data[data.duplicated(self.stored_keys)].index
+            # Rows with identical keys, but different simulation numbers are
+            # no duplicates, as they belong to different logical simulations
+            # (see `make_simulation_schedule`)
+            index_name = data.index.name or 'index'
+            duplicated = data.reset_index().duplicated(
+                                        [index_name] + self.stored_keys)
+            dupl_index = data[duplicated.values].index
         return dupl_index
 
     def fix_h5_store(self, try_restructure=True, brute_force=False):
@@ -1776,7 +2104,9 @@ class SimulationSet(object):
         self.open_store()
         self.logger.info('Successfully restructured HDF5 store.')
             
-    def make_simulation_schedule(self, fix_h5_duplicated_rows=False):
+    def make_simulation_schedule(self, fix_h5_duplicated_rows=False,
+                                 submission_order='geometry',
+                                 deduplicate=True):
         """Makes a schedule by getting a list of simulations that must be
         performed, reorders them to avoid unnecessary calls of JCMgeo, and
         checks the HDF5 store for simulation data which is already known.
@@ -1785,12 +2115,47 @@ class SimulationSet(object):
         `fix_h5_duplicated_rows=True` to try to automatically fix it.
         Alternatively, you could call the `fix_h5_store`-method yourself.
         
+        The order in which the simulations are submitted is controlled by
+        `submission_order`:
+        
+          - 'geometry': in order of the simulation numbers, i.e. grouped by
+            geometry (default).
+          - 'lpt': longest-processing-time-first, using the predictions of
+            the `cost_model`. Simulations with identical geometry are still
+            submitted consecutively, but the most expensive groups and the
+            most expensive simulations inside each group are submitted
+            first, which reduces the total run time if many simulations run
+            in parallel. If no cost model was set using `fit_cost_model`, it
+            is fitted to the data in the HDF5 store. If this is not possible,
+            the 'geometry' order is used.
+          - 'space_filling': coarse-to-fine, so that the finished
+            simulations cover the parameter space evenly at any time of the
+            run, e.g. to analyze partial results or to stop early. The
+            geometry groups are ordered coarse-to-fine with respect to the
+            geometry keys, and the simulations inside each group with
+            respect to the parameter keys. Simulations with identical
+            geometry are still submitted consecutively.
+        
+        The simulation numbers are not affected by the submission order.
+        
+        If `deduplicate` is True, simulations with identical stored keys (e.g.
+        in `combination_mode='list'` or due to repeated values in the
+        sequences) are solved only once. The results are stored for all of
+        their simulation numbers. Simulations added using
+        `append_simulations` are not deduplicated.
+        
         """
+        if submission_order not in SUBMISSION_ORDERS:
+            raise ValueError('Unknown submission_order: {}. Use one of {}'.
+                             format(submission_order, SUBMISSION_ORDERS))
+            return
         self._get_simulation_list()
         self._sort_simulations()
         
-        # Init the failed simulation list
+        # Init the failed and excluded simulation lists
         self.failed_simulations = []
+        self.excluded_sim_numbers = []
+        self.surrogate_predictions = None
 
         # We perform the pre-check to see the state of our HDF5 store.
         #   * If it is empty, we store the current metadata and are ready to
@@ -1818,7 +2183,9 @@ class SimulationSet(object):
                 if fix_h5_duplicated_rows:
                     self.fix_h5_store()
                     self.logger.info('Rerunning `make_simulation_schedule`.')
-                    self.make_simulation_schedule()
+                    self.make_simulation_schedule(
+                                        submission_order=submission_order,
+                                        deduplicate=deduplicate)
                     return
                 else:
                     raise RuntimeError('Found duplicated rows in the HDF5' +
@@ -1830,6 +2197,637 @@ class SimulationSet(object):
                              'store. Number of stored simulations: {}'.format(
                                  len(self.finished_sim_numbers)))
 
+        # Find simulations with identical keys
+        self._duplicate_of = {}
+        self._duplicates = {}
+        self._symmetric_of = {}
+        self._symmetric = {}
+        if deduplicate:
+            self._find_duplicate_simulations()
+        if len(self.symmetries) > 0:
+            self._find_symmetric_simulations()
+
+        # Set the predicted costs and the submission order
+        self._predicted_costs = None
+        if self.cost_model is None and submission_order == 'lpt':
+            self.fit_cost_model()
+        if self.cost_model is not None:
+            self._predicted_costs = self.predict_costs()
+        self._set_submission_order(submission_order)
+        self.hooks.trigger('on_schedule', self)
+
+    def fit_cost_model(self, target='TotalTime', data=None, **kwargs):
+        """Fits a `CostModel` for the cost column `target` as a function of the
+        stored keys and sets it as the `cost_model` of this simulation set.
+        The cost model is used for remaining time estimates and the 'lpt'
+        submission order (see `make_simulation_schedule`).
+        
+        Parameters
+        ----------
+        target : str, default 'TotalTime'
+            The cost column to model, e.g. 'TotalTime', 'CpuTime' or a memory
+            column.
+        data : pandas.DataFrame or NoneType, default None
+            The data to fit, e.g. the concatenated data of other HDF5 stores
+            of the same project. Must contain the stored keys and the `target`
+            column. If None, the data in the current HDF5 store is used.
+        
+        The `kwargs` are passed to `CostModel`. Returns the fitted model or
+        None if no valid data was found.
+        """
+        if data is None:
+            data = self.get_store_data()
+        if data is None or len(data) == 0:
+            self.logger.warn('Unable to fit the cost model: no data.')
+            return
+        model = self._fit_cost_model(target, data, **kwargs)
+        if model is None:
+            self.logger.warn('Unable to fit the cost model: no valid ' +
+                             'samples for {}.'.format(target))
+            return
+        self.logger.info('Fitted cost model for {} on {} samples.'.format(
+                         target, model.n_samples))
+        self.cost_model = model
+        if self._is_scheduled() and hasattr(self, 'simulation_properties'):
+            self._predicted_costs = self.predict_costs()
+        return model
+
+    def _fit_cost_model(self, target, data, **kwargs):
+        """Returns a `CostModel` for `target` fitted to `data` using the
+        numerical stored keys as features, or None if the fit failed."""
+        if data is None or len(data) == 0 or not target in data.columns:
+            return
+        if not 'features' in kwargs:
+            keys = list(self.parameters.keys()) + list(self.geometry.keys())
+            kwargs['features'] = [k for k in keys if k in data.columns and
+                                  pd.api.types.is_numeric_dtype(data[k]) and
+                                  not pd.api.types.is_bool_dtype(data[k])]
+        model = CostModel(target=target, **kwargs).fit(data)
+        if not model.is_fitted:
+            return
+        return model
+
+    def predict_costs(self, model=None):
+        """Returns the predicted costs of all simulations as a pandas Series
+        with the simulation numbers as the index, using the `model` or the
+        current `cost_model` if None. Missing values of the features are
+        replaced by the mean prediction."""
+        if model is None:
+            model = self.cost_model
+        if model is None:
+            raise RuntimeError('No cost model is set. Use `fit_cost_model` ' +
+                               'first.')
+            return
+        props = self.simulation_properties
+        missing = [f for f in model.features if f not in props.columns]
+        if len(missing) > 0:
+            raise ValueError('The features {} of the cost model are not '.
+                             format(missing) + 'among the stored keys.')
+            return
+        prediction = pd.Series(model.predict(props), index=props.index)
+        if prediction.isnull().any():
+            prediction = prediction.fillna(prediction.mean())
+        return prediction
+
+    def surrogate(self, target_columns, method='rbf', data=None, **kwargs):
+        """Returns a `Surrogate` for the result column(s) `target_columns` as
+        a function of the stored keys, fitted to the finished simulations.
+        The surrogate answers vectorized queries with error estimates, e.g.
+        `values, errors = surrogate.predict(df, return_error=True)`.
+
+        Parameters
+        ----------
+        target_columns : str or list
+            The result column(s) to interpolate, e.g. columns returned by the
+            `processing_func`.
+        method : {'rbf', 'linear', 'gp'}, default 'rbf'
+            The interpolation method (see `Surrogate`).
+        data : pandas.DataFrame or NoneType, default None
+            The data to fit. Must contain the stored keys and the
+            `target_columns`. If None, the data in the current HDF5 store is
+            used.
+
+        The `kwargs` are passed to `Surrogate`. Returns None if no data was
+        found.
+        """
+        if data is None:
+            data = self.get_store_data()
+        if data is None or len(data) == 0:
+            self.logger.warn('Unable to fit the surrogate: no data.')
+            return
+        if not 'features' in kwargs:
+            keys = list(self.parameters.keys()) + list(self.geometry.keys())
+            kwargs['features'] = [k for k in keys if k in data.columns and
+                                  pd.api.types.is_numeric_dtype(data[k]) and
+                                  not pd.api.types.is_bool_dtype(data[k])]
+        model = Surrogate(target_columns, method=method, **kwargs).fit(data)
+        if not model.is_fitted:
+            self.logger.warn('Unable to fit the surrogate: no valid ' +
+                             'samples for {}.'.format(target_columns))
+            return
+        self.logger.info('Fitted {}.'.format(model))
+        return model
+
+    def apply_surrogate(self, surrogate, tolerance):
+        """Excludes all unfinished simulations from the following runs for
+        which the error estimate of the `surrogate` is below the `tolerance`
+        for all targets, i.e. skips solves which would not add information.
+
+        Parameters
+        ----------
+        surrogate : Surrogate
+            A fitted surrogate, e.g. as returned by the `surrogate`-method.
+        tolerance : float or dict
+            The absolute tolerance for the error estimates, or a dict which
+            maps each target column to its tolerance.
+
+        Returns a tuple of DataFrames of the predicted values and the error
+        estimates of the skipped simulations, with the simulation numbers as
+        the index. They are also stored in the `surrogate_predictions`
+        attribute. Call `make_simulation_schedule` to reset the exclusions.
+        """
+        if not self._is_scheduled():
+            raise RuntimeError('Please run `make_simulation_schedule` first.')
+            return
+        if not isinstance(tolerance, dict):
+            tolerance = {t: tolerance for t in surrogate.targets}
+        props = self.simulation_properties
+        missing = [f for f in surrogate.features if f not in props.columns]
+        if len(missing) > 0:
+            raise ValueError('The features {} of the surrogate are not '.
+                             format(missing) + 'among the stored keys.')
+            return
+        todo = [n for n in range(self.num_sims)
+                if n not in self.finished_sim_numbers and
+                n not in self.excluded_sim_numbers]
+        values, errors = surrogate.predict(props.loc[todo], return_error=True)
+        accurate = np.ones(len(todo), dtype=bool)
+        for target in surrogate.targets:
+            accurate &= errors[target].values < tolerance[target]
+        skipped = [n for n, acc in zip(todo, accurate) if acc]
+        self.exclude_simulations(skipped)
+        self.logger.info('Skipping {} of {} simulations '.format(
+                         len(skipped), len(todo)) +
+                         'using the surrogate predictions.')
+        self.surrogate_predictions = (values.loc[skipped],
+                                      errors.loc[skipped])
+        return self.surrogate_predictions
+
+    def _set_submission_order(self, submission_order):
+        """Sets the `_submission_order`, i.e. the list of simulation numbers
+        in the order in which they are submitted, and updates the
+        `rerun_JCMgeo`-attributes accordingly."""
+        self._submission_order = None
+        if submission_order == 'geometry':
+            return
+        if submission_order == 'lpt':
+            if self._predicted_costs is None:
+                self.logger.warn('No cost model available. Falling back to ' +
+                                 'the submission order "geometry".')
+                return
+            self._submission_order = self._get_lpt_order(
+                                                    self._predicted_costs)
+        if submission_order == 'space_filling':
+            self._submission_order = self._get_space_filling_order()
+
+    def _get_geometry_groups(self):
+        """Returns a list of lists of simulation numbers, where each list
+        contains consecutive simulations of identical geometry."""
+        groups = []
+        for sim in self.simulations:
+            if sim.rerun_JCMgeo or len(groups) == 0:
+                groups.append([])
+            groups[-1].append(sim.number)
+        return groups
+
+    def _reorder_geometry_groups(self, groups):
+        """Returns the flat submission order for the ordered list of geometry
+        `groups` and moves the `rerun_JCMgeo`-flag to the first simulation of
+        each group."""
+        order = []
+        for group in groups:
+            for i, n in enumerate(group):
+                self.simulations[n].rerun_JCMgeo = i == 0
+            order += group
+        return order
+
+    def _get_lpt_order(self, costs):
+        """Returns the longest-processing-time-first submission order for the
+        predicted `costs`, keeping simulations of identical geometry
+        together."""
+        costs = costs.reindex(range(self.num_sims)).values
+        finished = set(self.finished_sim_numbers)
+        groups = []
+        for group in self._get_geometry_groups():
+            group = sorted(group, key=lambda n: -costs[n])
+            group_cost = sum([costs[n] for n in group if n not in finished])
+            groups.append((group_cost, group))
+        groups.sort(key=lambda g: -g[0])
+        return self._reorder_geometry_groups([g[1] for g in groups])
+
+    def _get_space_filling_order(self):
+        """Returns the coarse-to-fine submission order, keeping simulations of
+        identical geometry together."""
+        geometry_keys = [k for k in self._loop_props if k in self.geometry]
+        parameter_keys = [k for k in self._loop_props
+                          if k not in self.geometry]
+        groups = self._get_geometry_groups()
+        first_sims = [self.simulations[group[0]] for group in groups]
+        ordered = []
+        for i in self._rank_coarse_to_fine(first_sims, geometry_keys):
+            group = groups[i]
+            sims = [self.simulations[n] for n in group]
+            ordered.append([group[j] for j in
+                            self._rank_coarse_to_fine(sims, parameter_keys)])
+        return self._reorder_geometry_groups(ordered)
+
+    def _rank_coarse_to_fine(self, sims, keys):
+        """Returns the indices of the simulations `sims` in coarse-to-fine
+        order with respect to the `keys`. Each key is treated as an axis on
+        which its distinct values are ranked using
+        `utils.coarse_to_fine_order`. The simulations are sorted by the
+        maximum and then by the sum of their ranks, i.e. the grids of the
+        first values of all axes are completed first."""
+        if len(keys) == 0 or len(sims) < 3:
+            return list(range(len(sims)))
+        ranks = np.zeros((len(sims), len(keys)), dtype=int)
+        for j, key in enumerate(keys):
+            values = [sim.keys[key] for sim in sims]
+            unique = list(pd.unique(values))
+            try:
+                unique = sorted(unique)
+            except TypeError:
+                pass
+            positions = {v: i for i, v in enumerate(unique)}
+            axis_ranks = np.empty(len(unique), dtype=int)
+            axis_ranks[utils.coarse_to_fine_order(len(unique))] = \
+                np.arange(len(unique))
+            ranks[:, j] = [axis_ranks[positions[v]] for v in values]
+        return list(np.lexsort((np.arange(len(sims)), ranks.sum(axis=1),
+                                ranks.max(axis=1))))
+
+    def get_submission_order(self):
+        """Returns the list of simulation numbers in the order in which they
+        are submitted."""
+        if getattr(self, '_submission_order', None) is None:
+            return list(range(self.num_sims))
+        return list(self._submission_order)
+
+    def exclude_simulations(self, numbers):
+        """Excludes the simulations with the given simulation `numbers` from
+        the following runs, e.g. failed simulations which should not be
+        retried. They are listed in `excluded_sim_numbers` until
+        `make_simulation_schedule` is called again."""
+        for n in numbers:
+            if n not in self.excluded_sim_numbers:
+                self.excluded_sim_numbers.append(n)
+
+    def append_simulations(self, keys_list):
+        """Appends new simulations to the schedule of this set, e.g. to add
+        the suggestions of an optimization study to one long-lived set and
+        store. The next `run` only solves the simulations which are not yet
+        finished. Only supported for `combination_mode='list'`.
+
+        Parameters
+        ----------
+        keys_list : list of dict
+            One dict per new simulation, which maps each of the varying
+            `parameters` and `geometry` keys to its value. Fixed keys and
+            `constants` are taken from the set.
+
+        The new simulations get the next simulation numbers and are
+        submitted after the existing ones, in the given order. Returns the
+        list of the new simulation numbers.
+        """
+        if not self._is_scheduled():
+            raise RuntimeError('Please run `make_simulation_schedule` first.')
+            return
+        if self.combination_mode != 'list':
+            raise RuntimeError('Appending simulations is only supported ' +
+                               'for `combination_mode="list"`.')
+            return
+        base_keys = dict(self.constants)
+        for k in self.stored_keys:
+            if k not in self._loop_props:
+                if k in self.parameters:
+                    base_keys[k] = self.parameters[k]
+                else:
+                    base_keys[k] = self.geometry[k]
+
+        numbers = []
+        last_geometry = None
+        if self.num_sims > 0:
+            last_geometry = {k: self.simulations[-1].keys[k]
+                             for k in self.geometry}
+        for keys in keys_list:
+            missing = [k for k in self._loop_props if k not in keys]
+            if len(missing) > 0:
+                raise ValueError('Missing keys for the new simulation: {}'.
+                                 format(missing))
+                return
+            sim_keys = dict(base_keys)
+            sim_keys.update(keys)
+            geometry = {k: sim_keys[k] for k in self.geometry}
+            sim = Simulation(number=self.num_sims, keys=sim_keys,
+                             stored_keys=self.stored_keys,
+                             storage_dir=self.storage_dir,
+                             project=self.project,
+                             rerun_JCMgeo=geometry != last_geometry,
+                             store_logs=self.store_logs,
+                             resultbag=self._resultbag)
+            self.simulations.append(sim)
+            numbers.append(sim.number)
+            self.num_sims += 1
+            last_geometry = geometry
+
+        # Update the simulation properties and the loop values, so that the
+        # metadata in the store describes all simulations
+        new_props = pd.DataFrame(
+                        [{k: self.simulations[n].keys[k]
+                          for k in self.stored_keys} for n in numbers],
+                        index=pd.Index(numbers, name='number'),
+                        columns=self.stored_keys)
+        self.simulation_properties = pd.concat([self.simulation_properties,
+                                                new_props])
+        for k in self._loop_props:
+            values = self.simulation_properties[k].values
+            if k in self.parameters:
+                self.parameters[k] = values
+            else:
+                self.geometry[k] = values
+        if getattr(self, '_submission_order', None) is not None:
+            self._submission_order += numbers
+
+        # Assign the geometry groups if the simulations are appended during
+        # a run (see `SimulationSetGroup`)
+        group_ids = getattr(self, '_geometry_group_ids', None)
+        if group_ids is not None:
+            group = max(list(group_ids.values()) + [-1])
+            for n in numbers:
+                if self.simulations[n].rerun_JCMgeo or group == -1:
+                    group += 1
+                group_ids[n] = group
+        self.logger.debug('Appended simulations: {}'.format(numbers))
+        return numbers
+
+    def _find_history_stores(self, search_dirs=None):
+        """Returns a list of tuples (storage_dir, data) for all HDF5 stores
+        which were created for a project with the same fingerprint as the
+        current one (see `JCMProject.get_fingerprint`), excluding the current
+        store.
+        
+        `search_dirs` is a list of storage folders or HDF5 store files. A
+        storage folder is searched for a store file and for store files in its
+        direct subfolders. If None, the parent folder of the current
+        `storage_dir` is searched, i.e. the storage folders of earlier runs
+        which used the same storage base.
+        """
+        if search_dirs is None:
+            search_dirs = [os.path.dirname(os.path.normpath(
+                                                        self.storage_dir))]
+        elif isinstance(search_dirs, string_types):
+            search_dirs = [search_dirs]
+        dbase_name = os.path.basename(self._database_file)
+        candidates = []
+        for dir_ in search_dirs:
+            if os.path.isfile(dir_):
+                candidates.append(dir_)
+            else:
+                candidates += glob(os.path.join(dir_, dbase_name))
+                candidates += glob(os.path.join(dir_, '*', dbase_name))
+
+        fingerprint = self.project.get_fingerprint()
+        tab = self._get_dbase_tab_name()
+        own_file = os.path.normcase(os.path.abspath(self._database_file))
+        stores = []
+        for path in sorted(set([os.path.abspath(c) for c in candidates])):
+            if os.path.normcase(path) == own_file:
+                continue
+            try:
+                store = pd.HDFStore(path, mode='r')
+            except Exception as e:
+                self.logger.debug('Unable to open HDF5 store {}: {}'.format(
+                                  path, e))
+                continue
+            try:
+                if not (self.STORE_VERSION_GROUP in store and tab in store):
+                    continue
+                version_df = store[self.STORE_VERSION_GROUP]
+                if not '__project_fingerprint__' in version_df.columns:
+                    continue
+                if (version_df.at[0, '__project_fingerprint__'] !=
+                        fingerprint):
+                    continue
+                stores.append((os.path.dirname(path), store[tab]))
+            except Exception as e:
+                self.logger.debug('Unable to read HDF5 store {}: {}'.format(
+                                  path, e))
+            finally:
+                store.close()
+        self.logger.debug('Found {} HDF5 stores of the same project.'.format(
+                          len(stores)))
+        return stores
+
+    def _get_mean_wdir_size(self, storage_dirs, max_dirs=50):
+        """Returns the mean size in bytes of the existing simulation working
+        directories in the `storage_dirs` (using at most `max_dirs` of
+        them), or NaN if none is found."""
+        pattern = SIM_DIR_FMT.format(0).rstrip('0') + '*'
+        wdirs = []
+        for dir_ in storage_dirs:
+            wdirs += [d for d in glob(os.path.join(dir_, pattern))
+                      if os.path.isdir(d)]
+            if len(wdirs) >= max_dirs:
+                break
+        if len(wdirs) == 0:
+            return np.nan
+        return np.mean([utils.get_directory_size(d)
+                        for d in wdirs[:max_dirs]])
+
+    def plan(self, search_dirs=None, data=None, disk_safety_factor=2.,
+             memory_safety_factor=1.2):
+        """Predicts the computational costs of the current schedule without
+        running anything and recommends settings for `run`. Must be called
+        after `make_simulation_schedule`.
+        
+        The predictions are based on the computational costs stored in the
+        HDF5 store of this simulation set and in the stores of earlier runs of
+        the same project, which are identified using the project fingerprint
+        (see `JCMProject.get_fingerprint`). `CostModel`s for the CPU time, the
+        total (wall) time and the memory are fitted to this data. The disk
+        footprint is estimated from the working directories of earlier
+        simulations which are still on disk.
+        
+        Parameters
+        ----------
+        search_dirs : list, str or NoneType, default None
+            Storage folders or HDF5 store files to search for historical data
+            (see `_find_history_stores`). If None, the sibling folders of the
+            current storage folder are searched.
+        data : pandas.DataFrame or NoneType, default None
+            Additional historical data, i.e. stored keys and computational
+            costs, to use for the predictions.
+        disk_safety_factor : float, default 2.
+            The working directories are kept (`wdir_mode='keep'`) only if the
+            free disk space exceeds the predicted footprint by this factor.
+        memory_safety_factor : float, default 1.2
+            Factor applied to the predicted peak memory when recommending the
+            number of parallel jobs per resource.
+        
+        Returns an OrderedDict with the report, which is also logged. Values
+        which cannot be predicted due to missing data are NaN.
+        """
+        if not self._is_scheduled():
+            raise RuntimeError('`plan` can only be used after ' +
+                               '`make_simulation_schedule`.')
+            return
+
+        # Collect the historical data
+        history = self._find_history_stores(search_dirs)
+        frames = [h[1] for h in history]
+        if not self.is_store_empty():
+            frames.append(self.get_store_data())
+        if data is not None:
+            frames.append(data)
+        frames = [f for f in frames if f is not None and len(f) > 0]
+        if len(frames) > 0:
+            hist_data = pd.concat(frames, ignore_index=True, sort=False)
+        else:
+            hist_data = None
+
+        # New solves and distinct geometries. Excluded simulations and the
+        # ones whose results are derived from others are not solved.
+        finished = set(self.finished_sim_numbers)
+        skipped = self._get_skipped_sim_numbers()
+        todo = [n for n in range(self.num_sims)
+                if not n in finished and not n in skipped]
+        props = self.simulation_properties.loc[todo]
+        geo_cols = [c for c in self.geometry.keys() if c in props.columns]
+        if len(todo) == 0:
+            n_geometries = 0
+        elif len(geo_cols) == 0:
+            n_geometries = 1
+        else:
+            n_geometries = len(props.loc[:, geo_cols].drop_duplicates())
+
+        # Predicted computational costs of the new solves
+        def predict(target):
+            model = self._fit_cost_model(target, hist_data)
+            if model is None or len(todo) == 0:
+                return np.array([np.nan])
+            if any([f not in props.columns for f in model.features]):
+                return np.array([np.nan])
+            return model.predict(props)
+        cpu_time = predict('CpuTime')
+        total_time = predict('TotalTime')
+        memory = np.array([np.nan])
+        mem_col = self._get_memory_column(hist_data)
+        if mem_col is not None:
+            memory = predict(mem_col)
+        peak_memory = np.max(memory) if len(todo) > 0 else 0.
+        if len(todo) == 0:
+            cpu_hours = total_hours = 0.
+        else:
+            cpu_hours = np.sum(cpu_time) / 3600.
+            total_hours = np.sum(total_time) / 3600.
+
+        # Disk footprint of the working directories
+        storage_dirs = [self.storage_dir] + [h[0] for h in history]
+        wdir_size = self._get_mean_wdir_size(storage_dirs)
+        footprint = len(todo) * wdir_size / 1024.**3
+        free = utils.get_free_disk_space(self.storage_dir)
+        free = np.nan if free is None else free / 1024.**3
+
+        # Recommended multiplicity and n_threads per resource
+        resources = self.get_current_resources()
+        recommended_m_n = collections.OrderedDict()
+        for nick in sorted(resources.keys()):
+            resource = resources[nick]
+            m = resource.multiplicity
+            n = resource.n_threads
+            cores = resource.get_available_cores()
+            max_jobs = cores
+            mem_capacity = resource.memory_GB
+            if mem_capacity is None and resource.hostname == 'localhost':
+                mem_capacity = utils.get_total_memory_GB()
+            if mem_capacity is not None and np.isfinite(peak_memory) and \
+                    peak_memory > 0.:
+                max_jobs = int(mem_capacity /
+                               (memory_safety_factor * peak_memory))
+            if len(todo) > 0:
+                max_jobs = min(max_jobs, len(todo))
+            max_jobs = max(1, min(max_jobs, cores))
+            if max_jobs < m:
+                m = max_jobs
+                n = max(1, cores // m)
+            recommended_m_n[nick] = (m, n)
+        n_slots = max(1, sum([mn[0] for mn in recommended_m_n.values()]))
+        wall_hours = total_hours / min(n_slots, max(len(todo), 1))
+
+        # Recommended `wdir_mode` and `N`
+        if not np.isfinite(footprint) or not np.isfinite(free) or \
+                footprint * disk_safety_factor <= free:
+            wdir_mode = 'keep'
+            N = 'all'
+        else:
+            wdir_mode = 'delete'
+            per_job = disk_safety_factor * wdir_size / 1024.**3
+            N = int(min(max(n_slots, int(free / per_job)), 2 * n_slots))
+            if N >= len(todo):
+                N = 'all'
+
+        report = collections.OrderedDict([
+            ('n_simulations', self.num_sims),
+            ('n_finished', len(finished)),
+            ('n_skipped', len(skipped)),
+            ('n_new', len(todo)),
+            ('n_geometries', n_geometries),
+            ('n_history_stores', len(history)),
+            ('n_history_samples', 0 if hist_data is None else len(hist_data)),
+            ('cpu_hours', cpu_hours),
+            ('total_time_hours', total_hours),
+            ('wall_hours', wall_hours),
+            ('peak_memory_GB', peak_memory),
+            ('wdir_size_GB', wdir_size / 1024.**3),
+            ('disk_footprint_GB', footprint),
+            ('free_disk_GB', free),
+            ('recommended_N', N),
+            ('recommended_wdir_mode', wdir_mode),
+            ('recommended_m_n', recommended_m_n)])
+        self._log_plan(report)
+        return report
+
+    def _get_memory_column(self, data):
+        """Returns the name of the peak memory cost column in `data` (see
+        `MEMORY_COST_COLUMNS`) or None if there is none."""
+        if data is None:
+            return
+        for col in MEMORY_COST_COLUMNS:
+            if col in data.columns:
+                return col
+
+    def _log_plan(self, report):
+        """Logs the `report` returned by `plan`."""
+        lines = ['Plan for {}:'.format(self)]
+        lines.append(('\tnew solves: {} (of {}, {} excluded or derived), ' +
+                      'geometries: {}').format(
+                     report['n_new'], report['n_simulations'],
+                     report['n_skipped'], report['n_geometries']))
+        lines.append('\tbased on {} samples from {} other stores'.format(
+                     report['n_history_samples'], report['n_history_stores']))
+        lines.append(('\tCPU hours: {:.3g}, wall hours: {:.3g}, peak ' +
+                      'memory per job: {:.3g} GB').format(
+                     report['cpu_hours'], report['wall_hours'],
+                     report['peak_memory_GB']))
+        lines.append(('\tdisk footprint: {:.3g} GB (free: {:.3g} GB)').format(
+                     report['disk_footprint_GB'], report['free_disk_GB']))
+        lines.append('\trecommended: N={}, wdir_mode={}, (multiplicity, '.format(
+                     report['recommended_N'],
+                     report['recommended_wdir_mode']) +
+                     'n_threads) per resource: {}'.format(
+                     dict(report['recommended_m_n'])))
+        self.logger.info('\n'.join(lines))
+
     def _get_simulation_list(self):
         """Check the `parameters`- and `geometry`-dictionaries for sequences
         and generate a list which has a keys-dictionary for each distinct
@@ -1899,6 +2897,11 @@ class SimulationSet(object):
             propertyCombinations = []
             for iSim in range(Nsims):
                 propertyCombinations.append(tuple([l[iSim] for l in loopList]))
+        
+        # Remove the combinations which violate the constraints
+        if len(self.constraints) > 0:
+            propertyCombinations = self._apply_constraints(
+                                propertyCombinations, fixedProperties, allKeys)
 
         self.num_sims = len(propertyCombinations)  # total num of simulations
         if self.num_sims == 1:
@@ -1948,6 +2951,142 @@ class SimulationSet(object):
                                                   columns=self.stored_keys)
         self.simulation_properties.index.name = 'number'
 
+    def _find_duplicate_simulations(self):
+        """Finds the simulations with identical stored keys and sets
+        `_duplicate_of` (mapping the number of each duplicate to the number of
+        the simulation which is actually solved) and `_duplicates` (the
+        inverse). Finished simulations are preferred as the solved ones. The
+        stored results are fanned out to unfinished duplicates of finished
+        simulations right away."""
+        props = self.simulation_properties
+        try:
+            hashes = pd.util.hash_pandas_object(props, index=False).values
+        except TypeError:
+            self.logger.debug('Unable to hash the simulation keys. Skipping ' +
+                              'the deduplication.')
+            return
+        finished = set(self.finished_sim_numbers)
+        groups = collections.OrderedDict()
+        for n, h in zip(props.index, hashes):
+            groups.setdefault(h, []).append(n)
+        for numbers in groups.values():
+            if len(numbers) < 2:
+                continue
+            done = [n for n in numbers if n in finished]
+            solved = done[0] if len(done) > 0 else numbers[0]
+            duplicates = [n for n in numbers if n != solved]
+            self._duplicates[solved] = duplicates
+            for n in duplicates:
+                self._duplicate_of[n] = solved
+        if len(self._duplicate_of) == 0:
+            return
+        self.logger.info('Found {} simulation(s) with keys identical to '.
+                         format(len(self._duplicate_of)) + 'others. These ' +
+                         'are solved only once.')
+
+        # Fan out the results of finished simulations
+        data = None
+        for solved, duplicates in self._duplicates.items():
+            if solved not in finished or all([n in finished
+                                              for n in duplicates]):
+                continue
+            if data is None:
+                data = self.get_store_data()
+            self._fan_out_to_duplicates(self.simulations[solved],
+                                        data.loc[[solved]],
+                                        copy_results=False)
+
+    def _find_symmetric_simulations(self):
+        """Finds the simulations which are related by the `symmetries` and
+        sets `_symmetric_of` (mapping the number of each simulation which is
+        not solved to a tuple of the number of the solved simulation and the
+        list of rules which transform the latter into the former) and
+        `_symmetric` (mapping the number of each solved simulation to the
+        list of symmetric simulations). Finished simulations are preferred as
+        the solved ones, and the results of unfinished simulations which are
+        symmetric to them are synthesized right away. Duplicates are not
+        considered, as they are handled by their solved simulation."""
+        props = self.simulation_properties
+        props = props.loc[[n for n in props.index
+                           if n not in self._duplicate_of]]
+        edges = {n: [] for n in props.index}
+        for rule in self.symmetries:
+            lookup = dict(zip(rule.hash_keys(props), props.index))
+            transformed = rule.transform_keys(props)
+            for n, h in zip(props.index, rule.hash_keys(transformed)):
+                m = lookup.get(h)
+                if m is not None and m != n:
+                    edges[n].append((m, rule))
+
+        # Assign the symmetric simulations to the solved ones using a
+        # breadth-first search, starting with the finished simulations
+        finished = set(self.finished_sim_numbers)
+        order = [n for n in props.index if n in finished] + \
+                [n for n in props.index if n not in finished]
+        for root in order:
+            if root in self._symmetric_of or root in self._symmetric:
+                continue
+            queue = collections.deque([(root, [])])
+            while queue:
+                n, path = queue.popleft()
+                for m, rule in edges[n]:
+                    if (m == root or m in self._symmetric_of or
+                            m in self._symmetric):
+                        continue
+                    self._symmetric_of[m] = (root, path + [rule])
+                    self._symmetric.setdefault(root, []).append(m)
+                    queue.append((m, path + [rule]))
+        if len(self._symmetric_of) == 0:
+            return
+        self.logger.info('Found {} simulation(s) which are symmetric to '.
+                         format(len(self._symmetric_of)) + 'others. Their ' +
+                         'results are synthesized.')
+
+        # Synthesize the results of the finished simulations
+        data = None
+        for root, members in self._symmetric.items():
+            if root not in finished or all([n in finished for n in members]):
+                continue
+            if data is None:
+                data = self.get_store_data()
+            self._synthesize_symmetric(self.simulations[root],
+                                       data.loc[[root]])
+
+    def _apply_constraints(self, combinations, fixed_properties, all_keys):
+        """Returns the list of the property `combinations` which fulfill all
+        `constraints`."""
+        df_dict = {}
+        for i, column in enumerate([k[0] for k in combinations[0]]):
+            df_dict[column] = [keySet[i][1] for keySet in combinations]
+        for p in fixed_properties:
+            if p in self.stored_keys:
+                df_dict[p] = [all_keys[p]] * len(combinations)
+        df = pd.DataFrame(df_dict, columns=self.stored_keys)
+        mask = np.ones(len(combinations), dtype=bool)
+        for constraint in self.constraints:
+            if isinstance(constraint, string_types):
+                result = df.eval(constraint)
+            elif callable(constraint):
+                result = constraint(df)
+            else:
+                raise TypeError('Constraints must be callables or strings, ' +
+                                'not {}.'.format(type(constraint)))
+                return
+            result = np.asarray(result, dtype=bool)
+            if result.shape != mask.shape:
+                raise ValueError('The constraint {} did not return '.format(
+                                 constraint) + 'one boolean per ' +
+                                 'combination.')
+                return
+            mask &= result
+        if not mask.any():
+            raise ValueError('No combination of the keys fulfills the ' +
+                             'constraints.')
+            return
+        self.logger.info('Removed {} of {} combinations violating the '.format(
+                         len(mask) - mask.sum(), len(mask)) + 'constraints.')
+        return [c for c, keep in zip(combinations, mask) if keep]
+
     def _sort_simulations(self):
         """Sorts the list of simulations in a way that all simulations with
         identical geometry are performed consecutively.
@@ -2012,7 +3151,10 @@ class SimulationSet(object):
         """Returns a pandas DataFrame from the version info of JCMsuite and
         pypmj which can be stored in the HDF5 store."""
         return pd.DataFrame({'__version__': __version__,
-                             '__jcm_version__': __jcm_version__}, index=[0])
+                             '__jcm_version__': __jcm_version__,
+                             '__project_fingerprint__':
+                                        self.project.get_fingerprint()},
+                            index=[0])
 
     def _store_version_data(self):
         """Stores metadata of the JCMsuite and pypmj versions."""
@@ -2185,6 +3327,8 @@ class SimulationSet(object):
         in the store that don't have a match in the search DataFrame.
         `t_info_interval` is the time interval in seconds at which remaining
         time info is printed in case of long comparisons.
+        Rows with identical keys (i.e. duplicate simulations) are matched
+        one-to-one, so that each store row matches at most one search row.
         """
         ckeys = self.stored_keys
         if len(ckeys) > 255:
@@ -2228,6 +3372,7 @@ class SimulationSet(object):
         t_since_info = 0.
         count = 0
         matches = []
+        matched = set()
         for srow in search.itertuples():
             # start the timer
             t0 = time.time()
@@ -2236,11 +3381,12 @@ class SimulationSet(object):
                 return matches, []
             # Compare this row
             idx = utils.walk_df(df_, srow._asdict(), keys=deepcopy(ckeys))
-            if isinstance(idx, int):
-                matches.append((srow[0], idx))
-            elif idx is not None:
-                raise RuntimeError('Fatal error in HDF5 store comparison. ' +
-                                   'Found multiple matching rows.')
+            if not isinstance(idx, list):
+                idx = [] if idx is None else [idx]
+            idx = [i for i in idx if i not in matched]
+            if len(idx) > 0:
+                matches.append((srow[0], idx[0]))
+                matched.add(idx[0])
             count += 1
 
             # Time info
@@ -2259,7 +3405,7 @@ class SimulationSet(object):
         # store
         if len(matches) == 0:
             return [], list(df_.index)
-        unmatched = [i for i in list(df_.index) if i not in zip(*matches)[1]]
+        unmatched = [i for i in list(df_.index) if i not in matched]
         return matches, unmatched
 
     def reset_resources(self):
@@ -2279,10 +3425,12 @@ class SimulationSet(object):
         """
         self.resource_manager.use_only_resources(names)
 
-    def add_resources(self, n_shots=10, wait_seconds=5, ignore_fail=False):
+    def add_resources(self, n_shots=10, wait_seconds=5, ignore_fail=False,
+                      concurrent=True, min_resources=1):
         """Tries to add all resources configured in the configuration using the
-        JCMdaemon."""
-        self.resource_manager.add_resources(n_shots, wait_seconds, ignore_fail)
+        JCMdaemon (see `ResourceManager.add_resources`)."""
+        self.resource_manager.add_resources(n_shots, wait_seconds, ignore_fail,
+                                            concurrent, min_resources)
 
     def _resources_ready(self):
         """Returns whether the resources are already added."""
@@ -2382,6 +3530,227 @@ class SimulationSet(object):
                                 additional_keys_for_pps=additional_keys_for_pps,
                                 jcm_solve_kwargs=jcm_solve_kwargs)
 
+    def predict_memory(self, memory_per_sim='auto'):
+        """Returns the predicted peak memory in GB of all simulations as a
+        pandas Series with the simulation numbers as the index, or None if
+        no prediction is possible.
+        
+        `memory_per_sim` can be a number (used for all simulations), a
+        callable which returns the memory for the `keys`-dict of a
+        simulation, or 'auto', in which case a `CostModel` is fitted to the
+        peak memory column in the HDF5 store.
+        """
+        index = pd.Index(list(range(self.num_sims)), name='number')
+        if memory_per_sim is None:
+            return
+        if isinstance(memory_per_sim, Number):
+            return pd.Series(float(memory_per_sim), index=index)
+        if callable(memory_per_sim):
+            return pd.Series([float(memory_per_sim(sim.keys))
+                              for sim in self.simulations], index=index)
+        if not memory_per_sim == 'auto':
+            raise ValueError('`memory_per_sim` must be a number, a ' +
+                             'callable, None or "auto".')
+            return
+        data = None if self.is_store_empty() else self.get_store_data()
+        mem_col = self._get_memory_column(data)
+        if mem_col is None:
+            return
+        model = self._fit_cost_model(mem_col, data)
+        if model is None:
+            return
+        try:
+            return self.predict_costs(model)
+        except ValueError:
+            return
+
+    def _set_up_resource_scheduler(self, memory_per_sim,
+                                   geometry_affinity=False,
+                                   straggler_policy=None):
+        """Initializes the `ResourceScheduler` which assigns the jobs to the
+        resources, if any of the current resources has a configured
+        `memory_GB` and the peak memory of the simulations can be predicted
+        (see `predict_memory`), if `geometry_affinity` is used or if a
+        `straggler_policy` is given. Otherwise, the job distribution is left
+        to the daemon."""
+        self._resource_scheduler = None
+        self._predicted_memory = None
+        self._affinity_slice_size = None
+        self._straggler_policy = None
+        resources = self.get_current_resources()
+        use_memory = any([r.memory_GB is not None
+                          for r in resources.values()])
+        if straggler_policy is True:
+            straggler_policy = StragglerPolicy()
+        if straggler_policy is not None and self.use_resultbag:
+            self.logger.warn('Speculative re-execution of stragglers is not ' +
+                             'supported with a resultbag.')
+            straggler_policy = None
+        if not (use_memory or geometry_affinity or straggler_policy):
+            return
+        if not NEW_DAEMON_DETECTED:
+            self.logger.warn('Assigning jobs to specific resources is only ' +
+                             'supported with the new daemon interface.')
+            return
+        if all([r.resourceIDs is None for r in resources.values()]):
+            self.logger.warn('Cannot assign jobs to specific resources, as ' +
+                             'they were not added by pypmj.')
+            return
+        if use_memory:
+            predicted = self.predict_memory(memory_per_sim)
+            if predicted is None:
+                self.logger.info('No memory predictions available. The ' +
+                                 'memory limits of the resources are ' +
+                                 'ignored.')
+            else:
+                self._predicted_memory = predicted
+                self.logger.info('Limiting the concurrent jobs per resource' +
+                                 ' using the predicted peak memory (max. ' +
+                                 '{:.3g} GB).'.format(predicted.max()))
+        if geometry_affinity:
+            if geometry_affinity is True:
+                # Slices of this size distribute the remaining simulations
+                # evenly among the total multiplicity of the resources
+                n_slots = sum([r.multiplicity for r in resources.values()])
+                slice_size = int(np.ceil(float(self.num_sims_to_do()) /
+                                         max(n_slots, 1)))
+            else:
+                slice_size = int(geometry_affinity)
+            self._affinity_slice_size = max(slice_size, 1)
+            self.logger.info('Pinning geometry groups to resources in ' +
+                             'slices of up to {} simulations.'.format(
+                                 self._affinity_slice_size))
+        if straggler_policy:
+            # The runtimes are only meaningful if the jobs do not wait in the
+            # queue of the daemon, so that the multiplicity is enforced
+            straggler_policy.reset()
+            self._straggler_policy = straggler_policy
+            self.logger.info('Using {}.'.format(straggler_policy))
+        elif not geometry_affinity and self._predicted_memory is None:
+            return
+        self._resource_scheduler = ResourceScheduler(resources)
+
+    def _get_geometry_group_ids(self, submission_order):
+        """Returns a dict mapping each simulation number to the index of its
+        geometry group, i.e. of the consecutive simulations of identical
+        geometry in the `submission_order`."""
+        group_ids = {}
+        group = -1
+        for n in submission_order:
+            if self.simulations[n].rerun_JCMgeo or group == -1:
+                group += 1
+            group_ids[n] = group
+        return group_ids
+
+    def _get_affinity_candidates(self, sim):
+        """Returns the list with the nickname of the resource to which the
+        current slice of the geometry group of `sim` is pinned, or None if
+        `sim` starts a new slice (or geometry affinity is not used)."""
+        if self._affinity_slice_size is None:
+            return
+        state = self._affinity_state
+        if (self._geometry_group_ids[sim.number] != state['group'] or
+                state['n'] >= self._affinity_slice_size):
+            return
+        return [state['nickname']]
+
+    def _pin_to_resource(self, sim, nickname):
+        """Updates the state of the geometry affinity after `sim` was
+        assigned to the resource with `nickname`."""
+        if self._affinity_slice_size is None:
+            return
+        state = self._affinity_state
+        group = self._geometry_group_ids[sim.number]
+        if (group != state['group'] or nickname != state['nickname'] or
+                state['n'] >= self._affinity_slice_size):
+            state.update(group=group, nickname=nickname, n=0)
+        state['n'] += 1
+
+    def _select_resource(self, sim, job_ids, ids_to_sim_number, handled_ids):
+        """Returns the nickname of the resource to which `sim` is assigned and
+        its predicted memory. Simulations of the same geometry slice stay on
+        the same resource if geometry affinity is used. New slices go to the
+        least loaded resource. If memory limits are used, this waits for a
+        resource with enough free memory (see `_wait_for_free_resource`)."""
+        scheduler = self._resource_scheduler
+        candidates = self._get_affinity_candidates(sim)
+        if (self._predicted_memory is not None or
+                self._straggler_policy is not None):
+            nickname, memory = self._wait_for_free_resource(
+                sim, job_ids, ids_to_sim_number, handled_ids, candidates)
+        else:
+            memory = np.nan
+            nickname = scheduler.get_least_loaded(candidates)
+        self._pin_to_resource(sim, nickname)
+        return nickname, memory
+
+    def _get_predicted_memory(self, sim):
+        """Returns the predicted peak memory of `sim` (NaN if unknown)."""
+        if self._predicted_memory is None:
+            return np.nan
+        return self._predicted_memory.get(sim.number, np.nan)
+
+    def _wait_for_free_resource(self, sim, job_ids, ids_to_sim_number,
+                                handled_ids, candidates=None):
+        """Waits until a resource (out of the nicknames in `candidates`, if
+        given) can take `sim` according to the `ResourceScheduler`,
+        processing the jobs of the current batch that finish in the meantime
+        (their IDs are added to the set `handled_ids`). Returns the nickname
+        of the resource and the predicted memory."""
+        memory = self._get_predicted_memory(sim)
+        while True:
+            nickname = self._resource_scheduler.select_resource(memory,
+                                                                candidates)
+            if nickname is not None:
+                return nickname, memory
+            waiting = [j for j in job_ids if not j in handled_ids]
+            if len(waiting) == 0:
+                if candidates is not None:
+                    # The pinned resource cannot take the simulation at all
+                    candidates = None
+                    continue
+                raise RuntimeError('No resource can take simulation {}.'.
+                                   format(sim.number))
+                return
+            self.logger.debug('No free resource for simulation {}'.format(
+                              sim.number) + ' ({:.3g} GB). Waiting.'.format(
+                              memory))
+            handled_ids.update(self._wait_for_any_new(waiting,
+                                                      ids_to_sim_number))
+
+    def _init_submission_state(self, processing_func=None,
+                               jcm_geo_kwargs=None, jcm_solve_kwargs=None,
+                               additional_keys=None):
+        """Initializes the state which is needed to submit the simulations
+        and to handle their results (see `_start_simulations`) and returns
+        the submission order."""
+        self.processing_func = processing_func
+        self._additional_keys = additional_keys
+        if jcm_geo_kwargs is None:
+            jcm_geo_kwargs = {}
+        if jcm_solve_kwargs is None:
+            jcm_solve_kwargs = {}
+        if not 'resultbag' in jcm_solve_kwargs:
+            jcm_solve_kwargs['resultbag'] = self._resultbag
+
+        submission_order = self.get_submission_order()
+        self._geometry_group_ids = self._get_geometry_group_ids(
+                                                            submission_order)
+        self._affinity_state = {'group': None, 'nickname': None, 'n': 0}
+
+        # State needed to resubmit simulations, i.e. for retries and the
+        # speculative re-execution of stragglers. The geometry owner is
+        # shared by all sets which use the same project working directory
+        # (see `SimulationSetGroup`).
+        self._jcm_geo_kwargs = jcm_geo_kwargs
+        self._jcm_solve_kwargs = jcm_solve_kwargs
+        self._geometry_owner = {'simuset': None, 'number': None}
+        self._speculative_pairs = {}
+        self._speculative_origins = {}
+        if not hasattr(self, '_speculative_leftovers'):
+            self._speculative_leftovers = []
+        return submission_order
+
     def _start_simulations(self, N='all', processing_func=None, 
                            run_post_process_files=None, 
                            additional_keys=None,
@@ -2423,19 +3792,26 @@ class SimulationSet(object):
 
         job_ids = []
         ids_to_sim_number = {}  # dict to find the sim-number from the job id
-        self.processing_func = processing_func
 
         if N == 'all':
             N = self.num_sims
         if not isinstance(N, int):
             raise ValueError('`N` must be an integer or "all"')
         
-        if jcm_geo_kwargs is None:
-            jcm_geo_kwargs = {}
-        if jcm_solve_kwargs is None:
-            jcm_solve_kwargs = {}
-        if not 'resultbag' in jcm_solve_kwargs:
-            jcm_solve_kwargs['resultbag'] = self._resultbag
+        submission_order = self._init_submission_state(processing_func,
+                                                       jcm_geo_kwargs,
+                                                       jcm_solve_kwargs,
+                                                       additional_keys)
+        jcm_geo_kwargs = self._jcm_geo_kwargs
+        jcm_solve_kwargs = self._jcm_solve_kwargs
+
+        # Harvest or reattach to the jobs of an interrupted run using the
+        # submission journal. Reattached jobs are waited for in the first
+        # batch.
+        reattached = set()
+        if self._journal is not None:
+            reattached = self._recover_from_journal(job_ids,
+                                                    ids_to_sim_number)
 
         # We only want to compute the geometry if necessary, which is
         # controlled using the `rerun_JCMgeo`-attribute of the Simulation-
@@ -2449,25 +3825,67 @@ class SimulationSet(object):
         # We frequently count how many simulations we ran, to give an estimate
         # of the running time
         n_sims_done = 0
-        n_sims_todo = self.num_sims_to_do()
+        n_sims_todo = self.num_sims_to_do() - len(reattached)
+
+        # If a cost model is available, the remaining time is estimated using
+        # the predicted costs of the remaining simulations, calibrated by the
+        # ratio of the elapsed time and the predicted costs of the finished
+        # ones
+        predicted = getattr(self, '_predicted_costs', None)
+        if predicted is not None:
+            predicted = predicted.reindex(range(self.num_sims)).values
+            finished = set(self.finished_sim_numbers)
+            pred_todo = sum([predicted[n] for n in range(self.num_sims)
+                             if n not in finished])
+            pred_done = 0.
+            t_start = time.time()
 
         # Start the round timer
         t0 = time.time()
         t_per_sim_list = []  # stores the measured times per simulation
 
-        # Loop over all simulations
-        for sim in self.simulations:
-            i = sim.number
+        # If the concurrent jobs per resource are limited, the submission of
+        # a simulation may need to wait for jobs of the current batch to
+        # finish. The IDs of these jobs are collected in `handled_ids`.
+        scheduler = self._resource_scheduler
+        handled_ids = set()
+
+        # Loop over all simulations in the order of submission
+        for i_order, i in enumerate(submission_order):
+            # Resubmit failed simulations whose backoff has expired
+            job_ids += self._submit_due_retries(ids_to_sim_number)
+
+            sim = self.simulations[i]
+
+            # Start the simulation if it is not already finished (or running
+            # since an interrupted run)
+            if not (sim.number in self.finished_sim_numbers or
+                    sim.number in self.excluded_sim_numbers or
+                    self._is_derived(sim.number) or
+                    sim.number in reattached):
+                # Select (and possibly wait for) the resource for the
+                # simulation
+                solve_kwargs = jcm_solve_kwargs
+                if scheduler is not None:
+                    nickname, memory = self._select_resource(
+                                sim, job_ids, ids_to_sim_number, handled_ids)
+                    solve_kwargs = dict(jcm_solve_kwargs)
+                    solve_kwargs['resource_ids'] = \
+                        scheduler.resources[nickname].resourceIDs
 
-            # Start the simulation if it is not already finished
-            if not sim.number in self.finished_sim_numbers:
                 # Compute the geometry if necessary
                 if sim.rerun_JCMgeo or force_geo_run:
                     self.compute_geometry(sim, **jcm_geo_kwargs)
+                    self._set_geometry_owner(sim)
                     force_geo_run = False
+                    self.hooks.trigger('on_geometry', self, sim)
                 
                 # Start to solve the simulation and receive a job ID
-                job_id = sim.solve(**jcm_solve_kwargs)
+                job_id = sim.solve(additional_keys=additional_keys,
+                                   **solve_kwargs)
+                if scheduler is not None:
+                    scheduler.assign(job_id, nickname, memory)
+                self.hooks.trigger('on_submit', self, sim)
                 self.logger.debug(
                     'Queued simulation {0} of {1} with job_id {2}'.
                     format(i + 1, self.num_sims, sim.job_id))
@@ -2482,24 +3900,31 @@ class SimulationSet(object):
                 # If the simulation was not finished (and processed), it was
                 # already in the HDF5 store and we set tits status to
                 # `Skipped`. 
-                if not sim.status in ['Finished', 'Finished and processed']:
+                if not (sim.status in ['Finished', 'Finished and processed']
+                        or sim.number in reattached):
                     sim.status = 'Skipped'
 
             # wait for N simulations to finish
             n_in_queue = len(job_ids)
             if n_in_queue != 0:
                 if (n_in_queue != 0 and
-                        (n_in_queue >= N or (i + 1) == self.num_sims)):
+                        (n_in_queue >= N or
+                         (i_order + 1) == len(submission_order))):
                     self.logger.info('Waiting for {} '.format(n_in_queue) +
                                      'simulation(s) to finish (' +
                                      '{} remaining in total).'.
                                      format(n_sims_todo))
-                    self._wait_for_simulations(job_ids, ids_to_sim_number)
+                    self._wait_for_simulations(
+                                [j for j in job_ids if not j in handled_ids],
+                                ids_to_sim_number)
+                    batch = list(ids_to_sim_number.values())
                     job_ids = []
                     ids_to_sim_number = {}
+                    handled_ids = set()
 
-                    # Update the global counters
-                    n_sims_todo -= n_in_queue
+                    # Update the global counters (retried simulations are
+                    # counted twice)
+                    n_sims_todo = max(n_sims_todo - n_in_queue, 0)
                     n_sims_done += n_in_queue
 
                     # Calculate the time that was needed for the
@@ -2513,8 +3938,16 @@ class SimulationSet(object):
                     t_per_sim_list.append(t / n_in_queue)
 
                     # Calculate and inform on the approx. remaining time based
-                    # on the mean of the `t_per_sim_list`
-                    t_remaining = n_sims_todo * np.mean(t_per_sim_list)
+                    # on the predicted costs or the mean of the
+                    # `t_per_sim_list`
+                    if predicted is not None:
+                        pred_batch = sum([predicted[n] for n in batch])
+                        pred_done += pred_batch
+                        pred_todo = max(pred_todo - pred_batch, 0.)
+                        t_remaining = pred_todo * (time.time() - t_start) / \
+                                      pred_done
+                    else:
+                        t_remaining = n_sims_todo * np.mean(t_per_sim_list)
                     if not self._progress_view.show:
                         if not t_remaining == 0.:
                             self.logger.info('Approx. remaining time: {}'.
@@ -2523,7 +3956,149 @@ class SimulationSet(object):
 
                     # Reset the round counter and timer
                     t0 = time.time()
+
+        # Retry the simulations which failed while the last batch was
+        # submitted
+        if len(self._retry_queue) > 0:
+            self._wait_for_simulations([], ids_to_sim_number)
     
+    def _recover_from_journal(self, job_ids, ids_to_sim_number):
+        """Treats the open submissions of an interrupted run which are
+        recorded in the submission journal. If the run was interrupted in
+        the current process, the daemon still knows the jobs: finished jobs
+        are handled directly and still running jobs are reattached, i.e. their
+        IDs are added to the list `job_ids` and the dict `ids_to_sim_number`.
+        Otherwise (i.e. after a crash of the driver process, whose daemon
+        jobs are lost), the results of finished jobs are harvested from
+        their working directories (see `_harvest_results`). All other
+        simulations are resubmitted as usual. Returns the set of the numbers of the
+        reattached simulations."""
+        reattached = set()
+        open_submissions = self._journal.get_open_submissions()
+        if len(open_submissions) == 0:
+            return reattached
+        if not NEW_DAEMON_DETECTED:
+            self.logger.info('Recovering jobs of an interrupted run is only ' +
+                             'supported with the new daemon interface.')
+            return reattached
+        n_harvested = 0
+        for number, record in open_submissions.items():
+            if number >= self.num_sims or number in self.finished_sim_numbers:
+                continue
+            sim = self.simulations[number]
+            if (record['hash'] != get_keys_hash(sim) or
+                    record['wdir'] != sim.working_dir()):
+                continue
+            result = None
+            if record['pid'] == os.getpid():
+                result = self._poll_job(record['job_id'])
+            if result is None:
+                result = self._harvest_results(sim)
+            if result is None:
+                continue
+            sim.job_id = record['job_id']
+            sim.keys['wdir'] = record['wdir']
+            if len(result) == 0:
+                job_ids.append(sim.job_id)
+                ids_to_sim_number[sim.job_id] = number
+                reattached.add(number)
+            else:
+                self._handle_job_result(sim, result)
+                n_harvested += 1
+        self.logger.info('Recovered {} finished and {} running '.format(
+                         n_harvested, len(reattached)) + 'simulation(s) ' +
+                         'of an interrupted run.')
+        return reattached
+
+    def _poll_job(self, job_id):
+        """Returns the result of the job with `job_id` as returned by
+        daemon.wait if it is finished, an empty dict if it is still running,
+        or None if the daemon does not know the job."""
+        wait_kwargs = {}
+        if hasattr(jcm, 'Resultbag'):
+            wait_kwargs['resultbag'] = self._resultbag
+        try:
+            with DAEMON_LOCK:
+                results, _ = daemon.wait([job_id], break_condition='any',
+                                         timeout=0., **wait_kwargs)
+        except Exception as e:
+            self.logger.debug('Unable to poll job {}: {}'.format(job_id, e))
+            return
+        return results.get(job_id, {})
+
+    def _harvest_results(self, sim):
+        """Loads the results of a finished job from the results folder (named
+        like the project file with the suffix '_results') in the working
+        directory of `sim` and returns them in the format of daemon.wait, or
+        None if the job did not finish or its results cannot be matched. The
+        computational costs are read from 'computational_costs.jcm'. The
+        results of the post processes are read from the files given by their
+        `OutputFileName` (see `_get_post_process_files`), so that they are in
+        the order of the post processes in the project file, as returned by
+        daemon.wait. Files which are not readable tables (e.g. exported field
+        bags) are returned as dicts with the key 'file'. Logs are not
+        available."""
+        project_name = os.path.splitext(self.project.project_file_name)[0]
+        results_dir = os.path.join(sim.working_dir(),
+                                   project_name + '_results')
+        ccosts_file = os.path.join(results_dir, 'computational_costs.jcm')
+        if not os.path.isfile(ccosts_file):
+            return
+        pp_files = self._get_post_process_files(sim)
+        if pp_files is None:
+            self.logger.debug('Unable to determine the post process result ' +
+                              'files of simulation {}.'.format(sim.number))
+            return
+        try:
+            ccosts = jcm.loadtable(file_name=ccosts_file)
+        except Exception as e:
+            self.logger.debug('Unable to load {}: {}'.format(ccosts_file, e))
+            return
+        results = [{'computational_costs': ccosts,
+                    'file': os.path.join(results_dir, 'fieldbag.jcm')}]
+        for file_ in pp_files:
+            if not os.path.isfile(file_):
+                self.logger.debug('Missing post process result {}.'.format(
+                                  file_))
+                return
+            try:
+                results.append(jcm.loadtable(file_name=file_))
+            except Exception:
+                results.append({'file': file_})
+        return {'logs': {'Log': {'Out': '', 'Error': ''}, 'ExitCode': 0},
+                'results': results, 'resource_id': 'unknown'}
+
+    def _get_post_process_files(self, sim):
+        """Returns the list of paths of the files written by the post
+        processes of `sim`, in the order of the post processes in the
+        project file, or None if they cannot be determined. The names are
+        read from the `OutputFileName` entries of the project file, which
+        is the processed copy in the working directory of `sim` if present.
+        Template placeholders of the form '%(key)...' are filled using the
+        keys of `sim`."""
+        project_file = self.project.get_project_file_path()
+        processed = os.path.join(sim.working_dir(), os.path.splitext(
+                        self.project.project_file_name)[0] + '.jcmp')
+        if os.path.isfile(processed):
+            project_file = processed
+        try:
+            content = utils.file_content(project_file)
+        except (IOError, OSError):
+            return
+        content = re.sub(r'#[^\n]*', '', content)  # remove comments
+        files = []
+        for name in re.findall(r'OutputFileName\s*=\s*"([^"]*)"', content):
+            if '%(' in name:
+                try:
+                    name = name % sim.keys
+                except (KeyError, TypeError, ValueError):
+                    return
+            if '<?' in name or '?>' in name:
+                return
+            files.append(os.path.normpath(os.path.join(sim.working_dir(),
+                                                       name)))
+        return files
+
     def _wait_for_simulations(self, ids_to_wait_for, ids_to_sim_number):
         """Waits for the job ids in the list `ids_to_wait_for` to finish using
         daemon.wait by passing to `_wait_for_simulations_new` or 
@@ -2531,7 +4106,9 @@ class SimulationSet(object):
         daemon interface was detected on the system.
         Failed simulations are appended to the list
         `self.failed_simulations`, while successful simulations are
-        processed and stored.
+        processed and stored. Failed simulations which may be retried
+        according to the `RetryPolicy` are resubmitted as soon as their
+        backoff delay has expired and are waited for as well.
         
         Parameters
         ----------
@@ -2556,67 +4133,486 @@ class SimulationSet(object):
         # Wait for all simulations using daemon.wait with
         # break_condition='any'. In each loop, the results are directly
         # processed and saved
-        nFinished = 0
-        nTotal = len(ids_to_wait_for)
+        ids_to_wait_for = list(ids_to_wait_for)
         self.logger.debug('Waiting for job_ids: {}'.format(ids_to_wait_for))
-        while nFinished < nTotal:
-            # wait until any of the simulations is finished
-            if hasattr(jcm, 'Resultbag'):
-                results, result_logs = daemon.wait(ids_to_wait_for, break_condition='any',
-                                      resultbag=self._resultbag)
-            else:
-                results, result_logs = daemon.wait(ids_to_wait_for, break_condition='any')
-
-            # Get lists for the IDs of the finished jobs and the corresponding
-            # simulation numbers
-            finished_ids = list(results.keys())
-            
-            for id_ in finished_ids:
-                sim_number = ids_to_sim_number[id_]
-                sim = self.simulations[sim_number]
-                # Add the computed results to the Simulation-instance, ...
-                sim._set_jcm_results_and_logs(results[id_])
-                # Check whether the simulation failed
-                if sim.status == 'Failed':
-                    if not sim in self.failed_simulations:
-                        self.failed_simulations.append(sim)
-                else:
-                    if sim in self.failed_simulations:
-                        self.failed_simulations.remove(sim)
-                    self.finished_sim_numbers.append(sim.number)
-                    # process them, ...
-                    sim.process_results(self.processing_func)
-                    # and append them to the HDF5 store
-                    try:
-                        self.append_store(sim._get_DataFrame())
-                        if self.minimize_memory_usage:
-                            # Delete jcm_results and logs attributes on sim
-                            sim.forget_jcm_results_and_logs()
-                        self._progress_view.set_pbar_state(add_to_value=1)
-                    except ValueError:
-                        self.logger.exception('A critical problem occured ' +
-                                'when trying to append the data to the HDF5 ' +
-                                'store. The data that should have been '+
-                                'appended has the following columns: {}. '.
-                                format(sim._get_DataFrame().columns))
-                        self.finished_sim_numbers.remove(sim.number)
-                        self.failed_simulations.append(sim)
-
-                # Remove/zip all working directories of the finished 
-                # simulations if wdir_mode is 'zip'/'delete'
-                if self._wdir_mode in ['zip', 'delete']:
-                    # Zip the working_dir if the simulation did not fail
-                    if (self._wdir_mode == 'zip' and
-                            sim not in self.failed_simulations):
-                        utils.append_dir_to_zip(sim.working_dir(),
-                                                self._zip_file_path)
-                    sim.remove_working_directory()
+        while True:
+            # Resubmit failed simulations whose backoff has expired. If
+            # there is nothing else to wait for, wait for the backoff.
+            ids_to_wait_for += self._submit_due_retries(
+                                        ids_to_sim_number,
+                                        block=len(ids_to_wait_for) == 0)
+            if len(ids_to_wait_for) == 0:
+                break
+            finished_ids = self._wait_for_any_new(ids_to_wait_for,
+                                                  ids_to_sim_number)
 
-            # Update the number of finished jobs and the list with ids_to_wait_for
-            nFinished += len(finished_ids)
+            # Update the list with ids_to_wait_for
             ids_to_wait_for = [id_ for id_ in ids_to_wait_for
                                if id_ not in finished_ids]
 
+    def _wait_for_any_new(self, ids_to_wait_for, ids_to_sim_number):
+        """Waits until any of the job IDs in `ids_to_wait_for` is finished
+        using daemon.wait and the *new* daemon interface, handles the
+        results of the finished jobs (see `_handle_job_result`) and returns
+        the list of their IDs."""
+        # If stragglers are handled, the speculative duplicates are waited for
+        # as well and the waiting is interrupted regularly
+        policy = self._straggler_policy
+        wait_kwargs = {}
+        original_ids = list(ids_to_wait_for)
+        if policy is not None:
+            ids_to_wait_for = self._get_speculative_wait_ids(ids_to_wait_for)
+            wait_kwargs['timeout'] = policy.poll_interval
+
+        # The waiting is also interrupted when the backoff of a failed
+        # simulation expires
+        now = utils.monotonic()
+        pending = [r[0] - now for r in self._retry_queue if r[0] > now]
+        if len(pending) > 0:
+            wait_kwargs['timeout'] = min(wait_kwargs.get('timeout', np.inf),
+                                         min(pending))
+
+        timeout = get_wait_timeout(wait_kwargs.get('timeout', None))
+        if timeout is not None:
+            wait_kwargs['timeout'] = timeout
+
+        # wait until any of the simulations is finished
+        with DAEMON_LOCK:
+            if hasattr(jcm, 'Resultbag'):
+                results, result_logs = daemon.wait(ids_to_wait_for,
+                                                   break_condition='any',
+                                                   resultbag=self._resultbag,
+                                                   **wait_kwargs)
+            else:
+                results, result_logs = daemon.wait(ids_to_wait_for,
+                                                   break_condition='any',
+                                                   **wait_kwargs)
+
+        # Get lists for the IDs of the finished jobs and the corresponding
+        # simulation numbers
+        finished_ids = []
+        for id_ in list(results.keys()):
+            if self._resource_scheduler is not None:
+                self._resource_scheduler.release(id_)
+            if policy is not None:
+                orig_id, use_result = self._resolve_speculative(id_,
+                                                                results[id_])
+                if not use_result:
+                    continue
+            else:
+                orig_id = id_
+            sim = self.simulations[ids_to_sim_number[orig_id]]
+            self._handle_job_result(sim, results[id_])
+            if policy is not None and sim.status != 'Failed' and \
+                    not getattr(sim, '_speculative_result', False):
+                self._record_runtime(sim)
+            finished_ids.append(orig_id)
+        if policy is not None:
+            finished_ids += self._check_stragglers(
+                                    [i for i in original_ids
+                                     if not i in finished_ids],
+                                    ids_to_sim_number)
+        return finished_ids
+
+    def _get_speculative_wait_ids(self, ids_to_wait_for):
+        """Returns the job IDs to wait for, i.e. the `ids_to_wait_for` in
+        which the IDs of jobs with a speculative duplicate are replaced by
+        the IDs of the jobs of this pair which are still running."""
+        wait_ids = []
+        for id_ in ids_to_wait_for:
+            if id_ in self._speculative_pairs:
+                wait_ids += sorted(self._speculative_pairs[id_]['running'])
+            else:
+                wait_ids.append(id_)
+        return wait_ids
+
+    def _resolve_speculative(self, job_id, result):
+        """Treats the `result` of the job with `job_id` if it belongs to a
+        pair of a straggler and its speculative duplicate. Returns the ID of
+        the original job and whether the result should be used. The first
+        successful job of a pair wins and the other one is cancelled. A
+        failed job only wins if the other job also failed."""
+        orig_id = self._speculative_origins.get(job_id, job_id)
+        if not orig_id in self._speculative_pairs:
+            return job_id, True
+        pair = self._speculative_pairs[orig_id]
+        pair['running'].discard(job_id)
+        failed = result['logs']['ExitCode'] != 0
+        if failed and len(pair['running']) > 0:
+            self.logger.debug('Job {} failed, waiting for the '.format(job_id)
+                              + 'other job of the speculative pair.')
+            return orig_id, False
+
+        # This job wins: cancel the other one and remove its working
+        # directory
+        sim = pair['simulation']
+        speculative_won = job_id != orig_id
+        for other_id in pair['running']:
+            if self._resource_scheduler is not None:
+                self._resource_scheduler.release(other_id)
+            cancelled = self._cancel_job(other_id)
+            wdir = sim.working_dir()
+            if not speculative_won:
+                wdir += SPECULATIVE_WDIR_SUFFIX
+            if cancelled:
+                rmtree(wdir, ignore_errors=True)
+            else:
+                self._speculative_leftovers.append(wdir)
+        sim._speculative_result = speculative_won
+        self.logger.info('Simulation {}: the {} job finished first.'.format(
+                         sim.number,
+                         'speculative' if speculative_won else 'original'))
+        del self._speculative_pairs[orig_id]
+        self._speculative_origins.pop(pair['speculative_id'], None)
+        return orig_id, True
+
+    def _cancel_job(self, job_id):
+        """Tries to cancel the job with `job_id` and returns whether this was
+        successful. Not all daemon interfaces support this. If cancelling is
+        not possible, the job keeps running and its result is ignored."""
+        cancel = getattr(daemon, 'cancel', None)
+        if cancel is None:
+            return False
+        try:
+            with DAEMON_LOCK:
+                cancel([job_id])
+            return True
+        except Exception as e:
+            self.logger.debug('Unable to cancel job {}: {}'.format(job_id, e))
+            return False
+
+    def _get_predicted_cost(self, sim):
+        """Returns the predicted cost of `sim` (NaN if unknown)."""
+        predicted = getattr(self, '_predicted_costs', None)
+        if predicted is None:
+            return np.nan
+        return predicted.get(sim.number, np.nan)
+
+    def _record_runtime(self, sim):
+        """Records the runtime of the finished `sim` for the straggler
+        detection."""
+        ts = sim.timestamps
+        if not ('submitted' in ts and 'finished' in ts):
+            return
+        self._straggler_policy.record(sim.keys,
+                                      ts['finished'] - ts['submitted'],
+                                      self._get_predicted_cost(sim))
+
+    def _check_stragglers(self, running_ids, ids_to_sim_number):
+        """Checks the jobs with IDs in `running_ids` for stragglers using the
+        `StragglerPolicy` and submits speculative duplicates for them if a
+        resource is free. Jobs which exceeded the timeout of the policy are
+        cancelled and their simulations are treated as failed. Returns the
+        list of IDs of the timed out jobs."""
+        policy = self._straggler_policy
+        scheduler = self._resource_scheduler
+        now = utils.monotonic()
+        timed_out = []
+        for job_id in running_ids:
+            sim = self.simulations[ids_to_sim_number[job_id]]
+            if not 'submitted' in sim.timestamps:
+                continue
+            runtime = now - sim.timestamps['submitted']
+            if policy.is_timed_out(runtime):
+                timed_out.append(job_id)
+                continue
+            if not policy.may_speculate() or \
+                    job_id in self._speculative_pairs or \
+                    getattr(sim, '_speculated', False):
+                continue
+            expected = policy.get_expected_runtime(
+                                    sim.keys, self._get_predicted_cost(sim))
+            if not policy.is_straggler(runtime, expected):
+                continue
+
+            # Prefer a resource other than the one of the straggler
+            memory = self._get_predicted_memory(sim)
+            current = scheduler._jobs.get(job_id, (None, None))[0]
+            others = [n for n in scheduler.resources if n != current]
+            nickname = None
+            if len(others) > 0:
+                nickname = scheduler.select_resource(memory, others)
+            if nickname is None and len(others) == 0:
+                nickname = scheduler.select_resource(memory)
+            if nickname is None:
+                # Warn only once per simulation, as this is checked on
+                # every poll
+                if not getattr(sim, '_straggler_warned', False):
+                    sim._straggler_warned = True
+                    self.logger.warn('Simulation {} is a straggler '.format(
+                                     sim.number) + '(running for {} '.format(
+                                     utils.tForm(runtime)) +
+                                     'instead of {}), '.format(
+                                     utils.tForm(expected)) + 'but no idle ' +
+                                     'resource is available for a ' +
+                                     'speculative duplicate. Set the ' +
+                                     '`timeout` of the StragglerPolicy to ' +
+                                     'stop waiting for hanging jobs.')
+                continue
+            self.logger.info('Simulation {} is a straggler '.format(
+                             sim.number) + '(running for {} '.format(
+                             utils.tForm(runtime)) + 'instead of {}). '.format(
+                             utils.tForm(expected)) + 'Submitting a ' +
+                             'speculative duplicate to {}.'.format(nickname))
+            self._submit_speculative(sim, job_id, nickname, memory,
+                                     ids_to_sim_number)
+        for job_id in timed_out:
+            self._time_out_job(job_id, ids_to_sim_number)
+        return timed_out
+
+    def _time_out_job(self, job_id, ids_to_sim_number):
+        """Cancels the job with `job_id` and its speculative duplicate (if
+        any) after the timeout of the `StragglerPolicy` and treats its
+        simulation as failed, so that it is retried according to the
+        `RetryPolicy`."""
+        sim = self.simulations[ids_to_sim_number[job_id]]
+        scheduler = self._resource_scheduler
+        running = [job_id]
+        pair = self._speculative_pairs.pop(job_id, None)
+        if pair is not None:
+            running = sorted(pair['running'])
+            self._speculative_origins.pop(pair['speculative_id'], None)
+        resource_id = 'unknown'
+        nickname = scheduler._jobs.get(job_id, (None, None))[0]
+        if nickname is not None and \
+                scheduler.resources[nickname].resourceIDs:
+            resource_id = scheduler.resources[nickname].resourceIDs[0]
+        for id_ in running:
+            scheduler.release(id_)
+            if not self._cancel_job(id_):
+                self.logger.warn('Unable to cancel the timed out job ' +
+                                 '{}. It keeps running, but its '.format(id_) +
+                                 'result is ignored.')
+        self.logger.warn('Simulation {} timed out after {}.'.format(
+                         sim.number,
+                         utils.tForm(self._straggler_policy.timeout)))
+        message = 'Cancelled after the timeout of the StragglerPolicy.'
+        self._handle_job_result(sim, {'logs': {'Log': {'Out': '',
+                                                       'Error': message},
+                                               'ExitCode': -1},
+                                      'results': [],
+                                      'resource_id': resource_id})
+
+    def _submit_speculative(self, sim, job_id, nickname, memory,
+                            ids_to_sim_number):
+        """Submits a speculative duplicate of the simulation `sim` with the
+        original `job_id` to the resource with `nickname`."""
+        scheduler = self._resource_scheduler
+
+        # The duplicate must use the geometry of `sim`, which may have been
+        # overwritten by a later geometry group in the meantime
+        restore = self._prepare_geometry(sim)
+        wdir = sim.working_dir() + SPECULATIVE_WDIR_SUFFIX
+        if not os.path.exists(wdir):
+            os.makedirs(wdir)
+        keys = dict(sim.keys)
+        for key, value in (self._additional_keys or {}).items():
+            keys.setdefault(key, value)
+        keys['wdir'] = wdir
+        solve_kwargs = dict(self._jcm_solve_kwargs)
+        if not hasattr(jcm, 'Resultbag') and 'resultbag' in solve_kwargs:
+            del solve_kwargs['resultbag']
+        solve_kwargs['resource_ids'] = scheduler.resources[nickname].resourceIDs
+        with DAEMON_LOCK:
+            spec_id = jcm.solve(self.project.get_project_file_path(),
+                                keys=keys, working_dir=wdir, mode='solve',
+                                **solve_kwargs)
+        self._restore_geometry(restore)
+
+        scheduler.assign(spec_id, nickname, memory)
+        self._straggler_policy.n_speculative += 1
+        sim._speculated = True
+        self._speculative_pairs[job_id] = {'simulation': sim,
+                                           'speculative_id': spec_id,
+                                           'running': set([job_id, spec_id])}
+        self._speculative_origins[spec_id] = job_id
+
+    def _set_geometry_owner(self, sim):
+        """Records that the geometry in the project working directory was
+        computed for `sim`."""
+        self._geometry_owner.update(simuset=self, number=sim.number)
+
+    def _has_geometry(self, sim):
+        """Returns whether the geometry in the project working directory
+        currently belongs to the geometry group of `sim`."""
+        owner = self._geometry_owner
+        return (owner['simuset'] is self and
+                self._geometry_group_ids.get(owner['number']) ==
+                self._geometry_group_ids.get(sim.number))
+
+    def _prepare_geometry(self, sim):
+        """Computes the geometry of `sim` if the geometry in the project
+        directory currently belongs to another geometry group, e.g. before a
+        resubmission. Returns the `SimulationSet` and the number of the
+        simulation the geometry of which must be restored afterwards using
+        `_restore_geometry` (None if the geometry was not changed)."""
+        owner = self._geometry_owner
+        if owner['simuset'] is None or self._has_geometry(sim):
+            return
+        restore = (owner['simuset'], owner['number'])
+        sim.compute_geometry(**self._jcm_geo_kwargs)
+        self._set_geometry_owner(sim)
+        return restore
+
+    def _restore_geometry(self, restore):
+        """Recomputes the geometry which was replaced by
+        `_prepare_geometry`."""
+        if restore is None:
+            return
+        simuset, number = restore
+        sim = simuset.simulations[number]
+        sim.compute_geometry(**simuset._jcm_geo_kwargs)
+        simuset._set_geometry_owner(sim)
+
+    def _get_resource_nickname(self, resource_id):
+        """Returns the nickname of the current resource which was added to
+        the daemon with the `resource_id`, or None if it is unknown."""
+        for nickname, resource in self.get_current_resources().items():
+            if (resource.resourceIDs is not None and
+                    resource_id in resource.resourceIDs):
+                return nickname
+
+    def _schedule_retry(self, sim):
+        """Pushes the failed simulation `sim` onto the retry queue if the
+        `RetryPolicy` allows another retry."""
+        policy = self._retry_policy
+        if policy is None or not policy.may_retry(sim.number):
+            return
+        delay = policy.get_delay(sim.number)
+        policy.record(sim.number)
+        exclude = None
+        if policy.different_resource:
+            exclude = self._get_resource_nickname(
+                                        getattr(sim, 'resource_id', None))
+        self._retry_queue.append((utils.monotonic() + delay, sim.number,
+                                  exclude))
+        self.logger.info('Simulation {} failed. Retry {}/{} in {}.'.format(
+                         sim.number, policy.get_n_retries(sim.number),
+                         policy.max_retries, utils.tForm(delay)))
+
+    def _submit_due_retries(self, ids_to_sim_number, block=False):
+        """Resubmits the simulations of the retry queue the backoff delay of
+        which has expired and returns the list of their job IDs. The
+        `ids_to_sim_number` dict is updated. If `block` is True, this waits
+        for the earliest backoff delay and submits at least one simulation.
+        Simulations for which no resource is free stay in the queue."""
+        queue = self._retry_queue
+        if len(queue) == 0:
+            return []
+        if block:
+            delay = min(queue)[0] - utils.monotonic()
+            if delay > 0.:
+                time.sleep(delay)
+        now = utils.monotonic()
+        job_ids = []
+        for entry in sorted([r for r in queue if r[0] <= now]):
+            _, number, exclude = entry
+            sim = self.simulations[number]
+            job_id = self._submit_retry(sim, exclude,
+                                        force=block and len(job_ids) == 0)
+            if job_id is None:
+                continue
+            queue.remove(entry)
+            ids_to_sim_number[job_id] = number
+            job_ids.append(job_id)
+        return job_ids
+
+    def _submit_retry(self, sim, exclude=None, force=False):
+        """Resubmits the failed simulation `sim`, if possible to a resource
+        other than the one with nickname `exclude`. Returns the job ID, or
+        None if the `ResourceScheduler` has no free resource for it (unless
+        `force` is True)."""
+        scheduler = self._resource_scheduler
+        resources = self.get_current_resources()
+        others = None
+        if exclude is not None:
+            others = [n for n in resources if n != exclude and
+                      resources[n].resourceIDs is not None]
+            if len(others) == 0:
+                others = None
+
+        solve_kwargs = dict(self._jcm_solve_kwargs)
+        memory = self._get_predicted_memory(sim)
+        nickname = None
+        if scheduler is not None:
+            if (self._predicted_memory is not None or
+                    self._straggler_policy is not None):
+                nickname = scheduler.select_resource(memory, others)
+                if nickname is None and force:
+                    nickname = scheduler.get_least_loaded()
+            else:
+                nickname = scheduler.get_least_loaded(others)
+            if nickname is None:
+                return
+            solve_kwargs['resource_ids'] = \
+                scheduler.resources[nickname].resourceIDs
+        elif others is not None and NEW_DAEMON_DETECTED:
+            solve_kwargs['resource_ids'] = [
+                id_ for n in others for id_ in resources[n].resourceIDs]
+
+        self.logger.info('Rerunning failed simulation {}'.format(sim.number)
+                         + (' on {}.'.format(nickname) if nickname else '.'))
+        restore = self._prepare_geometry(sim)
+        job_id = sim.solve(additional_keys=self._additional_keys,
+                           **solve_kwargs)
+        self._restore_geometry(restore)
+        if scheduler is not None:
+            scheduler.assign(job_id, nickname, memory)
+        self.hooks.trigger('on_submit', self, sim)
+        return job_id
+
+    def _handle_job_result(self, sim, result):
+        """Sets the `result` returned by daemon.wait (new interface) on the
+        Simulation `sim`, processes and stores it if the simulation
+        succeeded and treats its working directory according to the
+        `wdir_mode`."""
+        # Add the computed results to the Simulation-instance, ...
+        sim._set_jcm_results_and_logs(result)
+        # Check whether the simulation failed
+        if sim.status == 'Failed':
+            if not sim in self.failed_simulations:
+                self.failed_simulations.append(sim)
+            self.hooks.trigger('on_failed', self, sim)
+            self._schedule_retry(sim)
+        else:
+            if sim in self.failed_simulations:
+                self.failed_simulations.remove(sim)
+            self.finished_sim_numbers.append(sim.number)
+            self.hooks.trigger('on_finish', self, sim)
+            # process them, ...
+            sim.record_time('processing_start')
+            sim.process_results(self.processing_func)
+            sim.record_time('processing_end')
+            self.hooks.trigger('on_processed', self, sim)
+            # and append them to the HDF5 store
+            try:
+                self._append_simulation_to_store(sim)
+                self.hooks.trigger('on_stored', self, sim)
+                if self.minimize_memory_usage:
+                    # Delete jcm_results and logs attributes on sim
+                    sim.forget_jcm_results_and_logs()
+                self._progress_view.set_pbar_state(add_to_value=1)
+            except ValueError:
+                self.logger.exception('A critical problem occured ' +
+                        'when trying to append the data to the HDF5 ' +
+                        'store. The data that should have been '+
+                        'appended has the following columns: {}. '.
+                        format(sim._get_DataFrame().columns))
+                self.finished_sim_numbers.remove(sim.number)
+                self.failed_simulations.append(sim)
+
+        # Remove/zip all working directories of the finished 
+        # simulations if wdir_mode is 'zip'/'delete'
+        if self._wdir_mode in ['zip', 'delete']:
+            sim.record_time('cleanup_start')
+            # Zip the working_dir if the simulation did not fail
+            if (self._wdir_mode == 'zip' and
+                    sim not in self.failed_simulations):
+                utils.append_dir_to_zip(sim.working_dir(),
+                                        self._zip_file_path)
+            sim.remove_working_directory()
+            sim.record_time('cleanup_end')
+
     def _wait_for_simulations_old(self, ids_to_wait_for, ids_to_sim_number):
         """Waits for the job IDS in the list `ids_to_wait_for` to finish using
         daemon.wait and the *old* daemon interface.
@@ -2625,14 +4621,20 @@ class SimulationSet(object):
         # Wait for all simulations using daemon.wait with
         # break_condition='any'. In each loop, the results are directly
         # processed and saved
-        nFinished = 0
-        nTotal = len(ids_to_wait_for)
+        ids_to_wait_for = list(ids_to_wait_for)
         self.logger.debug('Waiting for job_ids: {}'.format(ids_to_wait_for))
-        while nFinished < nTotal:
+        while True:
+            # Resubmit failed simulations whose backoff has expired
+            ids_to_wait_for += self._submit_due_retries(
+                                        ids_to_sim_number,
+                                        block=len(ids_to_wait_for) == 0)
+            if len(ids_to_wait_for) == 0:
+                break
+
             # wait until any of the simulations is finished
             # deepcopy is needed to protect ids_to_wait_for from being modified
             # by the old daemon.wait implementation
-            with utils.Capturing() as output:
+            with utils.Capturing() as output, DAEMON_LOCK:
                 if not hasattr(jcm, 'Resultbag'):
                     indices, thisResults, logs = daemon.wait(
                                                     deepcopy(ids_to_wait_for),
@@ -2660,12 +4662,22 @@ class SimulationSet(object):
                 sim._set_jcm_results_and_logs(thisResults[ind], logs[ind])
                 # Check whether the simulation failed
                 if sim.status == 'Failed':
-                    self.failed_simulations.append(sim)
+                    if not sim in self.failed_simulations:
+                        self.failed_simulations.append(sim)
+                    self.hooks.trigger('on_failed', self, sim)
+                    self._schedule_retry(sim)
                 else:
+                    if sim in self.failed_simulations:
+                        self.failed_simulations.remove(sim)
+                    self.hooks.trigger('on_finish', self, sim)
                     # process them, ...
+                    sim.record_time('processing_start')
                     sim.process_results(self.processing_func)
+                    sim.record_time('processing_end')
+                    self.hooks.trigger('on_processed', self, sim)
                     # and append them to the HDF5 store
-                    self.append_store(sim._get_DataFrame())
+                    self._append_simulation_to_store(sim)
+                    self.hooks.trigger('on_stored', self, sim)
                     if self.minimize_memory_usage:
                         # Delete jcm_results and logs attributes on sim
                         sim.forget_jcm_results_and_logs()
@@ -2676,16 +4688,16 @@ class SimulationSet(object):
             if self._wdir_mode in ['zip', 'delete']:
                 for n in finishedSimNumbers:
                     sim = self.simulations[n]
+                    sim.record_time('cleanup_start')
                     # Zip the working_dir if the simulation did not fail
                     if (self._wdir_mode == 'zip' and
                             sim not in self.failed_simulations):
                         utils.append_dir_to_zip(sim.working_dir(),
                                                 self._zip_file_path)
                     sim.remove_working_directory()
+                    sim.record_time('cleanup_end')
 
-            # Update the number of finished jobs and the list with 
-            # ids_to_wait_for
-            nFinished += len(indices)
+            # Update the list with ids_to_wait_for
             ids_to_wait_for = [ID_ for ID_ in ids_to_wait_for 
                                if ID_ not in finishedIDs]
 
@@ -2703,7 +4715,15 @@ class SimulationSet(object):
             return
         if not hasattr(self, 'finished_sim_numbers'):
             return self.num_sims
-        return self.num_sims - len(self.finished_sim_numbers)
+        return (self.num_sims - len(self.finished_sim_numbers) -
+                len(self._get_skipped_sim_numbers()))
+
+    def _get_skipped_sim_numbers(self):
+        """Returns the set of the numbers of the unfinished simulations which
+        are not solved, i.e. which are excluded or whose results are derived
+        from other simulations (duplicates and symmetric simulations)."""
+        return (set(self.excluded_sim_numbers) | set(self._duplicate_of) |
+                set(self._symmetric_of)) - set(self.finished_sim_numbers)
 
     def all_done(self):
         """Checks if all simulations are done, i.e. already in the HDF5
@@ -2720,7 +4740,9 @@ class SimulationSet(object):
             run_post_process_files=None, additional_keys=None,
             wdir_mode='keep', zip_file_path=None, show_progress_bar=False,
             jcm_geo_kwargs=None, jcm_solve_kwargs=None, 
-            pass_ccosts_to_processing_func=False):
+            pass_ccosts_to_processing_func=False, store_timings=False,
+            memory_per_sim='auto', geometry_affinity=False,
+            straggler_policy=None, retry_policy=None, journal=True):
         """Convenient function to add the resources, run all necessary
         simulations and save the results to the HDF5 store.
         Parameters
@@ -2736,11 +4758,14 @@ class SimulationSet(object):
             simulations are pushed to the daemon, the number of files and the
             size on disk can grow dramatically. This can be avoided by using
             this parameter, while deleting or zipping the working directories
-            at the same time using the `wdir_mode` parameter.
+            at the same time using the `wdir_mode` parameter. Note that `N`
+            is a batch size: the next batch is submitted when all jobs of the
+            current batch are finished (unlike in `SimulationSetGroup.run`,
+            where `N` is a sliding window).
         auto_rerun_failed : int or bool, default 1
             Controls whether/how often a simulation which failed is
             automatically rerun. If False or 0, no automatic rerunning
-            will be done.
+            will be done. Ignored if a `retry_policy` is given.
         run_post_process_files : str, list or NoneType, default None
             File path or list of file paths to post processing files (extension
             .jcmp(t)) which should be executed subsequent to the actual solve.
@@ -2771,17 +4796,126 @@ class SimulationSet(object):
         pass_ccosts_to_processing_func : bool, default False
             Whether to pass the computational costs as the 0th list element
             to the processing_func.
+        store_timings : bool, default False
+            Whether to store the lifecycle timings of each simulation (i.e.
+            geometry computation, submission, completion, processing and store
+            write) as additional `t_*`-columns in the HDF5 store. The values
+            are given in seconds relative to the start of the run. As the
+            table structure of the store cannot change, this setting is
+            ignored if the store already contains data and the columns do not
+            match. The timings are always available in-memory, see
+            `get_timing_report`.
+        memory_per_sim : float, callable, 'auto' or NoneType, default 'auto'
+            The predicted peak memory in GB of the simulations, which is used
+            to limit the number of concurrent jobs on resources for which a
+            `memory_GB` is configured (see `predict_memory`). If 'auto', it is
+            predicted from the computational costs in the HDF5 store. A
+            callable is called with the `keys` of each simulation. If None or
+            if no resource has a memory limit, the jobs are distributed by
+            the daemon as usual.
+        geometry_affinity : bool or int, default False
+            Whether to pin the simulations of identical geometry to the same
+            resource, so that the mesh and project files are transferred to
+            fewer hosts. Each geometry group is split into contiguous slices
+            of up to `geometry_affinity` simulations (if an int is given) or
+            of the number of remaining simulations divided by the total
+            multiplicity of the resources (if True), and each slice is
+            assigned to the least loaded resource. Requires the new daemon
+            interface.
+        straggler_policy : StragglerPolicy, bool or NoneType, default None
+            If given (or True for the default `StragglerPolicy`), jobs which
+            run much longer than expected get a speculative duplicate on an
+            idle resource. The result of the job which finishes first is used
+            and the other one is cancelled (if supported by the daemon,
+            otherwise it is ignored). If the duplicate wins, the working
+            directory of the simulation gets the suffix '_speculative'. The
+            number of concurrent jobs per resource is limited to its
+            multiplicity in this case. Requires the new daemon interface.
+        retry_policy : RetryPolicy or NoneType, default None
+            Controls the retrying of failed simulations, i.e. the number of
+            retries per simulation, the backoff delay and whether to retry
+            on another resource. Failed simulations are resubmitted as soon
+            as their backoff delay has expired, interleaved with the
+            remaining simulations. If None, a `RetryPolicy` with
+            `max_retries=auto_rerun_failed` is used.
+        journal : bool, default True
+            Whether to record the submissions and completions in a
+            `SubmissionJournal` in the storage directory. If the run is
+            interrupted, e.g. because the python process dies, the next run
+            harvests the results of jobs which finished in the meantime from
+            their working directories instead of recomputing them. Jobs which
+            are still running can only be reattached if the run was
+            interrupted in the same python process (e.g. by a
+            KeyboardInterrupt), as the daemon of a crashed process is gone.
+            After a crash, these simulations are resubmitted. The journal is
+            removed at the end of a complete run. Recovering requires the new
+            daemon interface.
         """
+        if not self._prepare_run(
+                auto_rerun_failed=auto_rerun_failed,
+                run_post_process_files=run_post_process_files,
+                wdir_mode=wdir_mode, zip_file_path=zip_file_path,
+                show_progress_bar=show_progress_bar,
+                pass_ccosts_to_processing_func=pass_ccosts_to_processing_func,
+                store_timings=store_timings, memory_per_sim=memory_per_sim,
+                geometry_affinity=geometry_affinity,
+                straggler_policy=straggler_policy, retry_policy=retry_policy,
+                journal=journal):
+            return
+        try:
+            self._start_simulations(N=N, processing_func=processing_func,
+                                    additional_keys=additional_keys,
+                                    jcm_geo_kwargs=jcm_geo_kwargs,
+                                    jcm_solve_kwargs=jcm_solve_kwargs)
+            self._finish_run()
+        finally:
+            # Hooks like the `ProfilerHook` are also stopped if the run raised
+            self._end_run()
+
+    def run_async(self, poll_interval=1., **kwargs):
+        """Coroutine version of `run` for use with asyncio (Python 3.6 or
+        higher), i.e. `await simuset.run_async(...)`. The daemon is polled
+        every `poll_interval` seconds without blocking the event loop, so
+        that one event loop can drive several sets. The geometry computation,
+        result processing and store writes are still executed in the thread
+        of the event loop. The `kwargs` are passed as in
+        `SimulationSetGroup.run`, i.e. the scheduler related arguments of
+        `run` (`memory_per_sim`, `geometry_affinity`, `straggler_policy`)
+        are not supported. Requires the new daemon interface."""
+        return _import_asynchronous().run_async(self, poll_interval, **kwargs)
+
+    def iter_results(self, poll_interval=1., **kwargs):
+        """Runs the set like `run_async` and returns an asynchronous iterator
+        over the simulations, i.e. `async for sim in
+        simuset.iter_results(...)`. A simulation is yielded as soon as it is
+        finished and stored, or failed without a retry left."""
+        return _import_asynchronous().iter_results(self, poll_interval,
+                                                   **kwargs)
+
+    def _prepare_run(self, auto_rerun_failed=1, run_post_process_files=None,
+                     wdir_mode='keep', zip_file_path=None,
+                     show_progress_bar=False,
+                     pass_ccosts_to_processing_func=False,
+                     store_timings=False, memory_per_sim='auto',
+                     geometry_affinity=False, straggler_policy=None,
+                     retry_policy=None, journal=True):
+        """Prepares a run, i.e. everything `run` does before the simulations
+        are started (see `run` for the arguments). Returns False if there is
+        nothing to run."""
         if self.all_done():
             # Set the status for all simulations to 'Skipped'
             for sim in self.simulations:
                 sim.status = 'Skipped'
             self.logger.info('Nothing to run: all simulations finished.')
-            return
+            return False
+        if self._is_scheduled() and self.num_sims_to_do() == 0:
+            self.logger.info('Nothing to run: all simulations finished ' +
+                             'or excluded.')
+            return False
 
         if not self._is_scheduled():
             self.logger.info('Please run `make_simulation_schedule` first.')
-            return
+            return False
 
         if zip_file_path is None:
             zip_file_path = os.path.join(self.storage_dir,
@@ -2794,11 +4928,6 @@ class SimulationSet(object):
             raise ValueError('Unknown wdir_mode: {}'.format(wdir_mode))
             return
         
-        if jcm_geo_kwargs is None:
-            jcm_geo_kwargs = {}
-        if jcm_solve_kwargs is None:
-            jcm_solve_kwargs = {}
-            
         # Set-up changed result-passing to the processing function
         if pass_ccosts_to_processing_func:
             for sim in self.simulations:
@@ -2807,9 +4936,27 @@ class SimulationSet(object):
         # Add class attributes for `_wait_for_simulations`
         self._wdir_mode = wdir_mode
         self._zip_file_path = zip_file_path
-
-        # Start the timer
-        t0 = time.time()
+        self._run_post_process_files = run_post_process_files
+
+        # Check if the timings can be stored, i.e. if the table structure in
+        # the store is compatible
+        has_timing_columns = self._store_has_timing_columns()
+        if has_timing_columns is not None and \
+                has_timing_columns != store_timings:
+            self.logger.warn('Ignoring `store_timings={}`, '.format(
+                                store_timings) + 'as the HDF5 store ' +
+                             'already contains data {} timing columns.'.format(
+                                'with' if has_timing_columns else 'without'))
+            store_timings = has_timing_columns
+        self._store_timings = store_timings
+
+        # Start the timer and reset the lifecycle timestamps
+        self._t0_run = time.time()
+        self._t_run_start = utils.monotonic()
+        for sim in self.simulations:
+            sim.timestamps = {}
+            sim._speculated = False
+            sim._straggler_warned = False
 
         # Store the metadata of this run
         self._store_metadata()
@@ -2823,6 +4970,11 @@ class SimulationSet(object):
         if not self._resources_ready():
             self.add_resources()
         
+        # Limit the concurrent jobs per resource if memory limits are set and
+        # pin geometry groups to resources if desired
+        self._set_up_resource_scheduler(memory_per_sim, geometry_affinity,
+                                        straggler_policy)
+        
         # Initialize the progress bar if necessary
         self._progress_view = JupyterProgressDisplay(
                                                 num_sims=self.num_sims,
@@ -2830,39 +4982,70 @@ class SimulationSet(object):
         if len(self.finished_sim_numbers) > 0:
             self._progress_view.set_pbar_state(
                                     add_to_value=len(self.finished_sim_numbers))
+        self.hooks.trigger('on_run_start', self)
+        self._run_end_pending = True
         
-        # Start the simulations until all simulations are finished or the
-        # maximum `auto_rerun_failed` is exceeded
-        n_trials = -1
-        while n_trials < auto_rerun_failed:
-            if n_trials > -1:
-                self.logger.info('Rerunning failed simulations: trial {}/{}'.
-                                 format(n_trials+1,int(auto_rerun_failed)))
-            self._start_simulations(N=N, processing_func=processing_func,
-                                    additional_keys=additional_keys,
-                                    jcm_geo_kwargs=jcm_geo_kwargs,
-                                    jcm_solve_kwargs=jcm_solve_kwargs)
-            n_trials += 1
-            if len(self.failed_simulations) == 0:
-                self._progress_view.set_pbar_state(description='Finished', 
-                                                   bar_style='success')
-                self._progress_view.set_timer_to_zero()
-                break
-            else:
-                self.logger.warn('The following simulations failed: {}'.format(
+        # Record the submissions in the journal. A journal which is still
+        # registered from an interrupted run in this process is replaced.
+        for hook in self.hooks.get_hooks():
+            if isinstance(hook, SubmissionJournal):
+                self.hooks.remove(hook)
+                hook.close()
+        self._journal = None
+        if journal:
+            self._journal = SubmissionJournal(os.path.join(self.storage_dir,
+                                                           JOURNAL_FILE_NAME))
+            self.hooks.add(self._journal)
+        
+        # Failed simulations are retried according to the `retry_policy`
+        # while the remaining ones are running
+        if retry_policy is None:
+            retry_policy = RetryPolicy(max_retries=int(auto_rerun_failed))
+        retry_policy.reset()
+        self._retry_policy = retry_policy
+        self._retry_queue = []
+        return True
+
+    def _finish_run(self):
+        """Cleans up after all simulations of a run were handled, i.e.
+        everything `run` does after the simulations are finished."""
+        if len(self.failed_simulations) == 0:
+            self._progress_view.set_pbar_state(description='Finished', 
+                                               bar_style='success')
+            self._progress_view.set_timer_to_zero()
+        else:
+            self.logger.warn('The following simulations failed: {}'.format(
                 [sim.number for sim in self.failed_simulations]))
-        if len(self.failed_simulations) != 0:
             self._progress_view.set_pbar_state(description='Failed', 
                                                bar_style='warning')
             self._progress_view.set_timer_to_zero()
         
+        # Remove the journal if no submissions of unfinished simulations are
+        # left open
+        if self._journal is not None:
+            self.hooks.remove(self._journal)
+            finished = set(self.finished_sim_numbers)
+            if all([n in finished
+                    for n in self._journal.get_open_submissions()]):
+                self._journal.remove()
+            else:
+                self._journal.close()
+            self._journal = None
+        
+        # Remove the working directories of speculative jobs which could not
+        # be cancelled
+        for dir_ in getattr(self, '_speculative_leftovers', []):
+            rmtree(dir_, ignore_errors=True)
+        self._speculative_leftovers = []
+        
         # Delete/zip working directories from previous runs if needed
+        wdir_mode = self._wdir_mode
         if wdir_mode in ['zip', 'delete'] and hasattr(self, '_wdirs_to_clean'):
             self.logger.info('Treating old working directories with mode: {}'.
                              format(wdir_mode))
             for dir_ in self._wdirs_to_clean:
                 if wdir_mode == 'zip':
-                    utils.append_dir_to_zip(dir_, zip_file_path)
+                    utils.append_dir_to_zip(dir_, self._zip_file_path)
                 if os.path.isdir(dir_):
                     rmtree(dir_)
 
@@ -2870,11 +5053,116 @@ class SimulationSet(object):
         self._copy_from_transitional_dir()
         
         # Restore the original project file if necessary
-        if run_post_process_files is not None:
+        if self._run_post_process_files is not None:
             self.project.restore_original_project_file()
         
+        self._resource_scheduler = None
+        self._straggler_policy = None
+        self._retry_policy = None
+        self._t_run_end = utils.monotonic()
         self.logger.info('Total time for all simulations: {}'.format(
-            utils.tForm(time.time() - t0)))
+            utils.tForm(time.time() - self._t0_run)))
+        report = self.get_timing_report()
+        if report is not None:
+            self.logger.debug('Timing report:\n{}'.format(report))
+        self._end_run()
+
+    def _end_run(self):
+        """Triggers the 'on_run_end'-hooks if they were not yet triggered
+        for the current run."""
+        if not self._run_end_pending:
+            return
+        self._run_end_pending = False
+        self.hooks.trigger('on_run_end', self)
+
+    def get_timings(self):
+        """Returns a DataFrame with the lifecycle timings of all simulations
+        that were solved in the last run, in seconds relative to the start of
+        the run. Returns None if `run` was not executed yet.
+        """
+        if not hasattr(self, '_t_run_start'):
+            self.logger.info('No timings available before `run` was ' +
+                             'executed.')
+            return
+        rows = {}
+        for sim in self.simulations:
+            if len(sim.timestamps) > 0:
+                rows[sim.number] = sim.get_timings(self._t_run_start)
+        columns = [TIMING_COLUMN_PREFIX + e for e in TIMING_EVENTS]
+        df = pd.DataFrame.from_dict(rows, orient='index')
+        df = df.reindex(columns=columns).sort_index()
+        df.index.name = 'number'
+        return df
+
+    def get_timing_report(self):
+        """Returns a summary of the wall time spent in the different phases of
+        the last run as a DataFrame, i.e. the total, mean and maximum duration
+        of each phase, its fraction of the wall time of the run and its
+        fraction of the summed lifetimes of all simulations.
+
+        The phases are the geometry computation, the submission of the jobs,
+        the waiting for the daemon (i.e. queueing and solving), the result
+        processing, the store writes and the cleanup of the working
+        directories. The 'solver' row contains the solver time as reported
+        by JCMsolve (TotalTime), and 'overhead' is the sum of the submission,
+        processing, store and cleanup phases, i.e. the time spent in pypmj
+        itself. Returns None if `run` was not executed yet.
+
+        The 'waiting' and 'solver' phases of different simulations overlap in
+        parallel runs, so that their `fraction_of_run` is NaN. All phases can
+        be compared using the `fraction_of_sim_time`, for which the totals
+        are divided by the sum of the lifetimes (first to last recorded
+        event) of the simulations.
+        """
+        timings = self.get_timings()
+        if timings is None:
+            return
+        p = TIMING_COLUMN_PREFIX
+        phases = collections.OrderedDict([
+            ('geometry', timings[p + 'geo_end'] - timings[p + 'geo_start']),
+            ('submission', timings[p + 'submitted'] - timings[p + 'submit']),
+            ('waiting', timings[p + 'finished'] - timings[p + 'submitted']),
+            ('processing', timings[p + 'processing_end'] -
+                           timings[p + 'processing_start']),
+            ('store', timings[p + 'store_end'] - timings[p + 'store_start']),
+            ('cleanup', timings[p + 'cleanup_end'] -
+                        timings[p + 'cleanup_start'])])
+        solver = []
+        for n in timings.index:
+            sim = self.simulations[n]
+            if hasattr(sim, '_results_dict'):
+                solver.append(utils.sum_refinement_values(sim._results_dict,
+                                                          'TotalTime'))
+        phases['solver'] = pd.Series(solver, dtype=float)
+        phases['overhead'] = pd.concat([phases[k] for k in
+                                        ['submission', 'processing', 'store',
+                                         'cleanup']], axis=1).sum(
+                                                        axis=1, min_count=1)
+        # Only these phases run one after another in the driver, so that
+        # their totals can be compared to the wall time of the run
+        serial_phases = ['geometry', 'submission', 'processing', 'store',
+                         'cleanup', 'overhead']
+        t_sims = (timings.max(axis=1) - timings.min(axis=1)).sum()
+
+        if hasattr(self, '_t_run_end') and self._t_run_end > self._t_run_start:
+            t_run = self._t_run_end - self._t_run_start
+        else:
+            t_run = utils.monotonic() - self._t_run_start
+        report = pd.DataFrame(collections.OrderedDict([
+                    ('count', [v.count() for v in phases.values()]),
+                    ('total', [v.sum() for v in phases.values()]),
+                    ('mean', [v.mean() for v in phases.values()]),
+                    ('max', [v.max() for v in phases.values()])]),
+                    index=list(phases.keys()))
+        report['fraction_of_run'] = report['total'] / t_run
+        report.loc[[k for k in phases if not k in serial_phases],
+                   'fraction_of_run'] = np.nan
+        if t_sims > 0.:
+            report['fraction_of_sim_time'] = report['total'] / t_sims
+        else:
+            report['fraction_of_sim_time'] = np.nan
+        report.loc['run'] = [1, t_run, t_run, t_run, 1., np.nan]
+        return report
     
     def _copy_from_transitional_dir(self):
         """Moves the transitional storage directory to the taget storage
@@ -2913,6 +5201,428 @@ class SimulationSet(object):
 # =============================================================================
 
 
+class SimulationSetGroup(object):
+    """Runs the simulations of several `SimulationSet`s (e.g. of a campaign)
+    in a single dispatch loop on the shared daemon, instead of running the
+    sets one after another. The resources therefore stay busy across the
+    boundaries of the sets. Each set keeps writing to its own HDF5 store.
+
+    The next simulation is taken from the set with the highest priority that
+    has simulations left. Among sets of equal priority, the submissions are
+    distributed according to fair-share weights, i.e. the set with the
+    lowest number of submissions relative to its weight is chosen. The
+    simulations of a geometry group are submitted consecutively, so that the
+    geometry is not recomputed more often than necessary, even if several
+    sets share a project working directory.
+
+    All sets must be scheduled (see `make_simulation_schedule`) and share
+    the resources of the daemon. Resultbags, memory limits, geometry
+    affinity and the speculative re-execution of stragglers are not
+    supported in a group run.
+
+    Besides the blocking `run`, the group can be run incrementally using
+    `start`, `iter_finished` (or `poll`), `append` and `finish`, e.g. to
+    process each simulation as soon as it is finished and to add new
+    simulations to the running group.
+
+    Parameters
+    ----------
+    simusets : sequence of SimulationSet
+        The simulation sets to run.
+    weights : sequence of float or NoneType, default None
+        Fair-share weights of the sets (one per set). Sets of equal priority
+        receive submissions in proportion to their weights. If None, all sets
+        have the same weight.
+    priorities : sequence of int or NoneType, default None
+        Priorities of the sets (one per set). The simulations of sets with a
+        higher priority are submitted first. If None, all sets have the same
+        priority.
+
+    """
+
+    def __init__(self, simusets, weights=None, priorities=None):
+        self.logger = logging.getLogger('core.' + self.__class__.__name__)
+        self.simusets = list(simusets)
+        n_sets = len(self.simusets)
+        if n_sets == 0:
+            raise ValueError('`simusets` must contain at least one set.')
+            return
+        for sset in self.simusets:
+            if not isinstance(sset, SimulationSet):
+                raise TypeError('All `simusets` must be of type ' +
+                                'SimulationSet, not {}'.format(type(sset)))
+                return
+            if sset.use_resultbag:
+                raise ValueError('Resultbags are not supported in a ' +
+                                 'SimulationSetGroup.')
+                return
+        if weights is None:
+            weights = [1.] * n_sets
+        if priorities is None:
+            priorities = [0] * n_sets
+        if len(weights) != n_sets or len(priorities) != n_sets:
+            raise ValueError('`weights` and `priorities` must have one ' +
+                             'value per set.')
+            return
+        if any([w <= 0. for w in weights]):
+            raise ValueError('All `weights` must be positive.')
+            return
+        self.weights = [float(w) for w in weights]
+        self.priorities = list(priorities)
+
+    def __repr__(self):
+        return 'SimulationSetGroup({} sets)'.format(len(self.simusets))
+
+    def all_done(self):
+        """Checks if all simulations of all sets are done."""
+        return all([sset.all_done() for sset in self.simusets])
+
+    def run(self, processing_func=None, N='all', auto_rerun_failed=1,
+            run_post_process_files=None, additional_keys=None,
+            wdir_mode='keep', zip_file_path=None, show_progress_bar=False,
+            jcm_geo_kwargs=None, jcm_solve_kwargs=None,
+            pass_ccosts_to_processing_func=False, store_timings=False,
+            retry_policy=None, journal=True):
+        """Runs all necessary simulations of all sets and saves the results
+        to the HDF5 store of each set. If the new daemon interface is not
+        available, the sets are run one after another. To process the
+        results while the run is in progress or to add simulations to the
+        running group, use `start`, `iter_finished`, `append` and `finish`
+        instead.
+
+        Parameters
+        ----------
+        processing_func : callable, sequence or NoneType, default None
+            Function for result processing (see `SimulationSet.run`), or a
+            sequence with one function per set.
+        N : int or 'all', default 'all'
+            Maximum number of jobs of all sets which are pushed to the daemon
+            at a time. As soon as a job finishes, the next simulation is
+            submitted, i.e. `N` is a sliding window and not a batch size as
+            in `SimulationSet.run`, which waits for the whole batch. If 'all',
+            all simulations are pushed at once, in the order given by the
+            priorities and weights.
+        retry_policy : RetryPolicy or NoneType, default None
+            Controls the retrying of failed simulations. A copy is used for
+            each set. If None, a `RetryPolicy` with
+            `max_retries=auto_rerun_failed` is used.
+
+        All other arguments are passed to each set as in `SimulationSet.run`.
+        """
+        if not NEW_DAEMON_DETECTED:
+            self.logger.warn('Running the sets concurrently is only ' +
+                             'supported with the new daemon interface. ' +
+                             'Running them one after another.')
+            if not utils.is_sequence(processing_func):
+                processing_func = [processing_func] * len(self.simusets)
+            for sset, func in zip(self.simusets, processing_func):
+                sset.run(processing_func=func, N=N,
+                         auto_rerun_failed=auto_rerun_failed,
+                         run_post_process_files=run_post_process_files,
+                         additional_keys=additional_keys,
+                         wdir_mode=wdir_mode, zip_file_path=zip_file_path,
+                         show_progress_bar=show_progress_bar,
+                         jcm_geo_kwargs=jcm_geo_kwargs,
+                         jcm_solve_kwargs=jcm_solve_kwargs,
+                         pass_ccosts_to_processing_func=
+                                            pass_ccosts_to_processing_func,
+                         store_timings=store_timings,
+                         retry_policy=deepcopy(retry_policy), journal=journal)
+            return
+
+        if not self.start(processing_func=processing_func, N=N,
+                          auto_rerun_failed=auto_rerun_failed,
+                          run_post_process_files=run_post_process_files,
+                          additional_keys=additional_keys,
+                          wdir_mode=wdir_mode, zip_file_path=zip_file_path,
+                          show_progress_bar=show_progress_bar,
+                          jcm_geo_kwargs=jcm_geo_kwargs,
+                          jcm_solve_kwargs=jcm_solve_kwargs,
+                          pass_ccosts_to_processing_func=
+                                            pass_ccosts_to_processing_func,
+                          store_timings=store_timings,
+                          retry_policy=retry_policy, journal=journal):
+            return
+        try:
+            for _ in self.iter_finished():
+                pass
+        finally:
+            self.finish()
+
+    def run_async(self, poll_interval=1., **kwargs):
+        """Coroutine version of `run` for use with asyncio (Python 3.6 or
+        higher), i.e. `await group.run_async(...)`. The daemon is polled
+        every `poll_interval` seconds without blocking the event loop, so
+        that one event loop can drive several groups or sets. The
+        geometry computation, result processing and store writes are still
+        executed in the thread of the event loop. The `kwargs` are passed as
+        in `run`. Requires the new daemon interface."""
+        return _import_asynchronous().run_group_async(self, poll_interval,
+                                                      **kwargs)
+
+    def iter_results(self, poll_interval=1., **kwargs):
+        """Runs the group like `run_async` and returns an asynchronous
+        iterator over the results, i.e. `async for simuset, sim in
+        group.iter_results(...)`. A tuple of the `SimulationSet` and the
+        `Simulation` is yielded as soon as a simulation is finished and
+        stored, or failed without a retry left."""
+        return _import_asynchronous().iter_group_results(self, poll_interval,
+                                                         **kwargs)
+
+    def start(self, processing_func=None, N='all', auto_rerun_failed=1,
+              run_post_process_files=None, additional_keys=None,
+              wdir_mode='keep', zip_file_path=None, show_progress_bar=False,
+              jcm_geo_kwargs=None, jcm_solve_kwargs=None,
+              pass_ccosts_to_processing_func=False, store_timings=False,
+              retry_policy=None, journal=True):
+        """Starts an incremental run of all sets, i.e. prepares the runs and
+        initializes the state of the dispatch loop (see `run` for the
+        arguments). The run is then driven using `iter_finished` or `poll`,
+        simulations can be added using `append`, and it must be ended using
+        `finish`, e.g.
+
+            if group.start(N=4):
+                try:
+                    for simuset, sim in group.iter_finished():
+                        ...
+                finally:
+                    group.finish()
+
+        Requires the new daemon interface. Returns False if there is nothing
+        to run."""
+        if not NEW_DAEMON_DETECTED:
+            raise RuntimeError('Incremental group runs require the new ' +
+                               'daemon interface.')
+            return
+        if N == 'all':
+            N = np.inf
+        elif not isinstance(N, int):
+            raise ValueError('`N` must be an integer or "all"')
+            return
+        if not utils.is_sequence(processing_func):
+            processing_func = [processing_func] * len(self.simusets)
+        run_kwargs = dict(auto_rerun_failed=auto_rerun_failed,
+                          run_post_process_files=run_post_process_files,
+                          wdir_mode=wdir_mode, zip_file_path=zip_file_path,
+                          show_progress_bar=show_progress_bar,
+                          pass_ccosts_to_processing_func=
+                                            pass_ccosts_to_processing_func,
+                          store_timings=store_timings, journal=journal)
+
+        # Prepare the runs of all sets. Sets which use the same project
+        # working directory share the record of the current geometry.
+        self._t0 = time.time()
+        self._N = N
+        self._active = []
+        self._pending = {}
+        self._job_ids = {}  # maps the job IDs to the sets
+        self._ids_to_sim_number = {}  # one dict per set
+        geometry_owners = {}
+        for sset, func in zip(self.simusets, processing_func):
+            if not sset._prepare_run(memory_per_sim=None,
+                                     retry_policy=deepcopy(retry_policy),
+                                     **run_kwargs):
+                continue
+            submission_order = sset._init_submission_state(
+                                        func, dict(jcm_geo_kwargs or {}),
+                                        dict(jcm_solve_kwargs or {}),
+                                        additional_keys)
+            sset._geometry_owner = geometry_owners.setdefault(
+                                    os.path.abspath(sset.project.working_dir),
+                                    {'simuset': None, 'number': None})
+            self._ids_to_sim_number[sset] = {}
+            reattached = set()
+            if sset._journal is not None:
+                sset_job_ids = []
+                reattached = sset._recover_from_journal(
+                                    sset_job_ids, self._ids_to_sim_number[sset])
+                for job_id in sset_job_ids:
+                    self._job_ids[job_id] = sset
+            self._pending[sset] = collections.deque()
+            for n in submission_order:
+                sim = sset.simulations[n]
+                if (n in sset.finished_sim_numbers or n in reattached or
+                        n in sset.excluded_sim_numbers or
+                        sset._is_derived(n)):
+                    if not (sim.status in ['Finished',
+                                           'Finished and processed'] or
+                            n in reattached):
+                        sim.status = 'Skipped'
+                else:
+                    self._pending[sset].append(n)
+            self._active.append(sset)
+        if len(self._active) == 0:
+            self.logger.info('Nothing to run: all simulations finished.')
+            return False
+        self._n_submitted = {sset: 0 for sset in self._active}
+        self._last = None
+        self.logger.info('Running {} simulation(s) of {} set(s).'.format(
+                         sum([len(p) for p in self._pending.values()]),
+                         len(self._active)))
+        return True
+
+    def _dispatch(self, block=True):
+        """Submits new simulations until `N` jobs are in flight and
+        resubmits failed simulations whose backoff has expired. If no job is
+        in flight and only failed simulations waiting for their backoff are
+        left, this waits for the earliest backoff if `block` is True. Returns
+        False if all simulations are handled."""
+        job_ids = self._job_ids
+        ids_to_sim_number = self._ids_to_sim_number
+        while len(job_ids) < self._N:
+            sset = self._select_set(self._pending, self._n_submitted,
+                                    self._last)
+            if sset is None:
+                break
+            n = self._pending[sset].popleft()
+            job_id = self._submit(sset, sset.simulations[n])
+            job_ids[job_id] = sset
+            ids_to_sim_number[sset][job_id] = n
+            self._n_submitted[sset] += 1
+            self._last = (sset, sset._geometry_group_ids[n])
+        for sset in self._active:
+            for job_id in sset._submit_due_retries(ids_to_sim_number[sset]):
+                job_ids[job_id] = sset
+        if len(job_ids) > 0:
+            return True
+
+        # Only failed simulations waiting for their backoff are left
+        waiting = [s for s in self._active if len(s._retry_queue) > 0]
+        if len(waiting) == 0:
+            return False
+        if block:
+            sset = min(waiting, key=lambda s: min(s._retry_queue)[0])
+            for job_id in sset._submit_due_retries(ids_to_sim_number[sset],
+                                                   block=True):
+                job_ids[job_id] = sset
+        return True
+
+    def poll(self, timeout=None):
+        """Submits new simulations (and failed simulations whose retry is
+        due) and waits for at most `timeout` seconds (indefinitely if None)
+        until any job is finished. Returns the list of tuples of the set and
+        the simulation which are finally handled, i.e. stored or failed
+        without a retry left, or None if all simulations are handled. Use
+        after `start`."""
+        if not self._dispatch(block=timeout is None):
+            return
+        return self._collect(timeout=timeout)
+
+    def iter_finished(self):
+        """Yields a tuple of the set and the simulation as soon as a
+        simulation is finished and stored, or failed without a retry left,
+        until all simulations are handled, including the ones which were
+        added using `append` in the meantime. Use after `start`."""
+        while True:
+            handled = self.poll()
+            if handled is None:
+                return
+            for result in handled:
+                yield result
+
+    def append(self, simuset, numbers):
+        """Adds the simulations with the `numbers` of `simuset` to the
+        running group, e.g. the ones returned by
+        `SimulationSet.append_simulations`. They are submitted after the
+        simulations which are already pending for this set. `simuset` must
+        be one of the sets of this group and must take part in the run
+        started using `start`."""
+        if not simuset in getattr(self, '_active', []):
+            raise ValueError('{} does not take part in the '.format(simuset) +
+                             'current run of this group.')
+            return
+        self._pending[simuset].extend(numbers)
+
+    def finish(self):
+        """Finishes the run started using `start`, i.e. cleans up after the
+        runs of all sets and triggers their 'on_run_end'-hooks. Must also be
+        called if the run was interrupted by an exception."""
+        try:
+            self._finish_run()
+        finally:
+            for sset in self._active:
+                sset._end_run()
+
+    def _finish_run(self):
+        """Finishes the runs of all sets."""
+        for sset in self._active:
+            sset._finish_run()
+        self.logger.info('Total time for all sets: {}'.format(
+                         utils.tForm(time.time() - self._t0)))
+
+    def _select_set(self, pending, n_submitted, last):
+        """Returns the set from which the next simulation is submitted, or
+        None if no simulations are left. The geometry group of the `last`
+        submission (a tuple of the set and the group index) is continued if
+        possible. Otherwise, the set with the highest priority and the lowest
+        number of submissions relative to its weight is chosen."""
+        if last is not None:
+            sset, group = last
+            if (len(pending[sset]) > 0 and
+                    sset._geometry_group_ids[pending[sset][0]] == group):
+                return sset
+        candidates = [(i, sset) for i, sset in enumerate(self.simusets)
+                      if len(pending.get(sset, [])) > 0]
+        if len(candidates) == 0:
+            return
+        priority = max([self.priorities[i] for i, _ in candidates])
+        shares = [(n_submitted[sset] / self.weights[i], i, sset)
+                  for i, sset in candidates if self.priorities[i] == priority]
+        return min(shares, key=lambda t: t[:2])[2]
+
+    def _submit(self, sset, sim):
+        """Submits the simulation `sim` of the set `sset`, computing the
+        geometry first if the project working directory does not contain it,
+        and returns the job ID."""
+        if not sset._has_geometry(sim):
+            sset.compute_geometry(sim, **sset._jcm_geo_kwargs)
+            sset._set_geometry_owner(sim)
+            sset.hooks.trigger('on_geometry', sset, sim)
+        job_id = sim.solve(additional_keys=sset._additional_keys,
+                           **sset._jcm_solve_kwargs)
+        sset.hooks.trigger('on_submit', sset, sim)
+        self.logger.debug('Queued simulation {} of {} with job_id {}'.format(
+                          sim.number, sset, job_id))
+        return job_id
+
+    def _collect(self, timeout=None):
+        """Waits until any of the jobs in flight is finished (or for at most
+        `timeout` seconds) and lets the corresponding sets handle the results
+        (see `SimulationSet._handle_job_result`). Returns the list of tuples
+        of the set and the simulation which are finally handled, i.e. stored
+        or failed without a retry left."""
+        if len(self._job_ids) == 0:
+            return []
+
+        # The waiting is also interrupted when the backoff of a failed
+        # simulation expires
+        wait_kwargs = {}
+        now = utils.monotonic()
+        pending = [r[0] - now for sset in self._active
+                   for r in sset._retry_queue if r[0] > now]
+        if timeout is not None:
+            pending.append(timeout)
+        if len(pending) > 0:
+            timeout = min(pending)
+        timeout = get_wait_timeout(timeout)
+        if timeout is not None:
+            wait_kwargs['timeout'] = timeout
+        with DAEMON_LOCK:
+            results, _ = daemon.wait(list(self._job_ids.keys()),
+                                     break_condition='any', **wait_kwargs)
+        handled = []
+        for job_id, result in results.items():
+            sset = self._job_ids.pop(job_id)
+            sim = sset.simulations[self._ids_to_sim_number[sset].pop(job_id)]
+            sset._handle_job_result(sim, result)
+            if not (sim.status == 'Failed' and
+                    any([r[1] == sim.number for r in sset._retry_queue])):
+                handled.append((sset, sim))
+        return handled
+
+# =============================================================================
+
+
 class ConvergenceTest(object):
     """Class to set up, run and analyze convergence tests for JCMsuite
     projects. A convergence test consists of a reference simulation and (a)
@@ -3089,10 +5799,12 @@ class ConvergenceTest(object):
         """
         self.resource_manager.use_only_resources(names)
 
-    def add_resources(self, n_shots=10, wait_seconds=5, ignore_fail=False):
+    def add_resources(self, n_shots=10, wait_seconds=5, ignore_fail=False,
+                      concurrent=True, min_resources=1):
         """Tries to add all resources configured in the configuration using the
-        JCMdaemon."""
-        self.resource_manager.add_resources(n_shots, wait_seconds, ignore_fail)
+        JCMdaemon (see `ResourceManager.add_resources`)."""
+        self.resource_manager.add_resources(n_shots, wait_seconds, ignore_fail,
+                                            concurrent, min_resources)
 
     def _resources_ready(self):
         """Returns whether the resources are already added."""
@@ -3184,11 +5896,25 @@ class ConvergenceTest(object):
             a nickname is given, all configured cores of this resource are used
             in the same way. If False, the currently active resource
             configuration is used. The configuration for the test simulation
-            set remains untouched.
+            set remains untouched. If False, both sets share the resources
+            and are run concurrently in a `SimulationSetGroup`, so that no
+            resources are left idle between the sets. Otherwise, the sets
+            must be run one after another, as the reference set uses a
+            different resource configuration of the daemon.
         save_run : bool, default False
             If True, the utility function `run_simusets_in_save_mode` is used
             for the run.
         """
+        if run_ref_with_max_cores is False and not any(
+                [k in SINGLE_SET_RUN_ARGS for k in simuset_kwargs]):
+            self.__log_paragraph('Running the reference and the test ' +
+                                 'simulation sets.')
+            simusets = [self.sset_ref, self.sset_test]
+            if save_run:
+                utils.run_simusets_in_save_mode(simusets, **simuset_kwargs)
+            else:
+                SimulationSetGroup(simusets).run(**simuset_kwargs)
+            return
         self.run_reference_simulation(run_on_resource=run_ref_with_max_cores,
                                       save_run=save_run, **simuset_kwargs)
         self.run_test_simulations(save_run=save_run, **simuset_kwargs)
@@ -3305,6 +6031,311 @@ class ConvergenceTest(object):
 # =============================================================================
 
 
+class AdaptiveScan(object):
+    """Class to scan the parameter space adaptively, i.e. to start from a
+    coarse grid and to add simulations iteratively where the monitored
+    result columns change fastest (e.g. close to resonances), instead of
+    simulating a fine Cartesian grid. All simulations are part of a single
+    `SimulationSet` (attribute `simuset`) with `combination_mode='list'`
+    and are stored in its HDF5 store.
+    
+    Parameters
+    ----------
+    project : JCMProject, str or tuple/list of the form (specifier,
+        working_dir) JCMProject to use for the simulations (see
+        `SimulationSet`).
+    keys : dict
+        Keys-dict as used to initialize a `SimulationSet`, containing the
+        keys `constants`, `parameters` and/or `geometry`. The numerical
+        sequences in `parameters` and `geometry` define the coarse initial
+        grid (all combinations are used, as for `combination_mode='product'`)
+        and their minimum and maximum values define the bounds of the scan.
+    targets : str or list
+        The result column(s) to monitor, i.e. columns returned by the
+        `processing_func` passed to `run`.
+    duplicate_path_levels, storage_folder, storage_base,
+    transitional_storage_base, check_version_match, resource_manager
+        See `SimulationSet`. If `storage_folder` is 'from_date', the current
+        date plus '_adaptive_scan' is used.
+    
+    """
+    
+    def __init__(self, project, keys, targets, duplicate_path_levels=0,
+                 storage_folder='from_date', storage_base='from_config',
+                 transitional_storage_base=None, check_version_match=True,
+                 resource_manager=None):
+        self.logger = logging.getLogger('core.' + self.__class__.__name__)
+        if not isinstance(targets, (list, tuple)):
+            targets = [targets]
+        self.targets = list(targets)
+        if storage_folder == 'from_date':
+            storage_folder = date.today().strftime(STANDARD_DATE_FORMAT)
+            storage_folder += '_adaptive_scan'
+        self.history = []
+        
+        # Find the scan keys and their bounds
+        self.scan_keys = []
+        self.geometry_scan_keys = []
+        self.bounds = {}
+        grid = []
+        for tag in ['parameters', 'geometry']:
+            for key, value in keys.get(tag, {}).items():
+                if not utils.is_sequence(value) or len(value) < 2:
+                    continue
+                value = np.asarray(value)
+                if not np.issubdtype(value.dtype, np.number):
+                    raise ValueError('The sequence for key {} '.format(key) +
+                                     'is not numerical. Only numerical ' +
+                                     'keys can be scanned.')
+                    return
+                self.scan_keys.append(key)
+                if tag == 'geometry':
+                    self.geometry_scan_keys.append(key)
+                self.bounds[key] = (float(value.min()), float(value.max()))
+                grid.append(np.unique(value))
+        if len(self.scan_keys) == 0:
+            raise ValueError('`keys` must contain at least one numerical ' +
+                             'sequence in `parameters` or `geometry`.')
+            return
+        
+        # Initialize the SimulationSet with the coarse grid in list mode
+        list_keys = {tag: dict(keys.get(tag, {}))
+                     for tag in ['constants', 'parameters', 'geometry']}
+        combinations = list(product(*grid))
+        for i, key in enumerate(self.scan_keys):
+            tag = 'geometry' if key in self.geometry_scan_keys \
+                else 'parameters'
+            list_keys[tag][key] = np.array([c[i] for c in combinations])
+        self.simuset = SimulationSet(project, list_keys,
+                            duplicate_path_levels=duplicate_path_levels,
+                            storage_folder=storage_folder,
+                            storage_base=storage_base,
+                            transitional_storage_base=transitional_storage_base,
+                            combination_mode='list',
+                            check_version_match=check_version_match,
+                            resource_manager=resource_manager)
+        self.storage_dir = self.simuset.storage_dir
+    
+    def __repr__(self):
+        return 'AdaptiveScan(scan_keys={}, targets={}, num_sims={})'.format(
+            self.scan_keys, self.targets, self.simuset.num_sims)
+    
+    def make_simulation_schedule(self):
+        """Same as for SimulationSet. Schedules the coarse initial grid."""
+        self.simuset.make_simulation_schedule()
+    
+    def run(self, processing_func=None, max_sims=None, tolerance=None,
+            criterion='gradient', batch_size=10, max_iterations=100,
+            min_distance=1.e-3, **simuset_kwargs):
+        """Runs the coarse initial grid and refines it iteratively until the
+        budget or the tolerance is met.
+        
+        In each iteration, the samples are connected to their neighbors (in
+        sorted order for a single scan key, and by a Delaunay triangulation
+        otherwise, using coordinates which are normalized to the bounds). The
+        midpoints of the `batch_size` connections with the largest loss are
+        appended as new simulations and the simulation set is run again.
+        
+        Parameters
+        ----------
+        processing_func : callable
+            Function for result processing (see `SimulationSet.run`). It must
+            return the `targets`.
+        max_sims : int or NoneType, default None
+            Maximum total number of simulations (the budget).
+        tolerance : float or NoneType, default None
+            The refinement stops if the largest loss is below this value. The
+            losses are relative to the value range of each target (see
+            `criterion`). At least one of `max_sims` and `tolerance` must be
+            given.
+        criterion : {'gradient', 'curvature', 'surrogate'}, default 'gradient'
+            The loss of each connection of neighboring samples:
+            
+              - 'gradient': its length in the space of the normalized keys
+                and targets, i.e. steep regions are refined, as well as
+                coarse regions.
+              - 'curvature': the difference between the linear interpolation
+                and an 'rbf' `Surrogate` at its midpoint, i.e. the estimated
+                error of the linear interpolation.
+              - 'surrogate': the error estimate of a 'gp' `Surrogate` at its
+                midpoint.
+            
+            The maximum over the `targets` is used.
+        batch_size : int, default 10
+            Number of new simulations per iteration. Should be at least the
+            number of parallel simulations.
+        max_iterations : int, default 100
+            Maximum number of refinement iterations.
+        min_distance : float, default 1.e-3
+            Connections are not refined any further if their midpoints have a
+            normalized distance to the samples smaller than this value.
+        
+        The `simuset_kwargs` are passed to the `run`-method of the
+        `SimulationSet`. Failed simulations are excluded from the scan.
+        """
+        if max_sims is None and tolerance is None:
+            raise ValueError('Please specify `max_sims` and/or `tolerance`.')
+            return
+        if not criterion in ['gradient', 'curvature', 'surrogate']:
+            raise ValueError('Unknown criterion: {}.'.format(criterion))
+            return
+        if not self.simuset._is_scheduled():
+            self.make_simulation_schedule()
+        
+        for iteration in range(max_iterations + 1):
+            self.simuset.run(processing_func=processing_func,
+                             **simuset_kwargs)
+            self.simuset.exclude_simulations(
+                [sim.number for sim in self.simuset.failed_simulations])
+            data = self.get_scan_data()
+            num_sims = self.simuset.num_sims
+            candidates, losses = self._get_candidates(data, criterion,
+                                                      min_distance)
+            max_loss = losses.max() if len(losses) > 0 else 0.
+            self.history.append({'iteration': iteration,
+                                 'num_sims': num_sims,
+                                 'num_samples': len(data),
+                                 'max_loss': max_loss})
+            self.logger.info('Iteration {}: {} samples, '.format(
+                             iteration, len(data)) +
+                             'maximum loss: {:.3e}'.format(max_loss))
+            
+            # Check the stop conditions
+            if len(candidates) == 0:
+                self.logger.info('Reached the `min_distance`. Stopping.')
+                break
+            if tolerance is not None and max_loss < tolerance:
+                self.logger.info('Reached the `tolerance`. Stopping.')
+                break
+            if max_sims is not None and num_sims >= max_sims:
+                self.logger.info('Reached `max_sims`. Stopping.')
+                break
+            if iteration == max_iterations:
+                self.logger.info('Reached `max_iterations`. Stopping.')
+                break
+            
+            # Append the candidates with the largest losses
+            n_new = batch_size
+            if max_sims is not None:
+                n_new = min(n_new, max_sims - num_sims)
+            best = np.argsort(-losses)[:n_new]
+            self._append_candidates(candidates.iloc[best])
+    
+    def get_scan_data(self):
+        """Returns a pandas DataFrame with the scan keys and the targets of
+        all finished simulations with valid target values, indexed by the
+        simulation number."""
+        data = self.simuset.get_store_data()
+        if data is None or len(data) == 0:
+            return pd.DataFrame(columns=self.scan_keys + self.targets)
+        missing = [t for t in self.targets if t not in data.columns]
+        if len(missing) > 0:
+            raise RuntimeError('The targets {} are missing in the '.format(
+                               missing) + 'results. Please check the ' +
+                               '`processing_func`.')
+            return
+        data = data.loc[:, self.scan_keys + self.targets].astype(float)
+        return data.dropna().sort_index()
+    
+    def _normalize(self, values):
+        """Normalizes the array of scan key `values` (one column per scan key)
+        to the bounds."""
+        lower = np.array([self.bounds[k][0] for k in self.scan_keys])
+        upper = np.array([self.bounds[k][1] for k in self.scan_keys])
+        span = np.where(upper > lower, upper - lower, 1.)
+        return (values - lower) / span, lower, span
+    
+    def _get_edges(self, points):
+        """Returns an array of index pairs of neighboring `points`."""
+        if points.shape[1] == 1:
+            order = np.argsort(points[:, 0])
+            return np.column_stack((order[:-1], order[1:]))
+        from scipy.spatial import Delaunay
+        simplices = Delaunay(points, qhull_options='QJ').simplices
+        edges = set()
+        for simplex in simplices:
+            for i in range(len(simplex)):
+                for j in range(i + 1, len(simplex)):
+                    edges.add(tuple(sorted((simplex[i], simplex[j]))))
+        return np.array(sorted(edges))
+    
+    def _get_candidates(self, data, criterion, min_distance):
+        """Returns a DataFrame of candidate scan key values (the midpoints of
+        the connections of neighboring samples) and the array of their
+        losses."""
+        empty = (pd.DataFrame(columns=self.scan_keys), np.zeros(0))
+        if len(data) < len(self.scan_keys) + 1:
+            return empty
+        points, lower, span = self._normalize(data[self.scan_keys].values)
+        values = data[self.targets].values
+        scale = np.ptp(values, axis=0)
+        scale[scale == 0.] = 1.
+        values = values / scale
+        
+        edges = self._get_edges(points)
+        lengths = np.linalg.norm(points[edges[:, 0]] - points[edges[:, 1]],
+                                 axis=1)
+        edges = edges[lengths / 2. >= min_distance]
+        if len(edges) == 0:
+            return empty
+        midpoints = (points[edges[:, 0]] + points[edges[:, 1]]) / 2.
+        candidates = pd.DataFrame(lower + midpoints * span,
+                                  columns=self.scan_keys)
+        
+        if criterion == 'gradient':
+            deltas = np.column_stack(
+                    (points[edges[:, 0]] - points[edges[:, 1]],
+                     values[edges[:, 0]] - values[edges[:, 1]]))
+            losses = np.linalg.norm(deltas, axis=1)
+        elif criterion == 'curvature':
+            surrogate = Surrogate(self.targets, features=self.scan_keys,
+                                  method='rbf').fit(data)
+            linear = (values[edges[:, 0]] + values[edges[:, 1]]) / 2.
+            predicted = surrogate.predict(candidates).values / scale
+            losses = np.abs(predicted - linear).max(axis=1)
+        else:
+            surrogate = Surrogate(self.targets, features=self.scan_keys,
+                                  method='gp').fit(data)
+            _, errors = surrogate.predict(candidates, return_error=True)
+            losses = (errors.values / scale).max(axis=1)
+        return candidates, losses
+    
+    def _append_candidates(self, candidates):
+        """Appends the `candidates` to the simulation set, sorted by the
+        geometry scan keys to minimize the number of geometry computations.
+        If no geometry key is scanned, the geometry of the previous run is
+        reused."""
+        if len(self.geometry_scan_keys) > 0:
+            candidates = candidates.sort_values(self.geometry_scan_keys)
+        keys_list = [{k: row[k] for k in self.scan_keys}
+                     for _, row in candidates.iterrows()]
+        numbers = self.simuset.append_simulations(keys_list)
+        self.logger.debug('Appended simulations {}.'.format(numbers))
+        
+        # The finished simulations must not cause a geometry computation
+        simuset = self.simuset
+        for sim in simuset.simulations:
+            if (sim.number in simuset.finished_sim_numbers or
+                    sim.number in simuset.excluded_sim_numbers):
+                sim.rerun_JCMgeo = False
+        simuset.simulations[numbers[0]].rerun_JCMgeo = \
+            len(self.geometry_scan_keys) > 0
+    
+    def get_history(self):
+        """Returns a pandas DataFrame with the number of simulations and
+        samples and the maximum loss of each iteration of `run`."""
+        return pd.DataFrame(self.history,
+                            columns=['iteration', 'num_sims', 'num_samples',
+                                     'max_loss']).set_index('iteration')
+    
+    def close_store(self):
+        """Closes the HDF5 store of the simulation set."""
+        self.simuset.close_store()
+
+
+# =============================================================================
+
+
 class QuantityMinimizer(SimulationSet):
     """
     """
@@ -3321,6 +6352,8 @@ class QuantityMinimizer(SimulationSet):
                            resource_manager=resource_manager)
         self.check_validity_of_input_args()
         self.current_sim_index = 0
+        self._eval_cache = {}
+        self._geometry_computed = False
     
     def check_validity_of_input_args(self):
         """Checks if the provided `fixed_keys` describe a single simulation."""
@@ -3341,7 +6374,7 @@ class QuantityMinimizer(SimulationSet):
     def minimize_quantity(self, x, quantity_to_minimize, maximize_instead=False,
                           processing_func=None, wdir_mode='keep',
                           jcm_geo_kwargs=None, jcm_solve_kwargs=None,
-                          **scipy_minimize_kwargs):
+                          cache_tolerance=1.e-10, **scipy_minimize_kwargs):
         """TODO
         Parameters
         ----------
@@ -3365,15 +6398,126 @@ class QuantityMinimizer(SimulationSet):
         jcm_geo_kwargs, jcm_solve_kwargs : dict or NoneType, default None 
             Keyword arguments which are directly passed to jcm.geo and
             jcm.solve, respectively.
+        cache_tolerance : float, default 1.e-10
+            Values of `x` which are equal after rounding to multiples of
+            `cache_tolerance` are treated as identical. The result for such a
+            value is taken from the evaluation cache of this minimization or
+            from the HDF5 store (i.e. from previous minimizations of this
+            instance, if a row with identical keys and a value for the
+            `quantity_to_minimize` exists) instead of solving a new
+            simulation.
         
         `scipy_minimize_kwargs` will be passed to the `scipy.optimize.minimize`
         function.
+        
+        If `x` is not a geometry key, the geometry is only computed once and
+        reused for all further simulations.
         """
         from scipy.optimize import minimize
+        self._init_minimization(x, quantity_to_minimize, maximize_instead,
+                                processing_func, wdir_mode, jcm_geo_kwargs,
+                                jcm_solve_kwargs, cache_tolerance)
+        
+        x0 = self._flat_keys[x]
+        
+        if not 'method' in scipy_minimize_kwargs:
+            scipy_minimize_kwargs['method'] = 'nelder-mead'
+        if not 'options' in scipy_minimize_kwargs:
+            scipy_minimize_kwargs['options'] = {'disp': True}
+
+        self.minimization_result = minimize(self._solve_new_simulation, x0,
+                                            **scipy_minimize_kwargs)
+        self._log_minimization_stats()
+    
+    def minimize_quantity_parallel(self, x, quantity_to_minimize,
+                                   method='multistart', x0=None, bounds=None,
+                                   maximize_instead=False,
+                                   processing_func=None, wdir_mode='keep',
+                                   jcm_geo_kwargs=None, jcm_solve_kwargs=None,
+                                   cache_tolerance=1.e-10, **scipy_kwargs):
+        """Parallel version of `minimize_quantity`, in which the simulations
+        of several objective evaluations are pushed to the daemon together.
+        
+        Parameters
+        ----------
+        method : {'multistart', 'differential_evolution'}, default 'multistart'
+            If 'multistart', independent `scipy.optimize.minimize`
+            trajectories are run for each start value in `x0`. Each
+            trajectory runs in its own thread, and the next evaluations of
+            all trajectories are solved as one batch. If
+            'differential_evolution', `scipy.optimize.differential_evolution`
+            is used, and the population of each generation is solved as one
+            batch.
+        x0 : sequence or NoneType, default None
+            The start values for 'multistart'. If None, `len(x0)` equally
+            spaced values inside the `bounds` are used, where the number is
+            given by `scipy_kwargs.pop('n_starts', 4)`.
+        bounds : tuple or NoneType, default None
+            Tuple (min, max) of the bounds of `x`. Required for
+            'differential_evolution' and if `x0` is None. For 'multistart',
+            the bounds are passed to `scipy.optimize.minimize` (unless
+            `bounds` are given in the `scipy_kwargs`), which requires a method
+            that supports bounds, e.g. 'nelder-mead' (scipy>=1.7), 'powell'
+            or 'L-BFGS-B'.
+        
+        All other parameters are the same as in `minimize_quantity`. The
+        `scipy_kwargs` are passed to `scipy.optimize.minimize` or
+        `scipy.optimize.differential_evolution`, respectively. The best result
+        is stored in `minimization_result`. For 'multistart', the results of
+        all trajectories are stored in `minimization_results`.
+        """
+        if method not in ['multistart', 'differential_evolution']:
+            raise ValueError('Unknown method: {}'.format(method))
+            return
+        self._init_minimization(x, quantity_to_minimize, maximize_instead,
+                                processing_func, wdir_mode, jcm_geo_kwargs,
+                                jcm_solve_kwargs, cache_tolerance)
+        
+        if method == 'differential_evolution':
+            from scipy.optimize import differential_evolution
+            if bounds is None:
+                raise ValueError('`bounds` are required for the ' +
+                                 'differential evolution.')
+                return
+            # The `workers`-argument receives the whole population of a
+            # generation, which is then solved as one batch
+            scipy_kwargs['updating'] = 'deferred'
+            self.minimization_result = differential_evolution(
+                            self._solve_new_simulation, [tuple(bounds)],
+                            workers=lambda func, xs: self._solve_batch(
+                                                    [xi[0] for xi in xs]),
+                            **scipy_kwargs)
+            self._log_minimization_stats()
+            return
+        
+        n_starts = scipy_kwargs.pop('n_starts', 4)
+        if x0 is None:
+            if bounds is None:
+                raise ValueError('Either `x0` or `bounds` must be given.')
+                return
+            x0 = np.linspace(bounds[0], bounds[1], n_starts + 2)[1:-1]
+        if not 'method' in scipy_kwargs:
+            scipy_kwargs['method'] = 'nelder-mead'
+        if bounds is not None and not 'bounds' in scipy_kwargs:
+            scipy_kwargs['bounds'] = [tuple(bounds)]
+        self.minimization_results = self._run_multistart(list(x0),
+                                                         scipy_kwargs)
+        self.minimization_result = min(self.minimization_results,
+                                       key=lambda r: r.fun)
+        self._log_minimization_stats()
+    
+    def _init_minimization(self, x, quantity_to_minimize, maximize_instead,
+                           processing_func, wdir_mode, jcm_geo_kwargs,
+                           jcm_solve_kwargs, cache_tolerance):
+        """Initializes the state of a minimization (see
+        `minimize_quantity`)."""
         self.logger.info('Starting minimization for {} as a function of {}'.
                          format(quantity_to_minimize, x))
         
-        self.finished_sim_numbers = []
+        # The simulations of previous minimizations stay finished, so that
+        # their results can be reused
+        if not hasattr(self, 'finished_sim_numbers'):
+            self.finished_sim_numbers = []
         self.failed_simulations = []
         self._run_args = dict(processing_func=processing_func, 
                               wdir_mode=wdir_mode,
@@ -3383,16 +6527,78 @@ class QuantityMinimizer(SimulationSet):
         
         self._current_x = x
         self._current_y = quantity_to_minimize
+        self._cache_tolerance = cache_tolerance
+        self._eval_cache = {}
+        self.n_cache_hits = 0
+        self.n_store_hits = 0
+    
+    def _log_minimization_stats(self):
+        """Logs the number of solved simulations and reused results of the
+        current minimization."""
+        self.logger.info('Finished minimization. Solved {} simulations, '.
+                         format(len(self._eval_cache) - self.n_store_hits) +
+                         'reused {} cached and {} stored results.'.format(
+                             self.n_cache_hits, self.n_store_hits))
+    
+    def _run_multistart(self, x0_list, scipy_minimize_kwargs):
+        """Runs `scipy.optimize.minimize` for each start value in `x0_list`
+        in a separate thread. The objective function of each thread posts its
+        value of `x` and waits for the result. As soon as all running
+        threads have posted a value, the values are solved as one batch in
+        the calling thread. Returns the list of the minimization results."""
+        import threading
+        from scipy.optimize import minimize
+        cond = threading.Condition()
+        requests = {}
+        replies = {}
+        active = set(range(len(x0_list)))
+        results = [None] * len(x0_list)
         
-        x0 = self._flat_keys[x]
+        def get_objective(i):
+            def objective(x):
+                with cond:
+                    requests[i] = x[0]
+                    cond.notify_all()
+                    while i not in replies:
+                        cond.wait()
+                    return replies.pop(i)
+            return objective
         
-        if not 'method' in scipy_minimize_kwargs:
-            scipy_minimize_kwargs['method'] = 'nelder-mead'
-        if not 'options' in scipy_minimize_kwargs:
-            scipy_minimize_kwargs['options'] = {'disp': True}
-
-        self.minimization_result = minimize(self._solve_new_simulation, x0,
-                                            **scipy_minimize_kwargs)
+        def minimize_from(i):
+            try:
+                results[i] = minimize(get_objective(i), x0_list[i],
+                                      **scipy_minimize_kwargs)
+            except Exception as e:
+                results[i] = e
+            finally:
+                with cond:
+                    active.discard(i)
+                    cond.notify_all()
+        
+        threads = [threading.Thread(target=minimize_from, args=(i,))
+                   for i in range(len(x0_list))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        while True:
+            with cond:
+                while len(active) > 0 and len(requests) < len(active):
+                    cond.wait()
+                if len(active) == 0:
+                    break
+                batch = sorted(requests.items())
+                requests.clear()
+            ys = self._solve_batch([value for _, value in batch])
+            with cond:
+                for (i, _), y in zip(batch, ys):
+                    replies[i] = y
+                cond.notify_all()
+        for thread in threads:
+            thread.join()
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return results
     
     def pickle_optimization_results(self, file_name='optimization_results.pkl'):
         file_ = os.path.join(self.storage_dir, file_name)
@@ -3405,20 +6611,64 @@ class QuantityMinimizer(SimulationSet):
     
     def _append_simulation(self, parameter, value):
         """Appends a new simulation to the simulation list with the updated 
-        `value` for `parameter`.
+        `value` for `parameter`. The geometry is only recomputed if
+        `parameter` is a geometry key or no geometry was computed yet.
         
         """
         self._flat_keys[parameter] = value
+        rerun_JCMgeo = parameter in self.geometry or \
+            not self._geometry_computed
+        if parameter not in self.geometry:
+            self._geometry_computed = True
+        
+        # The finished simulations must not cause a geometry computation
+        for sim in self.simulations:
+            if (sim.number in self.finished_sim_numbers or
+                    sim.number in self.excluded_sim_numbers):
+                sim.rerun_JCMgeo = False
         self.simulations.append(Simulation(number=self.current_sim_index,
-                                           keys=self._flat_keys,
+                                           keys=dict(self._flat_keys),
                                            stored_keys=self.stored_keys,
                                            storage_dir=self.storage_dir,
                                            project=self.project,
-                                           rerun_JCMgeo=True,
+                                           rerun_JCMgeo=rerun_JCMgeo,
                                            store_logs=self.store_logs))
         self.current_sim_index += 1
         self.num_sims += 1
     
+    def _get_cache_key(self, value):
+        """Returns the key of `value` in the evaluation cache, i.e. the value
+        rounded to multiples of the cache tolerance."""
+        if self._cache_tolerance > 0.:
+            return int(np.round(value / self._cache_tolerance))
+        return value
+    
+    def _lookup_store(self, parameter, value, quantity):
+        """Returns the stored result for `quantity` of a simulation with the
+        current fixed keys and `value` for `parameter` (within the cache
+        tolerance), or None if it is not in the HDF5 store."""
+        if self.is_store_empty():
+            return
+        data = self.get_store_data()
+        if quantity not in data.columns:
+            return
+        match = np.ones(len(data), dtype=bool)
+        for key in self.stored_keys:
+            if key not in data.columns:
+                return
+            if key == parameter:
+                match &= np.abs(data[key].values - value) <= \
+                    self._cache_tolerance / 2.
+            elif isinstance(self._flat_keys[key], Number):
+                match &= np.isclose(data[key].values, self._flat_keys[key])
+            else:
+                match &= data[key].values == self._flat_keys[key]
+        values = data[quantity].values[match]
+        values = values[pd.notnull(values)]
+        if len(values) == 0:
+            return
+        return values[0]
+    
     def _get_single_result_from_simulation(self, quantity, sim_index=-1):
         """Return the result for the given quantity of the simulation with
         index `sim_index`."""
@@ -3426,17 +6676,62 @@ class QuantityMinimizer(SimulationSet):
     
     def _solve_new_simulation(self, x):
         """Solves a new simulation with the value of `x` for the `_current_x`
-        parameter and returns the result for the `_current_y` quantity.
+        parameter and returns the result for the `_current_y` quantity. Known
+        results are taken from the evaluation cache or the HDF5 store.
         """
-        self.logger.info('Solving for {} = {}'.format(self._current_x, x[0]))
-        self._append_simulation(self._current_x, x)
-        with utils.DisableLogger():
-            self.run(**self._run_args)
-        y = self._get_single_result_from_simulation(self._current_y)
-        self.logger.info('... result {} = {}'.format(self._current_y, y))
+        return self._solve_batch([x[0]])[0]
+    
+    def _solve_batch(self, values):
+        """Returns the list of results for the `_current_y` quantity for the
+        list of `values` of the `_current_x` parameter (multiplied by -1 if
+        `_maximize_instead`). Known results are taken from the evaluation
+        cache or the HDF5 store. For all other values, new simulations are
+        appended and solved in a single run. The result of a failed
+        simulation is `np.inf`.
+        """
+        to_solve = collections.OrderedDict()
+        for value in values:
+            cache_key = self._get_cache_key(value)
+            if cache_key in self._eval_cache or cache_key in to_solve:
+                self.n_cache_hits += 1
+                continue
+            y = self._lookup_store(self._current_x, value, self._current_y)
+            if y is not None:
+                self.n_store_hits += 1
+                self.logger.info('Using stored result for {} = {}'.format(
+                                 self._current_x, value))
+                self._eval_cache[cache_key] = y
+            else:
+                to_solve[cache_key] = value
+        
+        if len(to_solve) > 0:
+            self.logger.info('Solving for {} = {}'.format(
+                        self._current_x, ', '.join([str(v) for v in
+                                                    to_solve.values()])))
+            for value in to_solve.values():
+                self._append_simulation(self._current_x, value)
+            new_sims = self.simulations[-len(to_solve):]
+            with utils.DisableLogger():
+                self.run(**self._run_args)
+            for cache_key, sim in zip(to_solve, new_sims):
+                # A failed simulation is not retried in the following runs
+                if sim.status == 'Failed':
+                    self.logger.warn('Simulation for {} = {} failed.'.format(
+                                     self._current_x,
+                                     sim.keys[self._current_x]))
+                    self.exclude_simulations([sim.number])
+                    y = np.inf if not self._maximize_instead else -np.inf
+                else:
+                    y = self._get_single_result_from_simulation(
+                                        self._current_y, sim_index=sim.number)
+                self.logger.info('... result {} = {}'.format(self._current_y,
+                                                             y))
+                self._eval_cache[cache_key] = y
+        
+        ys = [self._eval_cache[self._get_cache_key(v)] for v in values]
         if self._maximize_instead:
-            y *= -1
-        return y
+            ys = [-y for y in ys]
+        return ys
 
 
 if __name__ == "__main__":
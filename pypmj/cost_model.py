@@ -0,0 +1,234 @@
+"""Defines the `CostModel`-class, a simple regression model for the
+computational costs (e.g. `TotalTime`, `CpuTime` or memory) of simulations as
+a function of their keys. It is fitted on the computational costs which are
+stored in the HDF5 store for each finished simulation and is used for
+remaining time estimates and for the longest-processing-time-first
+submission order of `SimulationSet`.
+
+Authors : Carlo Barth
+
+"""
+
+import logging
+import numpy as np
+import pandas as pd
+from . import utils
+logger = logging.getLogger(__name__)
+
+# Names of columns which are written by
+# `utils.computational_costs_to_flat_dict` and which consequently must not be
+# used as features (refinement loop columns `<name>_<i>` are also excluded)
+KNOWN_COST_COLUMNS = ['AccumulatedCPUTime', 'AccumulatedTotalTime', 'CpuTime',
+                      'TotalTime', 'TotalMemory', 'TotalMemory_GB',
+                      'SystemMemory', 'SystemMemory_GB', 'Unknowns']
+
+# Cost columns holding the peak memory in GB, in order of preference
+MEMORY_COST_COLUMNS = ['TotalMemory_GB', 'SystemMemory_GB']
+
+
+def is_cost_column(column):
+    """Returns whether `column` is a computational cost column (see
+    `KNOWN_COST_COLUMNS`) or a lifecycle timing column (prefix 't_')."""
+    column = str(column)
+    if column.startswith('t_'):
+        return True
+    for name in KNOWN_COST_COLUMNS:
+        if column == name or column.startswith(name + '_'):
+            return True
+    return False
+
+
+# =============================================================================
+class CostModel(object):
+    """Regression model for a computational cost column as a function of the
+    simulation keys.
+
+    The model is a ridge regression on the standardized numerical keys
+    (features), their squares and (optionally) their pairwise products. As
+    computational costs are positive and typically grow exponentially or
+    polynomially with parameters such as the FEM degree or the number of
+    refinement steps, the logarithm of the target is fitted by default.
+    If too few samples are available for the full model, the quadratic and
+    interaction terms are dropped, and if even the linear model is
+    underdetermined, the (geometric) mean is used.
+
+    Parameters
+    ----------
+    target : str, default 'TotalTime'
+        Name of the cost column to model. Columns of the form `target_<i>`,
+        which are created for refinement loops, are summed up.
+    features : list or NoneType, default None
+        Keys (i.e. columns) to use as features. If None, all numerical columns
+        of the data passed to `fit` which are not cost columns are used.
+    degree : {1, 2}, default 2
+        Degree of the polynomial features.
+    interactions : bool, default True
+        Whether to add pairwise products of the features if `degree` is 2.
+    log_target : bool, default True
+        Whether to fit the logarithm of the target.
+    regularization : float, default 1.e-6
+        Ridge regularization parameter.
+
+    """
+
+    def __init__(self, target='TotalTime', features=None, degree=2,
+                 interactions=True, log_target=True, regularization=1.e-6):
+        self.logger = logging.getLogger('cost_model.' +
+                                        self.__class__.__name__)
+        if degree not in [1, 2]:
+            raise ValueError('`degree` must be 1 or 2.')
+            return
+        self.target = target
+        self.features = features
+        self.degree = degree
+        self.interactions = interactions
+        self.log_target = log_target
+        self.regularization = regularization
+        self.n_samples = 0
+        self._coefficients = None
+
+    def __repr__(self):
+        return 'CostModel(target={}, features={}, n_samples={})'.format(
+            self.target, self.features, self.n_samples)
+
+    @property
+    def is_fitted(self):
+        """Whether the model was fitted successfully."""
+        return self._coefficients is not None
+
+    def _get_target(self, data):
+        """Returns the target values for all rows of the DataFrame `data`."""
+        return utils.sum_refinement_values(data, self.target)
+
+    def _infer_features(self, data, exclude):
+        """Returns all numerical columns of `data` which are not in
+        `exclude`."""
+        features = []
+        for col in data.columns:
+            if col in exclude:
+                continue
+            if pd.api.types.is_numeric_dtype(data[col]) and \
+                    not pd.api.types.is_bool_dtype(data[col]):
+                features.append(col)
+        return features
+
+    def _design_matrix(self, X, degree, interactions):
+        """Returns the design matrix for the standardized features `X`."""
+        columns = [np.ones(X.shape[0])]
+        n_feat = X.shape[1]
+        for i in range(n_feat):
+            columns.append(X[:, i])
+        if degree == 2:
+            for i in range(n_feat):
+                columns.append(X[:, i]**2)
+            if interactions:
+                for i in range(n_feat):
+                    for j in range(i + 1, n_feat):
+                        columns.append(X[:, i] * X[:, j])
+        return np.column_stack(columns)
+
+    def _standardize(self, data):
+        X = data.loc[:, self.features].values.astype(float)
+        return (X - self._mean) / self._std
+
+    def fit(self, data, exclude=None):
+        """Fits the model to the DataFrame `data`, which must contain the
+        feature columns and the target column(s), e.g. the data in the HDF5
+        store of a `SimulationSet`. Rows with missing or non-positive target
+        values (if `log_target` is True) are ignored. `exclude` is an
+        optional list of columns which should not be used as features if
+        `features` is None. Returns the instance itself.
+        """
+        y = self._get_target(data)
+        valid = np.isfinite(y.values.astype(float))
+        if self.log_target:
+            valid &= y.values.astype(float) > 0.
+        data = data[valid]
+        y = y.values[valid].astype(float)
+
+        if self.features is None:
+            ignore = set(['wdir'])
+            if exclude is not None:
+                ignore.update(exclude)
+            # Computational costs are not features
+            ignore.update([c for c in data.columns if is_cost_column(c)])
+            self.features = self._infer_features(data, ignore)
+        missing = [f for f in self.features if f not in data.columns]
+        if len(missing) > 0:
+            raise ValueError('The features {} are missing in the data.'.
+                             format(missing))
+            return
+
+        self.n_samples = len(y)
+        if self.n_samples == 0:
+            self.logger.warn('No valid samples to fit the cost model for {}.'.
+                             format(self.target))
+            self._coefficients = None
+            return self
+
+        # Standardize the features, ignoring constant columns
+        X = data.loc[:, self.features].values.astype(float)
+        self._mean = X.mean(axis=0)
+        std = X.std(axis=0)
+        self._varying = std > 0.
+        std[~self._varying] = 1.
+        self._std = std
+        X = (X - self._mean) / self._std
+        X = X[:, self._varying]
+
+        # Choose the most complex model which is well-determined
+        self._degree = self.degree
+        self._interactions = self.interactions
+        A = self._design_matrix(X, self._degree, self._interactions)
+        if A.shape[1] > self.n_samples and self._interactions:
+            self._interactions = False
+            A = self._design_matrix(X, self._degree, self._interactions)
+        if A.shape[1] > self.n_samples:
+            self._degree = 1
+            A = self._design_matrix(X, self._degree, self._interactions)
+        if A.shape[1] > self.n_samples:
+            # Only use the mean value
+            A = A[:, :1]
+            self._varying[:] = False
+
+        yt = np.log(y) if self.log_target else y
+
+        # Ridge regression by solving the augmented least squares problem.
+        # The intercept is not regularized.
+        reg = np.sqrt(self.regularization) * np.eye(A.shape[1])
+        reg[0, 0] = 0.
+        A_aug = np.vstack([A, reg])
+        y_aug = np.concatenate([yt, np.zeros(A.shape[1])])
+        self._coefficients = np.linalg.lstsq(A_aug, y_aug, rcond=None)[0]
+
+        # Residual standard deviation (in the fitted space)
+        residuals = yt - A.dot(self._coefficients)
+        dof = max(self.n_samples - A.shape[1], 1)
+        self.residual_std = np.sqrt(np.sum(residuals**2) / dof)
+        self.logger.debug('Fitted {} on {} samples (residual std: {:.3g})'.
+                          format(self, self.n_samples, self.residual_std))
+        return self
+
+    def predict(self, data):
+        """Returns the predicted costs for all rows of the DataFrame `data`
+        (which must contain the feature columns) as a numpy array."""
+        if not self.is_fitted:
+            raise RuntimeError('The cost model is not fitted yet.')
+            return
+        X = self._standardize(data)[:, self._varying]
+        A = self._design_matrix(X, self._degree, self._interactions)
+        A = A[:, :len(self._coefficients)]
+        prediction = A.dot(self._coefficients)
+        if self.log_target:
+            return np.exp(prediction)
+        return prediction
+
+    def predict_interval(self, data, n_std=2.):
+        """Returns a tuple of arrays (lower, upper) bounding the predicted
+        costs by `n_std` residual standard deviations."""
+        prediction = self.predict(data)
+        delta = n_std * self.residual_std
+        if self.log_target:
+            return prediction * np.exp(-delta), prediction * np.exp(delta)
+        return prediction - delta, prediction + delta
+
@@ -284,12 +284,7 @@ class FarFieldEvaluation(object):
         necessary post-processes if not. Afterwards, it executes the standard
         far field processing (using the `_process_far_field_data`-method).
         """
-        self.logger.debug('Analyzing far field...')
-        if 'run_post_process_files' in simulation_solve_kwargs:
-            self.logger.debug('Deleting forbidden keywordarg ' +
-                              '"run_post_process_files" from ' +
-                              '`simulation_solve_kwargs`')
-            del simulation_solve_kwargs['run_post_process_files']
+        self._prepare_analysis(simulation_solve_kwargs)
         if not self._check_result_file_existence():
             self.logger.debug('Solving unfinished simulation {}'.
                               format(self.simulation))
@@ -298,6 +293,51 @@ class FarFieldEvaluation(object):
                                     run_post_process_files=self._jcmp_files,
                                     **simulation_solve_kwargs)
         self._process_far_field_data()
+
+    def submit(self, **simulation_solve_kwargs):
+        """Non-blocking version of `analyze_far_field`, which returns a
+        `concurrent.futures.Future`. It is set to this `FarFieldEvaluation`
+        once the far field is analyzed, so that several far field
+        evaluations can run in parallel (see `Simulation.submit`). Requires
+        the new daemon interface.
+        """
+        from pypmj.harvester import new_future
+        self._prepare_analysis(simulation_solve_kwargs)
+        future = new_future()
+        if self._check_result_file_existence():
+            try:
+                self._process_far_field_data()
+                future.set_result(self)
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        self.logger.debug('Submitting unfinished simulation {}'.
+                          format(self.simulation))
+        self._generate_jcmp_files()
+        sim_future = self.simulation.submit(
+                                    run_post_process_files=self._jcmp_files,
+                                    **simulation_solve_kwargs)
+
+        def _on_simulation_done(sim_future):
+            try:
+                sim_future.result()
+                self._process_far_field_data()
+                future.set_result(self)
+            except Exception as e:
+                future.set_exception(e)
+
+        sim_future.add_done_callback(_on_simulation_done)
+        return future
+
+    def _prepare_analysis(self, simulation_solve_kwargs):
+        """Removes forbidden keyword arguments from the
+        `simulation_solve_kwargs` (in place)."""
+        self.logger.debug('Analyzing far field...')
+        if 'run_post_process_files' in simulation_solve_kwargs:
+            self.logger.debug('Deleting forbidden keywordarg ' +
+                              '"run_post_process_files" from ' +
+                              '`simulation_solve_kwargs`')
+            del simulation_solve_kwargs['run_post_process_files']
     
     def surface_transmission(self, nt, direction='down'):
         """Computes the transmittance (.transmittance['up/down']), the
@@ -0,0 +1,157 @@
+"""Defines the `JobHarvester`, which provides `concurrent.futures.Future`s
+for jobs submitted to the JCMdaemon. A single background thread waits for all
+watched jobs using `daemon.wait` with the job IDs of interest and sets the
+result of the future belonging to each finished job. This way, independent
+jobs (e.g. of `Simulation.submit`) can run in parallel and be composed using
+the standard futures tooling (`concurrent.futures.wait`, `as_completed`,
+callbacks), instead of blocking on a `daemon.wait` for all pending jobs.
+
+All calls to the daemon of the harvester thread and of `JobHarvester.submit`
+are serialized with the other calls to the daemon client using the
+`pypmj.parallelization.DAEMON_LOCK`, which is the `lock` of the harvester.
+Running a `SimulationSet` from another thread while futures are pending is
+not supported.
+
+Needs the new daemon interface. On Python 2, the `futures` backport must be
+installed.
+
+Authors : Carlo Barth
+
+"""
+
+import logging
+import threading
+from pypmj import daemon
+from pypmj.parallelization import DAEMON_LOCK
+try:
+    from concurrent.futures import Future
+except ImportError:
+    Future = None
+logger = logging.getLogger(__name__)
+
+# The shared harvester (see `get_harvester`)
+_harvester = None
+_harvester_lock = threading.Lock()
+
+
+def get_harvester():
+    """Returns the `JobHarvester` which is shared by all `Simulation`s,
+    creating it if necessary."""
+    global _harvester
+    with _harvester_lock:
+        if _harvester is None:
+            _harvester = JobHarvester()
+        return _harvester
+
+
+def new_future():
+    """Returns a new `concurrent.futures.Future` in the running state, i.e. it
+    cannot be cancelled, as a job cannot be cancelled in the daemon."""
+    if Future is None:
+        raise ImportError('`concurrent.futures` is not available. On ' +
+                          'Python 2, please install the `futures` backport.')
+        return
+    future = Future()
+    future.set_running_or_notify_cancel()
+    return future
+
+
+# =============================================================================
+class JobHarvester(object):
+    """Waits for jobs of the JCMdaemon in a background thread and sets the
+    results of the corresponding futures. The thread is started when the first
+    job is watched and stops as soon as no watched job is left.
+
+    Parameters
+    ----------
+    poll_interval : float, default 0.2
+        Maximum time in seconds the harvester thread waits in a single call
+        to `daemon.wait`. The `lock` is released between these calls, so
+        that new jobs can be submitted.
+
+    """
+
+    def __init__(self, poll_interval=0.2):
+        self.logger = logging.getLogger('harvester.' +
+                                        self.__class__.__name__)
+        self.poll_interval = poll_interval
+        self.lock = DAEMON_LOCK
+        self._state_lock = threading.Lock()
+        self._futures = {}
+        self._resultbags = {}
+        self._thread = None
+
+    def __repr__(self):
+        return 'JobHarvester({} jobs watched)'.format(len(self._futures))
+
+    def submit(self, solve_func, resultbag=None, **kwargs):
+        """Calls `solve_func` with the `kwargs` while holding the `lock` and
+        returns a future for the job with the job ID returned by `solve_func`
+        (e.g. `Simulation.solve`). The `resultbag` is used in `daemon.wait`
+        (see `watch`)."""
+        with self.lock:
+            job_id = solve_func(**kwargs)
+        return self.watch(job_id, resultbag)
+
+    def watch(self, job_id, resultbag=None):
+        """Returns a future which is set to the result of the job with ID
+        `job_id`, in the format of the new `daemon.wait` (i.e. a dict with
+        the keys 'logs' and 'results'). If `daemon.wait` raises an
+        exception, it is set on the futures of all watched jobs."""
+        future = new_future()
+        with self._state_lock:
+            self._futures[job_id] = future
+            self._resultbags[job_id] = resultbag
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                name='pypmj-harvester')
+                self._thread.daemon = True
+                self._thread.start()
+        return future
+
+    def _get_job_groups(self):
+        """Returns a list of tuples of a resultbag and the watched job IDs
+        which use it, or an empty list (and marks the thread as stopped) if
+        no job is watched anymore."""
+        with self._state_lock:
+            if len(self._futures) == 0:
+                self._thread = None
+                return []
+            groups = {}
+            for job_id, resultbag in self._resultbags.items():
+                groups.setdefault(id(resultbag), (resultbag, []))[1].append(
+                                                                        job_id)
+            return list(groups.values())
+
+    def _pop_future(self, job_id):
+        """Removes the job with ID `job_id` from the watched jobs and returns
+        its future."""
+        with self._state_lock:
+            del self._resultbags[job_id]
+            return self._futures.pop(job_id)
+
+    def _run(self):
+        """Target of the harvester thread."""
+        while True:
+            groups = self._get_job_groups()
+            if len(groups) == 0:
+                return
+            timeout = self.poll_interval / len(groups)
+            for resultbag, job_ids in groups:
+                wait_kwargs = {}
+                if resultbag is not None:
+                    wait_kwargs['resultbag'] = resultbag
+                try:
+                    with self.lock:
+                        results, _ = daemon.wait(job_ids,
+                                                 break_condition='any',
+                                                 timeout=timeout,
+                                                 **wait_kwargs)
+                except Exception as e:
+                    self.logger.warn('Waiting for jobs {} failed: {}'.format(
+                                     job_ids, e))
+                    for job_id in job_ids:
+                        self._pop_future(job_id).set_exception(e)
+                    continue
+                for job_id, result in results.items():
+                    self._pop_future(job_id).set_result(result)
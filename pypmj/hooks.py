@@ -0,0 +1,341 @@
+"""Defines a simple hook (or event) system which allows to attach code to the
+events occurring during the execution of a `SimulationSet`, e.g. to profile
+or monitor production runs without subclassing. Ready-made hooks for
+profiling (`ProfilerHook`) and memory tracking (`MemoryTrackerHook`) are
+provided.
+
+Authors : Carlo Barth
+
+"""
+
+from collections import OrderedDict
+import logging
+import os
+from . import utils
+logger = logging.getLogger(__name__)
+
+# All known events. Hooks for the set-level events ('on_schedule',
+# 'on_run_start' and 'on_run_end') are called with the `SimulationSet` as the
+# only argument. All other hooks are called with the `SimulationSet` and the
+# `Simulation` as arguments.
+HOOK_EVENTS = ['on_schedule', 'on_run_start', 'on_geometry', 'on_submit',
+               'on_finish', 'on_failed', 'on_processed', 'on_stored',
+               'on_run_end']
+
+
+# =============================================================================
+class Hook(object):
+    """Base class for hooks which handle multiple events. Subclasses override
+    the methods named like the events in `HOOK_EVENTS` they are interested in
+    and are added to a `HookRegistry` using its `add`-method.
+
+    """
+
+    def on_schedule(self, simuset):
+        pass
+
+    def on_run_start(self, simuset):
+        pass
+
+    def on_geometry(self, simuset, simulation):
+        pass
+
+    def on_submit(self, simuset, simulation):
+        pass
+
+    def on_finish(self, simuset, simulation):
+        pass
+
+    def on_failed(self, simuset, simulation):
+        pass
+
+    def on_processed(self, simuset, simulation):
+        pass
+
+    def on_stored(self, simuset, simulation):
+        pass
+
+    def on_run_end(self, simuset):
+        pass
+
+
+# =============================================================================
+class HookRegistry(object):
+    """Holds the callbacks for the events in `HOOK_EVENTS` and triggers them.
+
+    Exceptions raised by a callback are logged, but do not interrupt the
+    execution, so that a broken hook does not spoil a long simulation run.
+
+    Parameters
+    ----------
+    hooks : Hook, sequence or NoneType, default None
+        `Hook`-instance(s) to add on initialization.
+
+    """
+
+    def __init__(self, hooks=None):
+        self.logger = logging.getLogger('hooks.' + self.__class__.__name__)
+        self._callbacks = OrderedDict([(e, []) for e in HOOK_EVENTS])
+        self._hooks = []
+        if isinstance(hooks, Hook):
+            hooks = [hooks]
+        if hooks is not None:
+            for hook in hooks:
+                self.add(hook)
+
+    def __repr__(self):
+        return 'HookRegistry({})'.format(
+            {e: len(c) for e, c in self._callbacks.items() if len(c) > 0})
+
+    def __len__(self):
+        return sum([len(c) for c in self._callbacks.values()])
+
+    def _check_event(self, event):
+        if event not in HOOK_EVENTS:
+            raise ValueError('Unknown event: {}. Known events are: {}'.
+                             format(event, HOOK_EVENTS))
+            return
+
+    def register(self, event, callback):
+        """Registers the callable `callback` for `event`."""
+        self._check_event(event)
+        if not callable(callback):
+            raise TypeError('`callback` must be callable.')
+            return
+        self._callbacks[event].append(callback)
+
+    def unregister(self, event, callback):
+        """Removes the `callback` for `event`."""
+        self._check_event(event)
+        if callback in self._callbacks[event]:
+            self._callbacks[event].remove(callback)
+
+    def add(self, hook):
+        """Adds a `Hook`-instance, i.e. registers all its methods which are
+        named like an event. Methods which are not overridden from the `Hook`
+        base class are ignored."""
+        for event in HOOK_EVENTS:
+            method = getattr(hook, event, None)
+            if method is None:
+                continue
+            if isinstance(hook, Hook):
+                if getattr(type(hook), event) is getattr(Hook, event):
+                    continue
+            self.register(event, method)
+        self._hooks.append(hook)
+
+    def remove(self, hook):
+        """Removes a `Hook`-instance that was added using `add`."""
+        for event in HOOK_EVENTS:
+            method = getattr(hook, event, None)
+            if method is not None:
+                self.unregister(event, method)
+        if hook in self._hooks:
+            self._hooks.remove(hook)
+
+    def get_hooks(self):
+        """Returns a list of the `Hook`-instances that were added."""
+        return list(self._hooks)
+
+    def clear(self):
+        """Removes all callbacks and hooks."""
+        for event in HOOK_EVENTS:
+            self._callbacks[event] = []
+        self._hooks = []
+
+    def has_callbacks(self, event):
+        """Returns whether any callback is registered for `event`."""
+        return len(self._callbacks[event]) > 0
+
+    def trigger(self, event, *args):
+        """Calls all callbacks registered for `event` with the arguments
+        `args`."""
+        for callback in self._callbacks[event]:
+            try:
+                callback(*args)
+            except Exception:
+                self.logger.exception('Hook {} for event {} failed.'.format(
+                                      callback, event))
+
+
+# =============================================================================
+class ProfilerHook(Hook):
+    """Profiles the driver process (i.e. the python process executing the
+    `SimulationSet`) between the start and the end of a run.
+
+    Parameters
+    ----------
+    backend : {'cprofile', 'pyinstrument'}, default 'cprofile'
+        The profiler to use. 'cprofile' uses the deterministic profiler of the
+        standard library, 'pyinstrument' the sampling profiler of the
+        `pyinstrument` package (must be installed).
+    output_file : str (file path) or NoneType, default None
+        If given, the profiling results are written to this file at the end
+        of the run. For 'cprofile', the stats are dumped in the binary format
+        of the `pstats` module. For 'pyinstrument', an HTML report is written
+        if the extension is '.html', a text report otherwise.
+    sort_by : str, default 'cumulative'
+        Sort key for the text report of the 'cprofile' backend (see
+        `pstats.Stats.sort_stats`).
+    n_lines : int, default 30
+        Number of lines of the text report of the 'cprofile' backend.
+
+    The text report of the last run is available using `get_report`.
+
+    """
+
+    BACKENDS = ['cprofile', 'pyinstrument']
+
+    def __init__(self, backend='cprofile', output_file=None,
+                 sort_by='cumulative', n_lines=30):
+        self.logger = logging.getLogger('hooks.' + self.__class__.__name__)
+        if backend not in self.BACKENDS:
+            raise ValueError('Unknown backend: {}. Use one of {}'.format(
+                             backend, self.BACKENDS))
+            return
+        if backend == 'pyinstrument':
+            try:
+                import pyinstrument
+            except ImportError:
+                raise ImportError('The `pyinstrument` package is needed for' +
+                                  ' the pyinstrument backend.')
+                return
+        self.backend = backend
+        self.output_file = output_file
+        self.sort_by = sort_by
+        self.n_lines = n_lines
+        self.profiler = None
+        self._report = None
+
+    def on_run_start(self, simuset):
+        if self.backend == 'cprofile':
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        else:
+            from pyinstrument import Profiler
+            self.profiler = Profiler()
+            self.profiler.start()
+
+    def on_run_end(self, simuset):
+        if self.profiler is None:
+            return
+        if self.backend == 'cprofile':
+            self.profiler.disable()
+            import pstats
+            stream = utils.StringIO()
+            stats = pstats.Stats(self.profiler, stream=stream)
+            stats.sort_stats(self.sort_by).print_stats(self.n_lines)
+            self._report = stream.getvalue()
+            if self.output_file is not None:
+                self.profiler.dump_stats(self.output_file)
+        else:
+            self.profiler.stop()
+            self._report = self.profiler.output_text()
+            if self.output_file is not None:
+                if os.path.splitext(self.output_file)[1] == '.html':
+                    content = self.profiler.output_html()
+                else:
+                    content = self._report
+                with open(self.output_file, 'w') as f:
+                    f.write(content)
+        self.logger.debug('Profiling report:\n{}'.format(self._report))
+
+    def get_report(self):
+        """Returns the text report of the last profiled run (None if no run
+        was profiled yet)."""
+        return self._report
+
+
+# =============================================================================
+class MemoryTrackerHook(Hook):
+    """Tracks the memory allocated by the driver process during a run using
+    `tracemalloc` snapshots (only available in Python 3).
+
+    A snapshot is taken at the start and the end of the run, and after every
+    `interval` stored simulations. The current and peak traced memory at these
+    points are available in the `records`-attribute (a list of dicts), and the
+    statistics of the largest allocation differences between the first and
+    the last snapshot can be obtained using `get_top_stats`.
+
+    Parameters
+    ----------
+    interval : int or NoneType, default 100
+        Take a snapshot after every `interval` stored simulations. If None,
+        snapshots are only taken at the start and the end of the run.
+    n_frames : int, default 1
+        Number of frames that are stored for each traceback (see
+        `tracemalloc.start`).
+    key_type : str, default 'lineno'
+        Key type used to group the statistics (see
+        `tracemalloc.Snapshot.statistics`).
+    keep_snapshots : bool, default False
+        Whether to keep all snapshots in the `snapshots`-attribute. Otherwise,
+        only the first and the last snapshot are kept.
+
+    """
+
+    def __init__(self, interval=100, n_frames=1, key_type='lineno',
+                 keep_snapshots=False):
+        self.logger = logging.getLogger('hooks.' + self.__class__.__name__)
+        try:
+            import tracemalloc
+        except ImportError:
+            raise ImportError('`tracemalloc` is not available. Memory ' +
+                              'tracking needs Python 3.4 or higher.')
+            return
+        self._tracemalloc = tracemalloc
+        self.interval = interval
+        self.n_frames = n_frames
+        self.key_type = key_type
+        self.keep_snapshots = keep_snapshots
+        self.records = []
+        self.snapshots = []
+        self._n_stored = 0
+        self._started_tracing = False
+
+    def _take_snapshot(self, event):
+        current, peak = self._tracemalloc.get_traced_memory()
+        self.records.append({'event': event, 'n_stored': self._n_stored,
+                             'current_MB': current / 1.e6,
+                             'peak_MB': peak / 1.e6})
+        snapshot = self._tracemalloc.take_snapshot()
+        if self.keep_snapshots or len(self.snapshots) < 2:
+            self.snapshots.append(snapshot)
+        else:
+            self.snapshots[-1] = snapshot
+
+    def on_run_start(self, simuset):
+        self.records = []
+        self.snapshots = []
+        self._n_stored = 0
+        if not self._tracemalloc.is_tracing():
+            self._tracemalloc.start(self.n_frames)
+            self._started_tracing = True
+        self._take_snapshot('on_run_start')
+
+    def on_stored(self, simuset, simulation):
+        self._n_stored += 1
+        if self.interval is not None and self._n_stored % self.interval == 0:
+            self._take_snapshot('on_stored')
+
+    def on_run_end(self, simuset):
+        if not self._tracemalloc.is_tracing():
+            return
+        self._take_snapshot('on_run_end')
+        if self._started_tracing:
+            self._tracemalloc.stop()
+            self._started_tracing = False
+        self.logger.debug(('Memory usage at end of run: {:.2f} MB (peak: ' +
+                           '{:.2f} MB)').format(self.records[-1]['current_MB'],
+                                                self.records[-1]['peak_MB']))
+
+    def get_top_stats(self, limit=10):
+        """Returns the `limit` largest allocation differences between the
+        first and the last snapshot as a list of `tracemalloc.StatisticDiff`
+        instances."""
+        if len(self.snapshots) < 2:
+            return []
+        stats = self.snapshots[-1].compare_to(self.snapshots[0],
+                                              self.key_type)
+        return stats[:limit]
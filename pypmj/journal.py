@@ -0,0 +1,136 @@
+"""Defines the `SubmissionJournal`, a write-ahead journal of the job
+submissions of a `SimulationSet`. It records each submission (simulation
+number, job ID, working directory) and each completion in an append-only
+JSON-lines file in the storage directory. If the driver process dies during a
+run, the next `SimulationSet.run` uses the journal to harvest the results of
+jobs which finished in the meantime from their working directories instead of
+recomputing them. Jobs which are still running can only be reattached within
+the same driver process (e.g. after a KeyboardInterrupt), which is checked
+using the process ID stored in each record. After a real crash of the driver
+process, unfinished jobs are resubmitted.
+
+The journal is removed at the end of a run which did not leave any open
+submissions, so that it only persists after an interrupted run.
+
+Authors : Carlo Barth
+
+"""
+
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+import time
+from .hooks import Hook
+logger = logging.getLogger(__name__)
+
+# Name of the journal file in the storage directory
+JOURNAL_FILE_NAME = 'submission_journal.jsonl'
+
+
+def get_keys_hash(simulation):
+    """Returns a hash of the stored keys of `simulation`, which is used to
+    check that a journal record belongs to the same simulation as in the
+    current schedule."""
+    items = sorted([(k, str(simulation.keys[k]))
+                    for k in simulation.stored_keys if k in simulation.keys])
+    return hashlib.sha1(repr(items).encode('utf-8')).hexdigest()
+
+
+# =============================================================================
+class SubmissionJournal(Hook):
+    """Append-only journal of the submissions and completions of the
+    simulations of a `SimulationSet`. It is added to the hooks of the
+    `SimulationSet` during a run (see the `journal` argument of
+    `SimulationSet.run`).
+
+    Each line of the journal file is a JSON object with the keys 'event'
+    ('submit', 'stored' or 'failed'), 'number', 'job_id', 'wdir', 'hash'
+    (see `get_keys_hash`), 'pid' and 'time'.
+
+    Parameters
+    ----------
+    file_path : str (file path)
+        Path of the journal file.
+    fsync : bool, default False
+        Whether to force each record to disk using `os.fsync`. Otherwise,
+        records are only flushed, which protects against crashes of the
+        driver process but not of the operating system.
+
+    """
+
+    def __init__(self, file_path, fsync=False):
+        self.logger = logging.getLogger('journal.' + self.__class__.__name__)
+        self.file_path = file_path
+        self.fsync = fsync
+        self._file = None
+
+    def __repr__(self):
+        return 'SubmissionJournal({})'.format(self.file_path)
+
+    def _write(self, event, simulation):
+        """Appends a record for the `event` of `simulation`."""
+        if self._file is None:
+            self._file = open(self.file_path, 'a')
+        record = {'event': event,
+                  'number': simulation.number,
+                  'job_id': simulation.job_id,
+                  'wdir': simulation.working_dir(),
+                  'hash': get_keys_hash(simulation),
+                  'pid': os.getpid(),
+                  'time': time.time()}
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def on_submit(self, simuset, simulation):
+        self._write('submit', simulation)
+
+    def on_stored(self, simuset, simulation):
+        self._write('stored', simulation)
+
+    def on_failed(self, simuset, simulation):
+        self._write('failed', simulation)
+
+    def read(self):
+        """Returns the list of all records in the journal file. Lines which
+        cannot be decoded (e.g. a truncated last line) are skipped."""
+        if not os.path.isfile(self.file_path):
+            return []
+        records = []
+        with open(self.file_path, 'r') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    self.logger.debug('Skipping invalid journal line: {}'.
+                                      format(line.strip()))
+        return records
+
+    def get_open_submissions(self):
+        """Returns an OrderedDict which maps the simulation numbers to the
+        records of their last submission, for all submissions without a
+        completion record."""
+        open_submissions = OrderedDict()
+        for record in self.read():
+            number = record['number']
+            if record['event'] == 'submit':
+                open_submissions[number] = record
+            elif (number in open_submissions and
+                  open_submissions[number]['job_id'] == record['job_id']):
+                del open_submissions[number]
+        return open_submissions
+
+    def close(self):
+        """Closes the journal file."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def remove(self):
+        """Closes and deletes the journal file."""
+        self.close()
+        if os.path.isfile(self.file_path):
+            os.remove(self.file_path)
@@ -0,0 +1,300 @@
+"""Defines the `MetricsExporter`-hook, which collects live metrics of a
+running `SimulationSet` (jobs in flight, completed, failed and skipped
+simulations, throughput, per-resource completion rates, store write latency
+and ETA) and periodically exports them to a Prometheus textfile and/or a JSON
+file. This allows to monitor headless runs, e.g. on a cluster, using
+dashboards and alerting.
+
+Usage:
+
+    >>> exporter = MetricsExporter(prometheus_file='/var/lib/node_exporter/' +
+    ...                            'textfile/pypmj.prom', interval=30.)
+    >>> simuset.hooks.add(exporter)
+    >>> simuset.run()
+
+Authors : Carlo Barth
+
+"""
+
+from collections import OrderedDict
+import json
+import logging
+import numpy as np
+import os
+from threading import Lock
+from .hooks import Hook
+from .jupyter_tools import PerpetualTimer
+from . import utils
+logger = logging.getLogger(__name__)
+
+
+def _write_atomically(file_path, content):
+    """Writes `content` to a temporary file in the directory of `file_path`
+    and renames it afterwards, so that readers never see partial files."""
+    tmp_path = file_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(content)
+    try:
+        os.rename(tmp_path, file_path)
+    except OSError:
+        # `os.rename` fails on Windows if the target exists
+        if os.path.isfile(file_path):
+            os.remove(file_path)
+        os.rename(tmp_path, file_path)
+
+
+def _escape_label_value(value):
+    """Escapes a label value for the Prometheus text format."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace(
+                                                                '\n', '\\n')
+
+
+# =============================================================================
+class MetricsExporter(Hook):
+    """Hook that collects live metrics of a `SimulationSet`-run and exports
+    them periodically.
+
+    The metrics are updated by the run loop through the hook events, while
+    the export happens in a background timer thread every `interval` seconds
+    and at the end of the run. The current metrics can also be obtained using
+    `get_metrics`.
+
+    Parameters
+    ----------
+    prometheus_file : str (file path) or NoneType, default None
+        Path of the file to which the metrics are written in the Prometheus
+        text format (e.g. for the textfile collector of the node exporter).
+        The file name should have the extension '.prom'.
+    json_file : str (file path) or NoneType, default None
+        Path of the file to which the metrics are written in JSON format.
+    interval : float, default 10.
+        Time interval in seconds at which the files are updated.
+    prefix : str, default 'pypmj'
+        Prefix for the names of the Prometheus metrics.
+    labels : dict or NoneType, default None
+        Additional labels for all Prometheus metrics. A label `storage_dir`
+        containing the storage directory of the `SimulationSet` is always
+        added.
+
+    """
+
+    def __init__(self, prometheus_file=None, json_file=None, interval=10.,
+                 prefix='pypmj', labels=None):
+        self.logger = logging.getLogger('metrics.' + self.__class__.__name__)
+        if prometheus_file is None and json_file is None:
+            self.logger.warn('Neither `prometheus_file` nor `json_file` is ' +
+                             'set. Metrics are only available using ' +
+                             '`get_metrics`.')
+        self.prometheus_file = prometheus_file
+        self.json_file = json_file
+        self.interval = interval
+        self.prefix = prefix
+        if labels is None:
+            labels = {}
+        self.labels = labels
+        self._lock = Lock()
+        self._timer = None
+        self._reset()
+
+    def _reset(self, simuset=None):
+        self._simuset = simuset
+        self._t_start = utils.monotonic()
+        self._t_end = None
+        self.n_total = 0
+        self.n_skipped = 0
+        self.n_submitted = 0
+        self.n_completed = 0
+        self.n_failed = 0
+        self.n_stored = 0
+        self._resource_counts = {}
+        # Running statistics of the store write latency (last, sum, max)
+        self._latency = [np.nan, 0., np.nan]
+
+    # Hook events
+    # -------------------------------------------------------------------------
+    def on_run_start(self, simuset):
+        with self._lock:
+            self._reset(simuset)
+            self.n_total = simuset.num_sims
+            # The simulations which are already in the store, excluded or
+            # derived from others (which does not trigger any hooks)
+            self.n_skipped = simuset.num_sims - simuset.num_sims_to_do()
+        self.export()
+        if self.interval is not None and self.interval > 0:
+            self._timer = PerpetualTimer(self.interval, self.export)
+            self._timer.start()
+
+    def on_submit(self, simuset, simulation):
+        with self._lock:
+            self.n_submitted += 1
+
+    def on_finish(self, simuset, simulation):
+        with self._lock:
+            self.n_completed += 1
+            resource = str(getattr(simulation, 'resource_id', 'unknown'))
+            self._resource_counts[resource] = \
+                                    self._resource_counts.get(resource, 0) + 1
+
+    def on_failed(self, simuset, simulation):
+        with self._lock:
+            self.n_failed += 1
+
+    def on_stored(self, simuset, simulation):
+        ts = simulation.timestamps
+        with self._lock:
+            self.n_stored += 1
+            if 'store_start' in ts and 'store_end' in ts:
+                latency = ts['store_end'] - ts['store_start']
+                self._latency[0] = latency
+                self._latency[1] += latency
+                self._latency[2] = np.nanmax([self._latency[2], latency])
+
+    def on_run_end(self, simuset):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        with self._lock:
+            self._t_end = utils.monotonic()
+        self.export()
+
+    # Metrics
+    # -------------------------------------------------------------------------
+    def get_metrics(self):
+        """Returns the current metrics as a dict."""
+        with self._lock:
+            if self._t_end is None:
+                t_elapsed = utils.monotonic() - self._t_start
+            else:
+                t_elapsed = self._t_end - self._t_start
+            minutes = max(t_elapsed, 1.e-9) / 60.
+            # Failed simulations may be resubmitted, so we count only the ones
+            # that are currently outstanding
+            in_flight = max(self.n_submitted - self.n_completed -
+                            self.n_failed, 0)
+            remaining = max(self.n_total - self.n_skipped - self.n_completed,
+                            0)
+            throughput = self.n_completed / minutes
+            if remaining == 0 or self._t_end is not None:
+                eta = 0.
+            elif throughput > 0.:
+                eta = remaining / throughput * 60.
+            else:
+                eta = np.nan
+            if self.n_stored > 0:
+                mean_latency = self._latency[1] / self.n_stored
+            else:
+                mean_latency = np.nan
+            latency = OrderedDict([('last', float(self._latency[0])),
+                                   ('mean', float(mean_latency)),
+                                   ('max', float(self._latency[2]))])
+            resources = OrderedDict()
+            for r in sorted(self._resource_counts):
+                n = self._resource_counts[r]
+                resources[r] = OrderedDict([('completed', n),
+                                            ('per_minute', n / minutes)])
+            metrics = OrderedDict([
+                ('running', self._t_end is None and self._simuset is not None),
+                ('elapsed_seconds', t_elapsed),
+                ('total', self.n_total),
+                ('in_flight', in_flight),
+                ('completed', self.n_completed),
+                ('failed', self.n_failed),
+                ('skipped', self.n_skipped),
+                ('stored', self.n_stored),
+                ('remaining', remaining),
+                ('throughput_per_minute', throughput),
+                ('eta_seconds', eta),
+                ('store_write_latency_seconds', latency),
+                ('resources', resources)])
+            if self._simuset is not None:
+                metrics['storage_dir'] = self._simuset.storage_dir
+        return metrics
+
+    def to_prometheus(self, metrics=None):
+        """Returns the metrics in the Prometheus text exposition format."""
+        if metrics is None:
+            metrics = self.get_metrics()
+        labels = dict(self.labels)
+        if 'storage_dir' in metrics:
+            labels['storage_dir'] = metrics['storage_dir']
+
+        def fmt_labels(extra=None):
+            lbls = dict(labels)
+            if extra is not None:
+                lbls.update(extra)
+            if len(lbls) == 0:
+                return ''
+            return '{' + ','.join(['{}="{}"'.format(k, _escape_label_value(v))
+                                   for k, v in sorted(lbls.items())]) + '}'
+
+        lines = []
+
+        def add(name, mtype, helpstr, value, extra_labels=None):
+            full_name = self.prefix + '_' + name
+            if not any([l.startswith('# TYPE ' + full_name + ' ')
+                        for l in lines]):
+                lines.append('# HELP {} {}'.format(full_name, helpstr))
+                lines.append('# TYPE {} {}'.format(full_name, mtype))
+            if value is None or (isinstance(value, float) and np.isnan(value)):
+                value = 'NaN'
+            lines.append('{}{} {}'.format(full_name, fmt_labels(extra_labels),
+                                          value))
+
+        add('running', 'gauge', 'Whether the run is in progress.',
+            int(metrics['running']))
+        add('elapsed_seconds', 'gauge', 'Time since the start of the run.',
+            metrics['elapsed_seconds'])
+        add('simulations_total', 'gauge', 'Number of scheduled simulations.',
+            metrics['total'])
+        add('simulations_in_flight', 'gauge',
+            'Number of submitted simulations that are not finished yet.',
+            metrics['in_flight'])
+        add('simulations_completed_total', 'counter',
+            'Number of successfully finished simulations.',
+            metrics['completed'])
+        add('simulations_failed_total', 'counter',
+            'Number of failed simulations.', metrics['failed'])
+        add('simulations_skipped_total', 'counter',
+            'Number of simulations which were already in the store, ' +
+            'excluded or derived from other simulations.',
+            metrics['skipped'])
+        add('simulations_remaining', 'gauge',
+            'Number of simulations which still need to be solved.',
+            metrics['remaining'])
+        add('throughput_per_minute', 'gauge',
+            'Completed simulations per minute.',
+            metrics['throughput_per_minute'])
+        add('eta_seconds', 'gauge', 'Estimated remaining time of the run.',
+            metrics['eta_seconds'])
+        for stat, val in metrics['store_write_latency_seconds'].items():
+            add('store_write_latency_seconds', 'gauge',
+                'Latency of the HDF5 store writes.', val, {'stat': stat})
+        for r, vals in metrics['resources'].items():
+            add('resource_completed_total', 'counter',
+                'Number of simulations finished per resource.',
+                vals['completed'], {'resource': r})
+            add('resource_completed_per_minute', 'gauge',
+                'Finished simulations per minute per resource.',
+                vals['per_minute'], {'resource': r})
+        return '\n'.join(lines) + '\n'
+
+    def export(self):
+        """Writes the current metrics to the configured files."""
+        try:
+            metrics = self.get_metrics()
+            if self.prometheus_file is not None:
+                _write_atomically(self.prometheus_file,
+                                  self.to_prometheus(metrics))
+            if self.json_file is not None:
+                # NaN is not valid JSON, so we use null instead
+                def clean(obj):
+                    if isinstance(obj, dict):
+                        return OrderedDict([(k, clean(v))
+                                            for k, v in obj.items()])
+                    if isinstance(obj, float) and np.isnan(obj):
+                        return None
+                    return obj
+                _write_atomically(self.json_file,
+                                  json.dumps(clean(metrics), indent=2))
+        except Exception:
+            self.logger.exception('Unable to export the metrics.')
@@ -5,7 +5,9 @@ Authors : Julian Bopp
 
 import os
 import logging
-from pypmj import (jcm, _config, ResourceManager, SimulationSet)
+import pandas as pd
+from pypmj import (jcm, _config, ResourceManager, SimulationSet, SimulationSetGroup)
+from pypmj.core import NEW_DAEMON_DETECTED
 
 class Optimizer(object):
     """Encapsulates a jcmwave optimization study and functionalities to run JCMProjects within that study.
@@ -40,12 +42,16 @@ class Optimizer(object):
         for i in range(len(self.domain)):
             self.__domain_keys.append(self.domain[i]['name'])
         
+        # The SimulationSet holding all simulations of the study and the list of observations (see `get_observations`)
+        self.simuset = None
+        self.observations = []
+        
         # Create and initialize the study object
         self.study = jcm.optimizer.create_study(domain=self.domain, constraints=self.constraints, **jcm_create_study_kwargs)
         self.study.set_parameters(max_iter=self.max_iter, num_parallel=self.__num_parallel)
         
-    def run(self, objective_func, duplicate_path_levels=0, storage_folder='from_date', storage_base='from_config', use_resultbag=False, transitional_storage_base=None, resource_manager=None, minimize_memory_usage=False, processing_func=None, auto_rerun_failed=1, run_post_process_files=None, additional_keys=None, jcm_solve_kwargs=None, pass_ccosts_to_processing_func=False):
-        """Runs the entire optimization study.
+    def run(self, objective_func, duplicate_path_levels=0, storage_folder='from_date', storage_base='from_config', use_resultbag=False, transitional_storage_base=None, resource_manager=None, minimize_memory_usage=False, processing_func=None, auto_rerun_failed=1, run_post_process_files=None, additional_keys=None, jcm_solve_kwargs=None, pass_ccosts_to_processing_func=False, keep_store=False, asynchronous=False):
+        """Runs the entire optimization study. All simulations of the study are run in one SimulationSet (attribute `simuset`) with a single HDF5 store, to which the suggestions are appended (see pypmj.core.SimulationSet.append_simulations). A study always starts with an empty store (see `keep_store`).
         Parameters
         ----------
         objective_func : callable
@@ -76,63 +82,152 @@ class Optimizer(object):
             Refer to function pypmj.core.SimulationSet.run().
         pass_ccosts_to_processing_func : bool, default False
             Refer to function pypmj.core.SimulationSet.run().
+        keep_store : bool, default False
+            Whether to keep the HDF5 store with the results of all simulations of the study after the study has finished. If False, the database file is removed, and a non-empty store which is found in the storage folder when the study starts (e.g. of an earlier study on the same day with the default `storage_folder`) is removed as well. If True, the storage folder must not contain a non-empty store, so that the results of different studies are not mixed.
+        asynchronous : bool, default False
+            If False, `num_parallel` suggestions are requested and run as a batch, and the next batch is requested when all simulations of the batch are finished. If True, the observation of each simulation is passed to the study as soon as it is finished and a new suggestion is submitted immediately, so that `num_parallel` simulations are always running. Requires the new daemon interface.
+        """
+        set_kwargs = dict(duplicate_path_levels=duplicate_path_levels, storage_folder=storage_folder, storage_base=storage_base, use_resultbag=use_resultbag, transitional_storage_base=transitional_storage_base, resource_manager=resource_manager, minimize_memory_usage=minimize_memory_usage)
+        run_kwargs = dict(processing_func=processing_func, auto_rerun_failed=auto_rerun_failed, run_post_process_files=run_post_process_files, additional_keys=additional_keys, wdir_mode='delete', jcm_solve_kwargs=jcm_solve_kwargs, pass_ccosts_to_processing_func=pass_ccosts_to_processing_func)
+        if asynchronous and not NEW_DAEMON_DETECTED:
+            self.logger.warn('The asynchronous mode needs the new daemon interface. Running in batches instead.')
+            asynchronous = False
+        
+        if asynchronous:
+            self.__run_asynchronously(objective_func, set_kwargs, run_kwargs, keep_store)
+        else:
+            self.__run_in_batches(objective_func, set_kwargs, run_kwargs, keep_store)
+        
+        if self.simuset is not None:
+            self.simuset.close_store()
+            if not keep_store:
+                self.__clear_storage_dir(self.simuset)
+        self.logger.info('Finished optimization.')
+    
+    def __run_in_batches(self, objective_func, set_kwargs, run_kwargs, keep_store):
+        """Requests `num_parallel` suggestions, runs them and passes the observations to the study, until the study is done.
         """
         # Continue if study has not finished yet.
         while (not self.study.is_done()):
             # Obtain suggestions for the amount of simulations which should run in parallel.
             suggestions = []
-            suggestion_ids = []
             for i in range(self.__num_parallel):
                 suggestions.append(self.study.get_suggestion())
-                suggestion_ids.append(suggestions[i].id)
                 if self.study.info()['is_done']:
                     break
             
-            # Build template keys from suggestions and from given constant keys.
-            # Suggestion IDs are passed as a parameter key for later identification.
-            parameter_keys = {'suggestion_id': suggestion_ids}
-            geometry_keys = dict()
-            for key in self.__domain_keys:
-                values = []
-                for suggestion in suggestions:
-                    values.append(suggestion.kwargs[key])
-                geometry_keys[key] = values
-                
-            template_keys = {
-                'constants': self.constant_keys,
-                'parameters': parameter_keys,
-                'geometry': geometry_keys
-            }
+            if self.simuset is None:
+                self.__create_simuset(suggestions, set_kwargs, keep_store)
+                numbers = list(range(self.simuset.num_sims))
+            else:
+                numbers = self.__append_suggestions(suggestions)
             
-            # Initialize a SimulationSet and run the simulations.
-            simuset = SimulationSet(self.__project, template_keys, combination_mode='list', duplicate_path_levels=duplicate_path_levels, storage_folder=storage_folder, storage_base=storage_base, use_resultbag=use_resultbag, transitional_storage_base=transitional_storage_base, resource_manager=resource_manager, minimize_memory_usage=minimize_memory_usage)
-            simuset.make_simulation_schedule()
-            simuset.run(processing_func=processing_func, auto_rerun_failed=auto_rerun_failed, run_post_process_files=run_post_process_files, additional_keys=additional_keys, wdir_mode='delete', jcm_solve_kwargs=jcm_solve_kwargs, pass_ccosts_to_processing_func=pass_ccosts_to_processing_func)
-            simuset.close_store()
-            self.__clear_storage_dir(simuset)
+            # Run the new simulations.
+            self.simuset.run(**run_kwargs)
             
             # Simulations have finished. Loop through the results.
-            for i in range(len(simuset.simulations)):
-                sid = simuset.simulation_properties['suggestion_id'][i]
-                
-                # The simulations has failed. Skip it.
-                if simuset.simulations[i].exit_code != 0:
-                    self.study.clear_suggestion(sid, 'Simulation failed.')
-                    self.logger.warn('Simulation with suggestion_id {} failed. Ignoring and continuing...'.format(sid))
-                    continue
-                
-                # Calculate the objective value for the simulation. Skip it if None is returned.
-                observed_result = objective_func(simuset.simulations[i]);
-                if observed_result is None:
-                    self.study.clear_suggestion(sid, 'Simulation skipped by client.')
+            for n in numbers:
+                self.__observe(self.simuset.simulations[n], objective_func)
+    
+    def __run_asynchronously(self, objective_func, set_kwargs, run_kwargs, keep_store):
+        """Keeps `num_parallel` simulations running. As soon as a simulation is finished, its observation is passed to the study and the next suggestion is submitted, until the study is done.
+        """
+        suggestions = []
+        for i in range(self.__num_parallel):
+            suggestions.append(self.study.get_suggestion())
+            if self.study.info()['is_done']:
+                break
+        self.__create_simuset(suggestions, set_kwargs, keep_store)
+        
+        # Use the dispatch loop of a SimulationSetGroup, to which the new suggestions are added while it is running.
+        group = SimulationSetGroup([self.simuset])
+        if not group.start(N=self.__num_parallel, **run_kwargs):
+            return
+        try:
+            for _, simulation in group.iter_finished():
+                self.__observe(simulation, objective_func)
+                if self.study.is_done():
                     continue
-                
-                # Pass objective value for the simulation to the study object.
-                observation = self.study.new_observation()
-                observation.add(observed_result)
-                self.study.add_observation(observation, sid)
-                
-        self.logger.info('Finished optimization.')
+                numbers = self.__append_suggestions([self.study.get_suggestion()])
+                group.append(self.simuset, numbers)
+        finally:
+            group.finish()
+    
+    def __create_simuset(self, suggestions, set_kwargs, keep_store):
+        """Initializes the SimulationSet which is used for the entire study with the first `suggestions`.
+        """
+        # Build template keys from suggestions and from given constant keys.
+        # Suggestion IDs are passed as a parameter key for later identification.
+        parameter_keys = {'suggestion_id': [suggestion.id for suggestion in suggestions]}
+        geometry_keys = dict()
+        for key in self.__domain_keys:
+            values = []
+            for suggestion in suggestions:
+                values.append(suggestion.kwargs[key])
+            geometry_keys[key] = values
+            
+        template_keys = {
+            'constants': self.constant_keys,
+            'parameters': parameter_keys,
+            'geometry': geometry_keys
+        }
+        
+        self.simuset = SimulationSet(self.__project, template_keys, combination_mode='list', **set_kwargs)
+        if not self.simuset.is_store_empty():
+            self.simuset.close_store()
+            if keep_store:
+                self.simuset = None
+                raise RuntimeError('The HDF5 store in the storage folder is not empty. Please use another `storage_folder` for a new study whose store is kept.')
+            # The results of an earlier study would be mixed with the ones of this study
+            self.logger.warn('Removing the non-empty HDF5 store in {} of an earlier study.'.format(self.simuset.storage_dir))
+            self.__clear_storage_dir(self.simuset)
+            self.simuset = SimulationSet(self.__project, template_keys, combination_mode='list', **set_kwargs)
+        self.simuset.make_simulation_schedule()
+    
+    def __append_suggestions(self, suggestions):
+        """Appends the `suggestions` as new simulations to `simuset` and returns their simulation numbers.
+        """
+        keys_list = []
+        for suggestion in suggestions:
+            keys = {'suggestion_id': suggestion.id}
+            for key in self.__domain_keys:
+                keys[key] = suggestion.kwargs[key]
+            keys_list.append(keys)
+        return self.simuset.append_simulations(keys_list)
+    
+    def __observe(self, simulation, objective_func):
+        """Passes the objective value for the finished `simulation` to the study object, or clears the suggestion if the simulation failed or was skipped by the `objective_func`.
+        """
+        sid = simulation.keys['suggestion_id']
+        
+        # The simulations has failed. Skip it and exclude it from the following runs.
+        if simulation.exit_code != 0:
+            self.simuset.exclude_simulations([simulation.number])
+            self.study.clear_suggestion(sid, 'Simulation failed.')
+            self.logger.warn('Simulation with suggestion_id {} failed. Ignoring and continuing...'.format(sid))
+            self.observations.append({'number': simulation.number, 'suggestion_id': sid, 'objective': None})
+            return
+        
+        # Calculate the objective value for the simulation. Skip it if None is returned.
+        observed_result = objective_func(simulation)
+        self.observations.append({'number': simulation.number, 'suggestion_id': sid, 'objective': observed_result})
+        if observed_result is None:
+            self.study.clear_suggestion(sid, 'Simulation skipped by client.')
+            return
+        
+        # Pass objective value for the simulation to the study object.
+        observation = self.study.new_observation()
+        observation.add(observed_result)
+        self.study.add_observation(observation, sid)
+    
+    def get_observations(self):
+        """Returns a pandas DataFrame with the suggestion ID, the domain keys and the objective value (None for failed or skipped simulations) of all simulations of the study, indexed by the simulation number. The results of the simulations are available in the HDF5 store of `simuset`.
+        """
+        if len(self.observations) == 0:
+            return pd.DataFrame(columns=['suggestion_id'] + self.__domain_keys + ['objective'])
+        df = pd.DataFrame(self.observations).set_index('number').sort_index()
+        props = self.simuset.simulation_properties.loc[df.index, self.__domain_keys]
+        return pd.concat([df[['suggestion_id']], props, df[['objective']]], axis=1)
             
     def __clear_storage_dir(self, simuset):
         """ Removes the database file from the storage directory of a given SimulationSet `simuset` in order to avoid conflicts with further simulations.
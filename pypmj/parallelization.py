@@ -2,7 +2,9 @@
 jobs in parallel. The class `DaemonResource` gives eaccess to both,
 workstations and queues and eases their configuration. The
 `ResourceDict`-class serves as a set of such resources and provides methods
-to set their properties all at once.
+to set their properties all at once. The `ResourceScheduler` assigns jobs to
+the resources while respecting their multiplicity and memory capacity, and
+the `StragglerPolicy` decides when a slow job is re-executed speculatively.
 
 Authors : Carlo Barth
 
@@ -10,13 +12,47 @@ Authors : Carlo Barth
 
 from pypmj import _config, ConfigurationError
 import logging
+import numpy as np
 import os
 from six import string_types
+import threading
 import time
 logger = logging.getLogger(__name__)
 
+# Lock which serializes all calls to the daemon client (`jcm.solve`,
+# `daemon.wait`, `daemon.cancel` and the adding of resources), as these are
+# made from different threads if resources are added in the background (see
+# `ResourceDict.add_all_concurrently`) or futures are used (see
+# `pypmj.harvester`). While resources are added in the background, the
+# waits for the daemon are limited to `ADDING_WAIT_INTERVAL` seconds (see
+# `get_wait_timeout`), so that the adding threads get the lock in between.
+DAEMON_LOCK = threading.RLock()
+ADDING_WAIT_INTERVAL = 1.
+
+# The threads which add resources in the background
+_adding_threads = []
+
 KNOWN_SERVER_OPTIONS = ['hostname', 'JCM_root', 'login',
-                        'multiplicity_default', 'n_threads_default', 'stype']
+                        'multiplicity_default', 'n_threads_default', 'stype',
+                        'memory_GB']
+
+
+def is_adding_resources():
+    """Returns whether resources are still being added in the background
+    (see `ResourceDict.add_all_concurrently`)."""
+    _adding_threads[:] = [t for t in _adding_threads if t.is_alive()]
+    return len(_adding_threads) > 0
+
+
+def get_wait_timeout(timeout=None):
+    """Returns the `timeout` (in seconds, None meaning no timeout) to use for
+    a wait for the daemon, limited to `ADDING_WAIT_INTERVAL` while resources
+    are added in the background."""
+    if not is_adding_resources():
+        return timeout
+    if timeout is None:
+        return ADDING_WAIT_INTERVAL
+    return min(timeout, ADDING_WAIT_INTERVAL)
 
 
 # A custom exception for configuration errors
@@ -88,6 +124,9 @@ def read_resources_from_config(daemon_):
             multiplicity_default = _config.getint(ssec, 'multiplicity_default')
             n_threads_default = _config.getint(ssec, 'n_threads_default')
             stype = _config.get(ssec, 'stype')
+            memory_GB = None
+            if _config.has_option(ssec, 'memory_GB'):
+                memory_GB = _config.getfloat(ssec, 'memory_GB')
         except Exception as e:
             raise ConfigurationError('Unable to parse configuration for ' +
                                      'server: {}. Exception: {}.'.
@@ -104,7 +143,9 @@ def read_resources_from_config(daemon_):
         resources[nickname] = DaemonResource(daemon_, hostname, login,
                                              JCM_root, multiplicity_default,
                                              n_threads_default,
-                                             stype, nickname, **manual_kwargs)
+                                             stype, nickname,
+                                             memory_GB=memory_GB,
+                                             **manual_kwargs)
     return resources
 
 
@@ -141,13 +182,17 @@ class DaemonResource(object):
         Type of the resource to use in the JCMsuite daemon utility.
     nickname : str, default None
         Shorthand name to use for this server. If None, the `hostname` is used.
+    memory_GB : float or NoneType, default None
+        The memory (RAM) in GB which can be used by the jobs on this server.
+        If given, the `ResourceScheduler` limits the number of concurrent jobs
+        on this server so that their predicted peak memory fits.
     **kwargs
         Add additional key-value pairs to pass to the daemon functions (which
         are `add_workstation` and `add_queue`) on your own risk.
     """
 
     def __init__(self, daemon_, hostname, login, JCM_root, multiplicity_default,
-                 n_threads_default, stype, nickname, **kwargs):
+                 n_threads_default, stype, nickname, memory_GB=None, **kwargs):
         self.daemon = daemon_
         self.hostname = hostname
         self.login = login
@@ -156,6 +201,8 @@ class DaemonResource(object):
         self.n_threads_default = n_threads_default
         self.stype = stype
         self.nickname = nickname
+        self.memory_GB = memory_GB
+        self.resourceIDs = None
         self.JCMKERNEL = _config.getint('JCMsuite', 'kernel')
         self.kwargs = kwargs
         self.previous_state_saved = False
@@ -272,10 +319,12 @@ class DaemonResource(object):
     def add(self):
         """Adds the resource to the current daemon configuration."""
         logger.debug('Adding {}'.format(self))
-        self.resourceIDs = self._add_type_dependent()
-        if self.resourceIDs == 'Error':
+        with DAEMON_LOCK:
+            IDs = self._add_type_dependent()
+        if IDs == 'Error':
             raise Exception('An unknown error occurred while adding {}.'.
                             format(self))
+        self.resourceIDs = IDs
         logger.debug('... adding was successful.')
 
     def add_repeatedly(self, n_shots=10, wait_seconds=5, ignore_fail=False):
@@ -296,6 +345,34 @@ class DaemonResource(object):
         else:
             raise DaemonError('Failed to add {}: . Exiting.'.format(self))
 
+    def add_with_backoff(self, n_shots=10, wait_seconds=5, backoff_factor=2.,
+                         max_wait_seconds=60., stop_event=None):
+        """Tries to add the resource for `n_shots` times, starting with a
+        waiting time of `wait_seconds` between the trials which is multiplied
+        by `backoff_factor` after each failure (up to `max_wait_seconds`).
+        Returns whether the resource was added. If the `threading.Event`
+        `stop_event` is set, no further trials are made."""
+        wait = wait_seconds
+        for i in range(n_shots):
+            if stop_event is not None and stop_event.is_set():
+                return False
+            try:
+                self.add()
+                return True
+            except Exception as e:
+                logger.debug(e)
+                if i + 1 == n_shots:
+                    break
+                logger.warn('Failed to add {}: '.format(self) +
+                            'retrying in {:.1f} seconds ...'.format(wait))
+                if stop_event is not None:
+                    stop_event.wait(wait)
+                else:
+                    time.sleep(wait)
+                wait = min(wait * backoff_factor, max_wait_seconds)
+        logger.warn('Failed to add {} after {} trials.'.format(self, n_shots))
+        return False
+
 
 # =============================================================================
 class ResourceDict(dict):
@@ -367,6 +444,91 @@ class ResourceDict(dict):
         for r in list(self.values()):
             r.add_repeatedly(n_shots, wait_seconds, ignore_fail)
 
+    def add_all_concurrently(self, n_shots=10, wait_seconds=5,
+                             ignore_fail=False, min_resources=1,
+                             backoff_factor=2., max_wait_seconds=60.):
+        """Adds all resources concurrently using the `add_with_backoff` method
+        of each resource in a separate thread.
+        
+        Returns as soon as `min_resources` resources were added (or all
+        trials finished), so that a partially available pool can be used
+        immediately. Resources which are not available yet continue to be
+        added in the background, i.e. while simulations are already running.
+        Use `get_pending_resources` to check for them, `wait_for_pending` to
+        wait for them, and `stop_adding` to stop the background trials. The
+        calls to the daemon of the background threads and of the running
+        simulations are serialized using the `DAEMON_LOCK`.
+        If no resource could be added, a `DaemonError` is raised unless
+        `ignore_fail` is True.
+        """
+        self.stop_adding()
+        self._stop_event = threading.Event()
+        self._add_results = {}
+        self._add_threads = {}
+        added = threading.Condition()
+        
+        def target(nickname, resource, stop_event):
+            result = resource.add_with_backoff(n_shots, wait_seconds,
+                                               backoff_factor,
+                                               max_wait_seconds, stop_event)
+            with added:
+                self._add_results[nickname] = result
+                added.notify_all()
+            if result and nickname in self.get_pending_resources(True):
+                logger.info('Added {} in the background.'.format(resource))
+        
+        for nickname, resource in list(self.items()):
+            thread = threading.Thread(target=target,
+                                      args=(nickname, resource,
+                                            self._stop_event))
+            thread.daemon = True
+            self._add_threads[nickname] = thread
+            _adding_threads.append(thread)
+            thread.start()
+        
+        # Wait until enough resources are online or all threads finished
+        n_required = min(min_resources, len(self))
+        with added:
+            while True:
+                n_added = len([r for r in self._add_results.values() if r])
+                if n_added >= n_required or \
+                        len(self._add_results) == len(self):
+                    break
+                added.wait()
+            self._pending_at_return = self.get_pending_resources()
+        if n_added == 0 and len(self._add_results) == len(self) > 0:
+            if ignore_fail:
+                logger.warn('Failed to add any resource. Ignoring.')
+            else:
+                raise DaemonError('Failed to add any resource. Exiting.')
+            return
+        if len(self._pending_at_return) > 0:
+            logger.info('Continuing to add {} in the background.'.format(
+                        self._pending_at_return))
+
+    def get_pending_resources(self, at_return=False):
+        """Returns the nicknames of the resources which are still being added
+        in the background by `add_all_concurrently`. If `at_return` is True,
+        the resources which were pending when `add_all_concurrently`
+        returned are given instead."""
+        if at_return:
+            return list(getattr(self, '_pending_at_return', []))
+        threads = getattr(self, '_add_threads', {})
+        return sorted([n for n, t in threads.items()
+                       if not n in self._add_results])
+
+    def wait_for_pending(self, timeout=None):
+        """Waits for the background trials of `add_all_concurrently` to
+        finish (at most `timeout` seconds per resource)."""
+        for thread in list(getattr(self, '_add_threads', {}).values()):
+            thread.join(timeout)
+
+    def stop_adding(self):
+        """Stops the background trials of `add_all_concurrently`."""
+        stop_event = getattr(self, '_stop_event', None)
+        if stop_event is not None:
+            stop_event.set()
+
     def get_resource_with_most_cores(self):
         """Determines which of the resources has the most usable cores, i.e.
         multiplicity*n_threads, and returns its nickname and this number."""
@@ -380,5 +542,308 @@ class ResourceDict(dict):
         return names[imax], max_cores
 
 
+# =============================================================================
+class ResourceScheduler(object):
+    """Assigns jobs to the resources of a `ResourceDict` so that the number of
+    concurrent jobs on each resource does not exceed its multiplicity and
+    the sum of the predicted peak memory of these jobs does not exceed its
+    `memory_GB` (if configured).
+    
+    A job with a predicted memory larger than the memory of all resources
+    (and if all resources have a limited memory) is assigned exclusively to
+    the resource with the largest memory, as it could not be run otherwise.
+    Jobs with an unknown (NaN) memory only count for the multiplicity.
+    Resources which are not added to the daemon yet (i.e. without
+    `resourceIDs`, e.g. because they are still being added in the
+    background) are not used until they are available.
+    
+    Parameters
+    ----------
+    resources : ResourceDict
+        The resources to use.
+    
+    """
+
+    def __init__(self, resources):
+        self.resources = resources
+        self._jobs = {}
+
+    def __repr__(self):
+        return 'ResourceScheduler({})'.format(
+            {n: len(self.get_jobs(n)) for n in self.resources})
+
+    def get_jobs(self, nickname):
+        """Returns the list of job IDs currently assigned to the resource with
+        `nickname`."""
+        return [j for j, (n, _) in self._jobs.items() if n == nickname]
+
+    def get_used_memory(self, nickname):
+        """Returns the summed predicted memory of the jobs currently assigned
+        to the resource with `nickname`."""
+        return sum([m for n, m in self._jobs.values()
+                    if n == nickname and np.isfinite(m)])
+
+    def get_free_memory(self, nickname):
+        """Returns the free memory of the resource with `nickname` (infinite
+        if no `memory_GB` is configured)."""
+        memory_GB = self.resources[nickname].memory_GB
+        if memory_GB is None:
+            return np.inf
+        return memory_GB - self.get_used_memory(nickname)
+
+    def _get_added_resources(self):
+        """Returns the list of resources which are added to the daemon."""
+        return [r for r in self.resources.values()
+                if r.resourceIDs is not None]
+
+    def _is_oversized(self, memory):
+        """Returns whether the `memory` exceeds the memory of all added
+        resources."""
+        capacities = [r.memory_GB for r in self._get_added_resources()]
+        if len(capacities) == 0 or any([c is None for c in capacities]):
+            return False
+        return memory > max(capacities)
+
+    def fits(self, nickname, memory):
+        """Returns whether a job with the predicted `memory` can currently be
+        assigned to the resource with `nickname`."""
+        resource = self.resources[nickname]
+        if resource.resourceIDs is None:
+            return False
+        n_jobs = len(self.get_jobs(nickname))
+        if n_jobs >= resource.multiplicity:
+            return False
+        if not np.isfinite(memory) or resource.memory_GB is None:
+            return True
+        if self._is_oversized(memory):
+            largest = max(self._get_added_resources(),
+                          key=lambda r: r.memory_GB)
+            return resource is largest and n_jobs == 0
+        return memory <= self.get_free_memory(nickname)
+
+    def select_resource(self, memory=np.nan, candidates=None):
+        """Returns the nickname of the resource with the most free memory (and
+        the most free slots) which can currently take a job with the
+        predicted `memory`, or None if no resource can take it. The choice
+        can be restricted to the nicknames in `candidates`."""
+        if candidates is None:
+            candidates = self.resources.keys()
+        best = None
+        for nickname in sorted(candidates):
+            if not self.fits(nickname, memory):
+                continue
+            n_free = (self.resources[nickname].multiplicity -
+                      len(self.get_jobs(nickname)))
+            score = (self.get_free_memory(nickname), n_free)
+            if best is None or score > best[0]:
+                best = (score, nickname)
+        if best is None:
+            return
+        return best[1]
+
+    def get_least_loaded(self, candidates=None):
+        """Returns the nickname of the resource with the lowest number of
+        assigned jobs relative to its multiplicity, ignoring the memory. The
+        choice can be restricted to the nicknames in `candidates`."""
+        if candidates is None:
+            candidates = self.resources.keys()
+        added = [n for n in candidates
+                 if self.resources[n].resourceIDs is not None]
+        if len(added) > 0:
+            candidates = added
+        loads = [(float(len(self.get_jobs(n))) /
+                  max(self.resources[n].multiplicity, 1), n)
+                 for n in sorted(candidates)]
+        return min(loads)[1]
+
+    def assign(self, job_id, nickname, memory=np.nan):
+        """Registers the job with `job_id` and the predicted `memory` on the
+        resource with `nickname`."""
+        if memory is None:
+            memory = np.nan
+        self._jobs[job_id] = (nickname, memory)
+
+    def release(self, job_id):
+        """Removes the job with `job_id` and returns the nickname of the
+        resource it was assigned to (None if it is unknown)."""
+        if not job_id in self._jobs:
+            return
+        return self._jobs.pop(job_id)[0]
+
+    def n_jobs(self):
+        """Returns the total number of currently assigned jobs."""
+        return len(self._jobs)
+
+
+
+# =============================================================================
+class StragglerPolicy(object):
+    """Policy for the detection of straggling jobs, i.e. jobs which run much
+    longer than expected, e.g. because they hang on a shared queue. If a job
+    is detected as a straggler, `SimulationSet.run` submits a speculative
+    duplicate to an idle resource, uses the result of whichever job finishes
+    first and cancels the other one.
+    
+    The expected runtime of a job is the predicted cost of the cost model of
+    the `SimulationSet` (if any), calibrated by the median ratio of the
+    measured runtimes and the predicted costs of the finished jobs. Without a
+    cost model, the median runtime of the finished jobs of the same cost
+    class is used.
+    
+    Parameters
+    ----------
+    factor : float, default 3.
+        A job is a straggler if its runtime exceeds `factor` times the
+        expected runtime.
+    min_runtime : float, default 60.
+        Jobs running shorter than `min_runtime` seconds are never considered
+        as stragglers.
+    min_samples : int, default 3
+        Minimum number of finished jobs (of the same cost class) needed to
+        estimate the expected runtime.
+    cost_class : callable or NoneType, default None
+        Function which returns a hashable cost class for the `keys`-dict of a
+        simulation, e.g. the FEM degree. If None, all simulations are in the
+        same class.
+    max_speculative : int or NoneType, default None
+        Maximum number of speculative duplicates per run. Unlimited if None.
+    poll_interval : float, default 5.
+        Time in seconds after which waiting for jobs is interrupted to check
+        for stragglers.
+    timeout : float or NoneType, default None
+        Jobs which run longer than `timeout` seconds (including the
+        speculative duplicates of stragglers) are cancelled and their
+        simulations are treated as failed, i.e. they are retried according
+        to the `RetryPolicy` of the run. This prevents endless waiting for a
+        hanging job if no idle resource is available for a duplicate. No
+        timeout if None.
+    
+    """
+
+    def __init__(self, factor=3., min_runtime=60., min_samples=3,
+                 cost_class=None, max_speculative=None, poll_interval=5.,
+                 timeout=None):
+        self.factor = factor
+        self.min_runtime = min_runtime
+        self.min_samples = min_samples
+        self.cost_class = cost_class
+        self.max_speculative = max_speculative
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.reset()
+
+    def __repr__(self):
+        return 'StragglerPolicy(factor={}, min_runtime={})'.format(
+            self.factor, self.min_runtime)
+
+    def reset(self):
+        """Forgets all recorded runtimes."""
+        self._runtimes = {}
+        self._ratios = []
+        self.n_speculative = 0
+
+    def get_cost_class(self, keys):
+        """Returns the cost class for the simulation `keys`."""
+        if self.cost_class is None:
+            return None
+        return self.cost_class(keys)
+
+    def record(self, keys, runtime, predicted=np.nan):
+        """Records the `runtime` of a finished job with the simulation `keys`
+        and its `predicted` cost."""
+        cls = self.get_cost_class(keys)
+        self._runtimes.setdefault(cls, []).append(runtime)
+        if np.isfinite(predicted) and predicted > 0.:
+            self._ratios.append(runtime / predicted)
+
+    def get_expected_runtime(self, keys, predicted=np.nan):
+        """Returns the expected runtime of a job with the simulation `keys`
+        and the `predicted` cost, or NaN if it cannot be estimated yet."""
+        if np.isfinite(predicted) and len(self._ratios) >= self.min_samples:
+            return predicted * np.median(self._ratios)
+        runtimes = self._runtimes.get(self.get_cost_class(keys), [])
+        if len(runtimes) >= self.min_samples:
+            return np.median(runtimes)
+        return np.nan
+
+    def is_straggler(self, runtime, expected):
+        """Returns whether a job with the current `runtime` and the
+        `expected` runtime is a straggler."""
+        if not np.isfinite(expected):
+            return False
+        return runtime > max(self.factor * expected, self.min_runtime)
+
+    def is_timed_out(self, runtime):
+        """Returns whether a job with the current `runtime` exceeded the
+        `timeout`."""
+        return self.timeout is not None and runtime > self.timeout
+
+    def may_speculate(self):
+        """Returns whether another speculative duplicate is allowed."""
+        return (self.max_speculative is None or
+                self.n_speculative < self.max_speculative)
+
+
+# =============================================================================
+class RetryPolicy(object):
+    """Policy for the automatic retrying of failed simulations. A failed
+    simulation is pushed onto a retry queue of `SimulationSet.run` and is
+    resubmitted as soon as its backoff delay has expired, interleaved with
+    the remaining simulations, i.e. without waiting for the end of the
+    current batch or of the whole run.
+    
+    Parameters
+    ----------
+    max_retries : int, default 1
+        Maximum number of retries per simulation.
+    backoff : float, default 0.
+        Delay in seconds before the first retry of a simulation.
+    backoff_factor : float, default 2.
+        Factor by which the delay is multiplied for each further retry of the
+        same simulation.
+    max_backoff : float, default 300.
+        Maximum delay in seconds.
+    different_resource : bool, default True
+        Whether to retry a simulation on a resource other than the one on
+        which it failed (if another resource is available).
+    
+    """
+
+    def __init__(self, max_retries=1, backoff=0., backoff_factor=2.,
+                 max_backoff=300., different_resource=True):
+        self.max_retries = int(max_retries)
+        self.backoff = backoff
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.different_resource = different_resource
+        self.reset()
+
+    def __repr__(self):
+        return 'RetryPolicy(max_retries={}, backoff={})'.format(
+            self.max_retries, self.backoff)
+
+    def reset(self):
+        """Forgets the retries of all simulations."""
+        self._n_retries = {}
+
+    def get_n_retries(self, number):
+        """Returns the number of retries of the simulation with `number`."""
+        return self._n_retries.get(number, 0)
+
+    def may_retry(self, number):
+        """Returns whether the simulation with `number` may be retried."""
+        return self.get_n_retries(number) < self.max_retries
+
+    def get_delay(self, number):
+        """Returns the backoff delay in seconds for the next retry of the
+        simulation with `number`."""
+        delay = self.backoff * self.backoff_factor**self.get_n_retries(number)
+        return min(delay, self.max_backoff)
+
+    def record(self, number):
+        """Records a retry of the simulation with `number`."""
+        self._n_retries[number] = self.get_n_retries(number) + 1
+
+
 if __name__ == '__main__':
     pass
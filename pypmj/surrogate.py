@@ -0,0 +1,343 @@
+"""Defines the `Surrogate`-class, a response surface for result columns of
+simulations (e.g. a reflectance) as a function of their keys. It is fitted on
+the results which are stored in the HDF5 store for each finished simulation
+and answers vectorized queries including error estimates, e.g. to interpolate
+between the points of a parameter scan or to skip simulations for which the
+surrogate is accurate enough (see `SimulationSet.apply_surrogate`).
+
+Authors : Carlo Barth
+
+"""
+
+import logging
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+from .cost_model import is_cost_column
+logger = logging.getLogger(__name__)
+
+# Supported interpolation methods
+SURROGATE_METHODS = ['rbf', 'linear', 'gp']
+
+# Maximum number of samples for which the leave-one-out errors of the 'linear'
+# method are computed (a random subset is used for larger data)
+MAX_LOO_SAMPLES = 500
+
+
+# =============================================================================
+class Surrogate(object):
+    """Interpolating response surface for one or more result columns as a
+    function of the simulation keys.
+
+    The features are standardized and constant features are ignored. The
+    following methods are available:
+
+      - 'rbf': radial basis function interpolation with a multiquadric
+        kernel. The error estimate is based on the leave-one-out errors of
+        the samples, which are computed in closed form (Rippa's method).
+        It is the inverse distance weighted leave-one-out error of the
+        nearest samples, scaled down to zero at the samples.
+      - 'linear': piecewise linear interpolation on a Delaunay triangulation
+        (or `numpy.interp` for a single feature). The error estimate is
+        computed as for 'rbf', using explicit leave-one-out interpolations.
+        Outside of the convex hull of the samples, the value of the nearest
+        sample is returned with an infinite error.
+      - 'gp': Gaussian process regression with a squared exponential kernel.
+        The length scale and the noise level are fitted by maximizing the
+        marginal likelihood for each target. The error estimate is the
+        standard deviation of the posterior.
+
+    Parameters
+    ----------
+    targets : str or list
+        Name(s) of the result column(s) to interpolate.
+    features : list or NoneType, default None
+        Keys (i.e. columns) to use as features. If None, all numerical columns
+        of the data passed to `fit` which are neither targets nor
+        computational cost columns are used.
+    method : {'rbf', 'linear', 'gp'}, default 'rbf'
+        The interpolation method.
+    smoothing : float, default 0.
+        Smoothing (i.e. regularization) parameter for the 'rbf' method.
+
+    """
+
+    def __init__(self, targets, features=None, method='rbf', smoothing=0.):
+        self.logger = logging.getLogger('surrogate.' +
+                                        self.__class__.__name__)
+        if method not in SURROGATE_METHODS:
+            raise ValueError('Unknown method: {}. Use one of {}'.format(
+                             method, SURROGATE_METHODS))
+            return
+        if not isinstance(targets, (list, tuple)):
+            targets = [targets]
+        self.targets = list(targets)
+        self.features = features
+        self.method = method
+        self.smoothing = smoothing
+        self.n_samples = 0
+        self._models = None
+
+    def __repr__(self):
+        return 'Surrogate(targets={}, method={}, n_samples={})'.format(
+            self.targets, self.method, self.n_samples)
+
+    @property
+    def is_fitted(self):
+        """Whether the surrogate was fitted successfully."""
+        return self._models is not None
+
+    def _standardize(self, data):
+        """Returns the standardized varying features of `data`, which can be
+        a DataFrame, a dict of arrays or a 2D-array with one column per
+        feature."""
+        if isinstance(data, (pd.DataFrame, dict)):
+            X = np.column_stack([np.asarray(data[f], dtype=float).ravel()
+                                 for f in self.features])
+        else:
+            X = np.asarray(data, dtype=float)
+            if X.ndim == 1:
+                X = X.reshape(-1, len(self.features))
+        X = (X - self._mean) / self._std
+        return X[:, self._varying]
+
+    def fit(self, data, exclude=None):
+        """Fits the surrogate to the DataFrame `data`, which must contain the
+        feature columns and the target columns, e.g. the data in the HDF5
+        store of a `SimulationSet`. Rows with missing target values are
+        ignored for the respective target. `exclude` is an optional list of
+        columns which should not be used as features if `features` is None.
+        Returns the instance itself.
+        """
+        missing = [t for t in self.targets if t not in data.columns]
+        if len(missing) > 0:
+            raise ValueError('The targets {} are missing in the data.'.
+                             format(missing))
+            return
+        if self.features is None:
+            ignore = set(['wdir'] + self.targets)
+            if exclude is not None:
+                ignore.update(exclude)
+            ignore.update([c for c in data.columns if is_cost_column(c)])
+            self.features = [c for c in data.columns if c not in ignore and
+                             pd.api.types.is_numeric_dtype(data[c]) and
+                             not pd.api.types.is_bool_dtype(data[c])]
+        missing = [f for f in self.features if f not in data.columns]
+        if len(missing) > 0:
+            raise ValueError('The features {} are missing in the data.'.
+                             format(missing))
+            return
+
+        # Standardize the features, ignoring constant columns
+        X = data.loc[:, self.features].values.astype(float)
+        self._mean = X.mean(axis=0)
+        std = X.std(axis=0)
+        self._varying = std > 0.
+        std[~self._varying] = 1.
+        self._std = std
+        X = self._standardize(data)
+
+        self._models = {}
+        self.n_samples = len(data)
+        for target in self.targets:
+            y = data[target].values.astype(float)
+            valid = np.isfinite(y)
+            if valid.sum() == 0:
+                self.logger.warn('No valid samples for {}.'.format(target))
+                self._models = None
+                return self
+            self._models[target] = self._fit_target(X[valid], y[valid])
+        self.logger.debug('Fitted {}'.format(self))
+        return self
+
+    def _fit_target(self, X, y):
+        """Returns a dict describing the model for the samples `X` and the
+        target values `y`."""
+        model = {'X': X, 'y': y, 'tree': cKDTree(X) if X.shape[1] > 0
+                 else None}
+        if X.shape[1] == 0 or len(y) == 1:
+            # Only use the mean value
+            model['kind'] = 'mean'
+            model['mean'] = y.mean()
+            model['loo'] = np.abs(y - y.mean())
+            return model
+        model['kind'] = self.method
+        if self.method == 'rbf':
+            self._fit_rbf(model)
+        elif self.method == 'linear':
+            self._fit_linear(model)
+        else:
+            self._fit_gp(model)
+        return model
+
+    # RBF
+    # -------------------------------------------------------------------------
+    def _rbf_kernel(self, r, epsilon):
+        """Multiquadric kernel."""
+        return np.sqrt(1. + (r / epsilon)**2)
+
+    def _fit_rbf(self, model):
+        X, y = model['X'], model['y']
+        d_nn, _ = model['tree'].query(X, k=2)
+        epsilon = max(np.mean(d_nn[:, 1]), 1.e-12)
+        r = np.sqrt(((X[:, None, :] - X[None, :, :])**2).sum(axis=2))
+        A = self._rbf_kernel(r, epsilon) + self.smoothing * np.eye(len(y))
+        A_inv = np.linalg.pinv(A)
+        weights = A_inv.dot(y)
+        model['epsilon'] = epsilon
+        model['weights'] = weights
+        # Leave-one-out errors (Rippa's method)
+        model['loo'] = np.abs(weights / np.diag(A_inv))
+
+    def _predict_rbf(self, model, Xq):
+        r = np.sqrt(((Xq[:, None, :] - model['X'][None, :, :])**2).sum(
+                                                                    axis=2))
+        return self._rbf_kernel(r, model['epsilon']).dot(model['weights'])
+
+    # Linear
+    # -------------------------------------------------------------------------
+    def _linear_interpolator(self, X, y):
+        """Returns a function which interpolates the samples linearly and
+        returns NaN outside of their convex hull."""
+        if X.shape[1] == 1:
+            order = np.argsort(X[:, 0])
+            xs, ys = X[order, 0], y[order]
+            return lambda Xq: np.interp(Xq[:, 0], xs, ys, left=np.nan,
+                                        right=np.nan)
+        from scipy.interpolate import LinearNDInterpolator
+        return LinearNDInterpolator(X, y)
+
+    def _fit_linear(self, model):
+        X, y = model['X'], model['y']
+        model['interpolator'] = self._linear_interpolator(X, y)
+        # Explicit leave-one-out errors, using the distance to the nearest
+        # sample if a sample is outside of the convex hull of the others
+        n = len(y)
+        indices = np.arange(n)
+        if n > MAX_LOO_SAMPLES:
+            indices = np.random.RandomState(0).choice(n, MAX_LOO_SAMPLES,
+                                                      replace=False)
+        loo = np.full(n, np.nan)
+        for i in indices:
+            mask = np.ones(n, dtype=bool)
+            mask[i] = False
+            try:
+                value = self._linear_interpolator(X[mask], y[mask])(
+                                                            X[i:i + 1])[0]
+            except Exception:
+                value = np.nan
+            if np.isfinite(value):
+                loo[i] = abs(value - y[i])
+        if np.all(np.isnan(loo)):
+            loo[:] = np.abs(y - y.mean())
+        else:
+            loo[np.isnan(loo)] = np.nanmax(loo)
+        model['loo'] = loo
+
+    # Gaussian process
+    # -------------------------------------------------------------------------
+    def _gp_kernel(self, A, B, length_scale):
+        d2 = ((A[:, None, :] - B[None, :, :])**2).sum(axis=2)
+        return np.exp(-0.5 * d2 / length_scale**2)
+
+    def _gp_neg_log_likelihood(self, log_params, X, y):
+        length_scale, noise = np.exp(log_params)
+        K = self._gp_kernel(X, X, length_scale) + \
+            (noise**2 + 1.e-10) * np.eye(len(y))
+        try:
+            L = np.linalg.cholesky(K)
+        except np.linalg.LinAlgError:
+            return 1.e25
+        alpha = np.linalg.solve(L.T, np.linalg.solve(L, y))
+        return 0.5 * y.dot(alpha) + np.log(np.diag(L)).sum()
+
+    def _fit_gp(self, model):
+        from scipy.optimize import minimize
+        X, y = model['X'], model['y']
+        model['y_mean'] = y.mean()
+        model['y_std'] = y.std() if y.std() > 0. else 1.
+        yn = (y - model['y_mean']) / model['y_std']
+        d_nn, _ = model['tree'].query(X, k=2)
+        x0 = np.log([max(np.mean(d_nn[:, 1]), 1.e-3) * 2., 1.e-2])
+        result = minimize(self._gp_neg_log_likelihood, x0, args=(X, yn),
+                          method='L-BFGS-B',
+                          bounds=[(np.log(1.e-3), np.log(1.e3)),
+                                  (np.log(1.e-6), np.log(1.))])
+        length_scale, noise = np.exp(result.x)
+        K = self._gp_kernel(X, X, length_scale) + \
+            (noise**2 + 1.e-10) * np.eye(len(y))
+        L = np.linalg.cholesky(K)
+        model['length_scale'] = length_scale
+        model['noise'] = noise
+        model['L'] = L
+        model['alpha'] = np.linalg.solve(L.T, np.linalg.solve(L, yn))
+
+    def _predict_gp(self, model, Xq):
+        Ks = self._gp_kernel(Xq, model['X'], model['length_scale'])
+        mean = Ks.dot(model['alpha'])
+        v = np.linalg.solve(model['L'], Ks.T)
+        var = np.maximum(1. - (v**2).sum(axis=0), 0.)
+        return (model['y_mean'] + model['y_std'] * mean,
+                model['y_std'] * np.sqrt(var))
+
+    # Prediction
+    # -------------------------------------------------------------------------
+    def _loo_error(self, model, Xq):
+        """Returns the error estimate at the points `Xq` from the
+        leave-one-out errors of the nearest samples, scaled with the distance
+        to the nearest sample."""
+        if model['tree'] is None:
+            return np.full(len(Xq), model['loo'].mean())
+        k = min(len(model['y']), 2 * Xq.shape[1] + 1)
+        dist, idx = model['tree'].query(Xq, k=k)
+        dist = dist.reshape(len(Xq), k)
+        idx = idx.reshape(len(Xq), k)
+        weights = 1. / np.maximum(dist, 1.e-12)
+        loo = (weights * model['loo'][idx]).sum(axis=1) / weights.sum(axis=1)
+        if len(model['y']) > 1:
+            d_nn, _ = model['tree'].query(model['X'], k=2)
+            d_typ = max(np.mean(d_nn[:, 1]), 1.e-12)
+        else:
+            d_typ = 1.
+        return loo * np.minimum(1., 2. * dist[:, 0] / d_typ)
+
+    def predict(self, data, return_error=False):
+        """Returns the predicted values for the query points in `data` as a
+        DataFrame with one column per target. `data` can be a DataFrame or a
+        dict of arrays containing the feature columns, or a 2D-array with one
+        column per feature (in the order of `features`). If `return_error`
+        is True, a tuple of the DataFrames of the values and of the error
+        estimates is returned.
+        """
+        if not self.is_fitted:
+            raise RuntimeError('The surrogate is not fitted yet.')
+            return
+        Xq = self._standardize(data)
+        index = data.index if isinstance(data, pd.DataFrame) else None
+        values = {}
+        errors = {}
+        for target, model in self._models.items():
+            if model['kind'] == 'mean':
+                values[target] = np.full(len(Xq), model['mean'])
+                errors[target] = self._loo_error(model, Xq)
+            elif model['kind'] == 'rbf':
+                values[target] = self._predict_rbf(model, Xq)
+                errors[target] = self._loo_error(model, Xq)
+            elif model['kind'] == 'linear':
+                value = np.asarray(model['interpolator'](Xq),
+                                   dtype=float).ravel()
+                error = self._loo_error(model, Xq)
+                outside = np.isnan(value)
+                if outside.any():
+                    _, idx = model['tree'].query(Xq[outside])
+                    value[outside] = model['y'][idx]
+                    error[outside] = np.inf
+                values[target] = value
+                errors[target] = error
+            else:
+                values[target], errors[target] = self._predict_gp(model, Xq)
+        values = pd.DataFrame(values, index=index, columns=self.targets)
+        if not return_error:
+            return values
+        errors = pd.DataFrame(errors, index=index, columns=self.targets)
+        return values, errors
@@ -0,0 +1,117 @@
+"""Defines the `SymmetryRule`-class, which declares that simulations with keys
+related by a transformation (e.g. the azimuth `phi -> -phi`, `phi -> phi+60`
+on hexagonal lattices, or the exchange of two polarizations on symmetric
+structures) have results related by a known mapping (e.g. identical
+reflectances, or two swapped columns). If symmetry rules are passed to a
+`SimulationSet`, only one representative of each set of equivalent
+simulations is solved and the results of the others are synthesized from it.
+
+Example:
+
+    rule = SymmetryRule({'phi': lambda phi: -phi}, swap=[('X', 'Y')])
+
+Authors : Carlo Barth
+
+"""
+
+import logging
+import numpy as np
+import pandas as pd
+logger = logging.getLogger(__name__)
+
+
+# =============================================================================
+class SymmetryRule(object):
+    """A transformation of the simulation keys and the corresponding mapping
+    of the results. If a simulation A has the keys `k`, a simulation B with
+    the keys `transform(k)` has the results `map_results(results(A))`.
+
+    Parameters
+    ----------
+    transform : dict or callable
+        If a dict, it maps key names to functions which are applied to the
+        column of values of the key, i.e. a pandas Series (e.g.
+        `{'phi': lambda phi: -phi}`). Keys which are not in the dict are not
+        changed. If a callable, it is called with a DataFrame with one row
+        per simulation and one column per key, and must return the
+        transformed DataFrame.
+    swap : list of tuples or NoneType, default None
+        Pairs of result columns which are exchanged by the symmetry, e.g.
+        `[('R_TE', 'R_TM')]`. All other result columns are kept.
+    result_map : callable or NoneType, default None
+        Function for more general result mappings, e.g. sign changes. It is
+        called with a DataFrame of results (after `swap` was applied) and
+        must return the mapped DataFrame.
+    decimals : int, default 10
+        Floating point keys are compared after rounding to `decimals`
+        decimals, so that e.g. `phi+60` matches despite rounding errors.
+    name : str or NoneType, default None
+        Name of the rule for log messages.
+
+    """
+
+    def __init__(self, transform, swap=None, result_map=None, decimals=10,
+                 name=None):
+        self.logger = logging.getLogger('symmetry.' +
+                                        self.__class__.__name__)
+        if not isinstance(transform, dict) and not callable(transform):
+            raise TypeError('`transform` must be a dict or a callable, not ' +
+                            '{}.'.format(type(transform)))
+            return
+        if result_map is not None and not callable(result_map):
+            raise TypeError('`result_map` must be callable.')
+            return
+        self.transform = transform
+        self.swap = [] if swap is None else [tuple(s) for s in swap]
+        self.result_map = result_map
+        self.decimals = decimals
+        self.name = name
+
+    def __repr__(self):
+        if self.name is not None:
+            return 'SymmetryRule({})'.format(self.name)
+        if isinstance(self.transform, dict):
+            return 'SymmetryRule(keys={}, swap={})'.format(
+                sorted(self.transform.keys()), self.swap)
+        return 'SymmetryRule(swap={})'.format(self.swap)
+
+    def transform_keys(self, keys):
+        """Returns the transformed copy of the DataFrame `keys`, which has
+        one row per simulation and one column per key."""
+        if not isinstance(self.transform, dict):
+            return self.transform(keys.copy())
+        transformed = keys.copy()
+        for key, func in self.transform.items():
+            if key not in transformed.columns:
+                raise KeyError('The key {} of {} is not among the '.format(
+                               key, self) + 'stored keys.')
+                return
+            transformed[key] = func(transformed[key])
+        return transformed
+
+    def map_results(self, data):
+        """Returns the copy of the results DataFrame `data` with the result
+        mapping of this rule applied."""
+        mapped = data.copy()
+        for col_a, col_b in self.swap:
+            if col_a in data.columns and col_b in data.columns:
+                mapped[col_a] = data[col_b].values
+                mapped[col_b] = data[col_a].values
+            else:
+                self.logger.warn('Unable to swap the columns {} and {}, '.
+                                 format(col_a, col_b) + 'as they are not ' +
+                                 'in the results.')
+        if self.result_map is not None:
+            mapped = self.result_map(mapped)
+        return mapped
+
+    def hash_keys(self, keys):
+        """Returns an array of hashes of the rows of the DataFrame `keys`,
+        with floating point columns rounded to `decimals` decimals."""
+        rounded = keys.copy()
+        for col in rounded.columns:
+            if pd.api.types.is_float_dtype(rounded[col]):
+                # Adding 0. avoids different hashes for -0. and 0.
+                rounded[col] = np.round(rounded[col].values,
+                                        self.decimals) + 0.
+        return pd.util.hash_pandas_object(rounded, index=False).values
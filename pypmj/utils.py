@@ -8,13 +8,13 @@ Authors : Carlo Barth
 
 from pypmj import _config, daemon
 from pypmj.internals import _IS_PYTHON3
-import collections
 if _IS_PYTHON3:
     from io import StringIO
 else:
     from cStringIO import StringIO
 from datetime import timedelta
 import errno
+import heapq
 import inspect
 from itertools import combinations
 import logging
@@ -22,6 +22,7 @@ from numbers import Number
 import numpy as np
 import os
 import pandas as pd
+import re
 from six import string_types
 import sys
 from tempfile import mktemp
@@ -44,8 +45,6 @@ def is_callable(obj):
     method.
 
     """
-    if _IS_PYTHON3:
-        return isinstance(obj, collections.Callable)
     return callable(obj)
 
 def file_content(file_path):
@@ -58,6 +57,32 @@ def tForm(t1):
     """Returns a well formated time string."""
     return str(timedelta(seconds=t1))
 
+# Clock for measuring time intervals which is not affected by system clock
+# updates. Python 2 has no monotonic clock, so we fall back to `time.time`.
+monotonic = getattr(time, 'monotonic', time.time)
+
+def sum_refinement_values(data, key):
+    """Returns the sum of the values for `key` in `data`, including the values
+    of keys of the form `key_<i>` which are created by
+    `computational_costs_to_flat_dict` if a refinement loop was used.
+
+    `data` can be a dict (e.g. a results dict of a single simulation) or a
+    pandas DataFrame. For a dict, a float is returned (NaN if no matching key
+    exists). For a DataFrame, a pandas Series with one value per row is
+    returned (all NaN if no matching column exists).
+
+    """
+    pattern = re.compile('^' + re.escape(key) + '(_\\d+)?$')
+    if isinstance(data, pd.DataFrame):
+        cols = [c for c in data.columns if pattern.match(str(c))]
+        if len(cols) == 0:
+            return pd.Series(np.nan, index=data.index)
+        return data[cols].sum(axis=1, min_count=1)
+    vals = [data[k] for k in data if pattern.match(str(k))]
+    if len(vals) == 0:
+        return np.nan
+    return float(np.sum(vals))
+
 
 def walk_df(df, col_vals, keys=None):
     """Recursively finds a row in a pandas DataFrame where all values match the
@@ -121,6 +146,26 @@ def is_sequence(obj):
                                                                  '__len__')
 
 
+def coarse_to_fine_order(n):
+    """Returns the indices 0, ..., n-1 in coarse-to-fine order, i.e. starting
+    with the first and the last index and then repeatedly bisecting the
+    largest gap, similar to a bit-reversal permutation. Any leading part of
+    the order covers the index range evenly."""
+    if n <= 2:
+        return list(range(n))
+    order = [0, n - 1]
+    gaps = [(-(n - 1), 0, n - 1)]
+    while gaps:
+        _, a, b = heapq.heappop(gaps)
+        if b - a < 2:
+            continue
+        c = (a + b) // 2
+        order.append(c)
+        heapq.heappush(gaps, (-(c - a), a, c))
+        heapq.heappush(gaps, (-(b - c), c, b))
+    return order
+
+
 def lists_overlap(list_1, list_2):
     """Checks if two lists have no common elements."""
     return not set(list_1).isdisjoint(list_2)
@@ -339,6 +384,46 @@ def rm_empty_directory_tail(path, stop_at=None):
             return
 
 
+def get_directory_size(path):
+    """Returns the total size in bytes of all files in the directory `path`
+    and its subdirectories (0 if `path` does not exist)."""
+    size = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                size += os.path.getsize(os.path.join(root, f))
+            except OSError:
+                pass
+    return size
+
+
+def get_free_disk_space(path):
+    """Returns the free disk space in bytes which is available for the
+    user on the file system containing `path`, or None if it cannot be
+    determined."""
+    if hasattr(os, 'statvfs'):
+        try:
+            stat = os.statvfs(path)
+            return stat.f_bavail * stat.f_frsize
+        except OSError:
+            return None
+    try:
+        import shutil
+        return shutil.disk_usage(path).free
+    except Exception:
+        return None
+
+
+def get_total_memory_GB():
+    """Returns the total physical memory of the local computer in GB, or None
+    if it cannot be determined."""
+    try:
+        return (os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') /
+                1024.**3)
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
 def split_path_to_parts(path):
     """Splits a path to its parts, so that `os.path.join(*parts)` gives the
     input path again."""
@@ -529,9 +614,14 @@ def __prepare_SimulationSet_after_fail(simuset):
 
 
 def run_simusets_in_save_mode(simusets, Ntrials=5, **kwargs):
-    """Given a list of SimulationSets, tries to run each SimulationSet
-    `Ntrials` times, starting at the point where it was terminated by an
-    unwanted error.
+    """Given a list of SimulationSets, tries to run them `Ntrials` times,
+    starting at the point where they were terminated by an unwanted error.
+
+    The sets are run concurrently in a `SimulationSetGroup`, so that the
+    resources are not left idle at the boundaries of the sets. If arguments
+    are given which are only supported by `SimulationSet.run` (see
+    `SINGLE_SET_RUN_ARGS`), or the new daemon interface is not available,
+    the sets are run one after another, with `Ntrials` trials per set.
 
     The `kwargs` are passed to the run-method of each set or to the
     `send_status_email` utility function. They are automatically
@@ -539,6 +629,8 @@ def run_simusets_in_save_mode(simusets, Ntrials=5, **kwargs):
     file.
 
     """
+    from pypmj.core import (SimulationSetGroup, SINGLE_SET_RUN_ARGS,
+                            NEW_DAEMON_DETECTED)
 
     if not is_sequence(simusets):
         simusets = [simusets]
@@ -569,38 +661,24 @@ def run_simusets_in_save_mode(simusets, Ntrials=5, **kwargs):
     # Start
     Nsets = len(simusets)
     ti0 = time.time()
-    for i, sset in enumerate(simusets):
-        trials = 0
-        msg = 'Starting SimulationSet {0} of {1}'.format(i + 1, Nsets)
-        if SEND_MAIL:
-            send_status_email(msg, **mail_kw)
-
-        # Run the simulations
-        while trials < Ntrials:
-            tt0 = time.time()
-            try:
-                if trials > 0:
-                    # Set up this simuset again after the error
-                    __prepare_SimulationSet_after_fail(sset)
-                sset.run(**run_kw)
-            except KeyboardInterrupt:
+    concurrent = (Nsets > 1 and NEW_DAEMON_DETECTED and
+                  not any([sset.use_resultbag for sset in simusets]) and
+                  not any([k in SINGLE_SET_RUN_ARGS for k in run_kw]))
+    if concurrent:
+        group = SimulationSetGroup(simusets)
+        if not __run_in_save_mode(group, 'The {0} SimulationSets'.format(
+                                  Nsets), Ntrials, run_kw, mail_kw):
+            # Allow keyboard interrupts
+            return
+    else:
+        for i, sset in enumerate(simusets):
+            finished = __run_in_save_mode(
+                            sset, 'SimulationSet {0} of {1}'.format(i + 1,
+                                                                    Nsets),
+                            Ntrials, run_kw, mail_kw)
+            if not finished:
                 # Allow keyboard interrupts
                 return
-            except:
-                trials += 1
-                msg = 'SimulationSet {0} failed at trial {1} of {2}'.\
-                      format(i + 1, trials, Ntrials)
-                msg += '\n\n***Error Message:\n' + \
-                       traceback.format_exc() + '\n***'
-                if SEND_MAIL:
-                    send_status_email(msg, **mail_kw)
-                continue
-            break
-        ttend = tForm(time.time() - tt0)
-        msg = 'Finished SimulationSet {0} of {1}. Runtime: {2}'.\
-              format(i + 1, Nsets, ttend)
-        if SEND_MAIL:
-            send_status_email(msg, **mail_kw)
 
     tend = tForm(time.time() - ti0)
     msg = 'All simulations finished after {0}'.format(tend)
@@ -609,6 +687,49 @@ def run_simusets_in_save_mode(simusets, Ntrials=5, **kwargs):
         send_status_email(msg, **mail_kw)
 
 
+def __run_in_save_mode(runner, name, Ntrials, run_kw, mail_kw):
+    """Tries to run the `runner` (a SimulationSet or a SimulationSetGroup)
+    `Ntrials` times. `name` is used in the status e-mails. Returns False if
+    the run was stopped by a keyboard interrupt, True otherwise."""
+    if hasattr(runner, 'simusets'):
+        simusets = runner.simusets
+    else:
+        simusets = [runner]
+    trials = 0
+    msg = 'Starting {0}'.format(name)
+    if SEND_MAIL:
+        send_status_email(msg, **mail_kw)
+
+    # Run the simulations
+    tt0 = time.time()
+    while trials < Ntrials:
+        tt0 = time.time()
+        try:
+            if trials > 0:
+                # Set up the simusets again after the error
+                for sset in simusets:
+                    __prepare_SimulationSet_after_fail(sset)
+            runner.run(**run_kw)
+        except KeyboardInterrupt:
+            # Allow keyboard interrupts
+            return False
+        except:
+            trials += 1
+            msg = '{0} failed at trial {1} of {2}'.format(name, trials,
+                                                          Ntrials)
+            msg += '\n\n***Error Message:\n' + \
+                   traceback.format_exc() + '\n***'
+            if SEND_MAIL:
+                send_status_email(msg, **mail_kw)
+            continue
+        break
+    ttend = tForm(time.time() - tt0)
+    msg = 'Finished {0}. Runtime: {1}'.format(name, ttend)
+    if SEND_MAIL:
+        send_status_email(msg, **mail_kw)
+    return True
+
+
 # -----------------------------------------------------------------------------
 #
 # The following is based on the code of Giampaolo Rodola that can be found
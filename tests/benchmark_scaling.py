@@ -0,0 +1,334 @@
+"""Scaling benchmarks for the scheduling and storage hot paths of pypmj.
+
+The benchmarks run without JCMsuite using the mocked backend in
+`mock_jcmwave.py`, so that only the overhead introduced by pypmj itself is
+measured. Run this script from the `tests` directory, e.g.
+
+    python benchmark_scaling.py --sizes 1e2 1e3 1e4 --output bench.json
+
+Each stage is timed for each number of simulations given by `--sizes`. Stages
+which scale badly are skipped above a configurable maximum size (see
+`--max-n`). The results are written as JSON, so that they can be compared
+between releases. Use `--baseline` to compare against a previous JSON output:
+the script exits with status 1 if any stage got slower than `--tolerance`
+times the baseline.
+
+Authors : Carlo Barth
+
+"""
+
+import argparse
+from datetime import datetime
+import json
+import logging
+import platform
+from shutil import rmtree
+import sys
+import tempfile
+import timeit
+
+import mock_jcmwave
+
+# Default maximum numbers of simulations for which a stage is executed.
+# Larger sizes are reported with status 'skipped'.
+DEFAULT_MAX_N = {'get_simulation_list': 10**6,
+                 'sort_simulations': 10**6,
+                 'schedule_empty_store': 10**6,
+                 'schedule_matching_store': 10**6,
+                 'schedule_extended_store': 10**4,
+                 'compare_to_store': 10**4,
+                 'append_store': 10**3,
+                 'run': 10**4,
+                 'run_zip': 10**3}
+STAGES = list(DEFAULT_MAX_N.keys())
+N_GEOMETRIES = 10
+
+
+def get_keys(n_sims, n_geometries=N_GEOMETRIES):
+    """Returns a keys-dict for a `SimulationSet` in product mode with exactly
+    `n_sims` simulations and up to `n_geometries` distinct geometries. The
+    number of geometries is the largest divisor of `n_sims` which does not
+    exceed `n_geometries`."""
+    import numpy as np
+    n_geometries = max([i for i in range(1, min(n_geometries, n_sims) + 1)
+                        if n_sims % i == 0])
+    n_params = n_sims // n_geometries
+    return {'constants': {},
+            'parameters': {'wavelength': np.linspace(0.4, 0.8, n_params)},
+            'geometry': {'radius': np.linspace(0.3, 0.5, n_geometries)}}
+
+
+class ScalingBenchmark(object):
+    """Runs the benchmark stages in a temporary storage directory."""
+
+    def __init__(self, sizes, max_n=None, repeat=1):
+        self.sizes = sizes
+        self.max_n = dict(DEFAULT_MAX_N)
+        if max_n is not None:
+            self.max_n.update(max_n)
+        self.repeat = repeat
+        self.results = []
+        self.tmp_dir = tempfile.mkdtemp(prefix='pypmj_bench_')
+        self.backend = mock_jcmwave.install(self.tmp_dir)
+        import pypmj
+        self.jpy = pypmj
+        self._counter = 0
+        self._simusets = []
+
+    def _new_simuset(self, n_sims, keys=None, storage_folder=None):
+        """Returns a new SimulationSet in a fresh storage folder (or in
+        `storage_folder` if given)."""
+        self._counter += 1
+        if storage_folder is None:
+            storage_folder = 'set_{}'.format(self._counter)
+        if keys is None:
+            keys = get_keys(n_sims)
+        project = self.jpy.JCMProject(mock_jcmwave.DEFAULT_PROJECT,
+                    working_dir=self.tmp_dir + '/project_{}'.format(
+                                                                self._counter))
+        simuset = self.jpy.SimulationSet(project, keys,
+                                         storage_folder=storage_folder,
+                                         storage_base=self.tmp_dir)
+        self._simusets.append(simuset)
+        return simuset
+
+    def _close_stores(self):
+        """Closes the stores of all SimulationSets created so far."""
+        for simuset in self._simusets:
+            simuset.close_store()
+        self._simusets = []
+
+    def _fill_store(self, simuset):
+        """Writes fake results for all simulations of a scheduled
+        `simuset` to its HDF5 store, including the metadata."""
+        data = simuset.simulation_properties.copy()
+        data['CpuTime'] = 1.
+        data['TotalTime'] = 1.
+        simuset.append_store(data)
+        simuset._store_metadata()
+
+    def _time(self, func, setup=None):
+        """Returns the minimum time of `repeat` executions of `func`. `setup`
+        is called before each execution and its return value is passed to
+        `func`."""
+        times = []
+        for _ in range(self.repeat):
+            arg = setup() if setup is not None else None
+            t0 = timeit.default_timer()
+            func(arg)
+            times.append(timeit.default_timer() - t0)
+        return min(times)
+
+    # Stage definitions
+    # -------------------------------------------------------------------------
+    def stage_get_simulation_list(self, n):
+        def setup():
+            return self._new_simuset(n)
+        return self._time(lambda s: s._get_simulation_list(), setup)
+
+    def stage_sort_simulations(self, n):
+        def setup():
+            s = self._new_simuset(n)
+            s._get_simulation_list()
+            return s
+        return self._time(lambda s: s._sort_simulations(), setup)
+
+    def stage_schedule_empty_store(self, n):
+        return self._time(lambda s: s.make_simulation_schedule(),
+                          lambda: self._new_simuset(n))
+
+    def stage_schedule_matching_store(self, n):
+        def setup():
+            s = self._new_simuset(n)
+            s.make_simulation_schedule()
+            self._fill_store(s)
+            s.close_store()
+            return self._new_simuset(n, storage_folder=s.storage_dir)
+        return self._time(lambda s: s.make_simulation_schedule(), setup)
+
+    def __extended_pair(self, n):
+        """Returns a SimulationSet scheduled for `n` simulations, the store of
+        which already contains results of a set with the same radii but only
+        every second wavelength (i.e. an extended store)."""
+        keys = get_keys(n)
+        keys_old = get_keys(n)
+        keys_old['parameters']['wavelength'] = \
+                                    keys['parameters']['wavelength'][::2]
+        s_old = self._new_simuset(n, keys=keys_old)
+        s_old.make_simulation_schedule()
+        self._fill_store(s_old)
+        s_old.close_store()
+        return self._new_simuset(n, keys=keys, storage_folder=s_old.storage_dir)
+
+    def stage_schedule_extended_store(self, n):
+        return self._time(lambda s: s.make_simulation_schedule(),
+                          lambda: self.__extended_pair(n))
+
+    def stage_compare_to_store(self, n):
+        def setup():
+            s = self.__extended_pair(n)
+            s._get_simulation_list()
+            s._sort_simulations()
+            return s
+        return self._time(lambda s: s._compare_to_store(
+                                            s.simulation_properties), setup)
+
+    def stage_append_store(self, n):
+        def setup():
+            s = self._new_simuset(n)
+            s.make_simulation_schedule()
+            s._store_metadata()
+            data = s.simulation_properties.copy()
+            data['CpuTime'] = 1.
+            data['TotalTime'] = 1.
+            return s, [data.iloc[[i]] for i in range(len(data))]
+
+        def append_rows(arg):
+            s, rows = arg
+            for row in rows:
+                s.append_store(row)
+        return self._time(append_rows, setup)
+
+    def __run(self, n, wdir_mode):
+        def setup():
+            s = self._new_simuset(n)
+            s.make_simulation_schedule()
+            return s
+        return self._time(lambda s: s.run(wdir_mode=wdir_mode), setup)
+
+    def stage_run(self, n):
+        return self.__run(n, 'delete')
+
+    def stage_run_zip(self, n):
+        return self.__run(n, 'zip')
+
+    # Execution
+    # -------------------------------------------------------------------------
+    def run(self, stages=None):
+        """Runs all (or the given) stages for all sizes."""
+        if stages is None:
+            stages = STAGES
+        for n in self.sizes:
+            for stage in stages:
+                entry = {'stage': stage, 'n_sims': n}
+                if n > self.max_n[stage]:
+                    entry.update(status='skipped', seconds=None,
+                                 seconds_per_sim=None)
+                else:
+                    func = getattr(self, 'stage_' + stage)
+                    with self.jpy.utils.DisableLogger(logging.WARN):
+                        try:
+                            t = func(n)
+                        finally:
+                            self._close_stores()
+                    entry.update(status='ok', seconds=t,
+                                 seconds_per_sim=t / float(n))
+                self.results.append(entry)
+                self._print_entry(entry)
+        return self.results
+
+    def _print_entry(self, entry):
+        if entry['status'] == 'skipped':
+            tstr = 'skipped'
+        else:
+            tstr = '{:10.4f} s ({:.3e} s/sim)'.format(entry['seconds'],
+                                                      entry['seconds_per_sim'])
+        sys.stdout.write('{:<26s} n={:<8d} {}\n'.format(entry['stage'],
+                                                        entry['n_sims'], tstr))
+        sys.stdout.flush()
+
+    def clean_up(self):
+        rmtree(self.tmp_dir, ignore_errors=True)
+
+    def meta_data(self):
+        """Returns information on the benchmark environment."""
+        import numpy as np
+        import pandas as pd
+        return {'pypmj_version': self.jpy.__version__,
+                'python_version': platform.python_version(),
+                'numpy_version': np.__version__,
+                'pandas_version': pd.__version__,
+                'platform': platform.platform(),
+                'date': datetime.now().isoformat(),
+                'repeat': self.repeat,
+                'n_geometries': N_GEOMETRIES}
+
+    def to_dict(self):
+        return {'meta': self.meta_data(), 'results': self.results}
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """Compares `results` to the results of a `baseline` (both as returned by
+    `ScalingBenchmark.to_dict`). Returns a list of regressions, i.e. entries
+    that are slower than `tolerance` times the baseline."""
+    base = {(e['stage'], e['n_sims']): e for e in baseline['results']}
+    regressions = []
+    for entry in results['results']:
+        ref = base.get((entry['stage'], entry['n_sims']))
+        if ref is None or entry['status'] != 'ok' or ref['status'] != 'ok':
+            continue
+        if entry['seconds'] > tolerance * ref['seconds']:
+            regressions.append({'stage': entry['stage'],
+                                'n_sims': entry['n_sims'],
+                                'seconds': entry['seconds'],
+                                'baseline_seconds': ref['seconds']})
+    return regressions
+
+
+def parse_max_n(items):
+    """Parses a list of 'stage=N' strings into a dict."""
+    max_n = {}
+    for item in items:
+        stage, _, value = item.partition('=')
+        if stage not in DEFAULT_MAX_N:
+            raise ValueError('Unknown stage: {}. Known stages are: {}'.
+                             format(stage, STAGES))
+        max_n[stage] = int(float(value))
+    return max_n
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Runs scaling benchmarks ' +
+                                     'of `pypmj` using a mocked JCMsuite ' +
+                                     'backend.')
+    parser.add_argument('--sizes', nargs='+', type=float,
+                        default=[1e2, 1e3, 1e4, 1e5, 1e6],
+                        help='Numbers of simulations to benchmark.')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=None,
+                        help='Stages to run (default: all).')
+    parser.add_argument('--max-n', nargs='*', default=[],
+                        help='Override the maximum size of stages, e.g. ' +
+                        'run=100000 (defaults: {}).'.format(DEFAULT_MAX_N))
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='Number of repetitions (the minimum is used).')
+    parser.add_argument('--output', default=None,
+                        help='Path of the JSON output file.')
+    parser.add_argument('--baseline', default=None,
+                        help='JSON output of a previous benchmark to compare ' +
+                        'with.')
+    parser.add_argument('--tolerance', type=float, default=1.5,
+                        help='Allowed slow-down factor compared to the ' +
+                        'baseline.')
+    args = parser.parse_args()
+
+    bench = ScalingBenchmark([int(s) for s in args.sizes],
+                             max_n=parse_max_n(args.max_n),
+                             repeat=args.repeat)
+    try:
+        bench.run(args.stages)
+    finally:
+        bench.clean_up()
+    output = bench.to_dict()
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(output, baseline, args.tolerance)
+        for r in regressions:
+            sys.stdout.write('REGRESSION: {stage} (n={n_sims}): {seconds:.4f} '
+                             's vs. {baseline_seconds:.4f} s\n'.format(**r))
+        if len(regressions) > 0:
+            sys.exit(1)
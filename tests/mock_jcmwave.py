@@ -0,0 +1,257 @@
+"""A mocked JCMsuite backend (`jcmwave` and `jcmwave.daemon`) which allows to
+drive pypmj without a JCMsuite installation, e.g. for benchmarks of the
+scheduling and storage code paths on a laptop.
+
+The mocked solver does not compute anything. Jobs finish instantly (in order
+of submission) and return computational costs which can be controlled using a
+function of the simulation keys. Use `install` *before* anything else imports
+`pypmj.core`.
+
+Authors : Carlo Barth
+
+"""
+
+import json
+import os
+import re
+import sys
+if 'pypmj' not in os.listdir('..'):
+    raise OSError('Unable to find the pypmj module in the parent' +
+                  ' directory. Make sure that the `test` folder is in the' +
+                  ' same directory as the `pypmj` folder.')
+    exit()
+sys.path.append('..')
+
+# Do not use any configuration file from the environment, as this would
+# trigger the import of the real jcmwave
+os.environ['PYPMJ_IGNORE_CONFIG_FILE'] = 'yes'
+
+MOCK_JCM_VERSION = '3.6.0'
+DEFAULT_PROJECT = os.path.abspath(os.path.join('..', 'projects', 'scattering',
+                                               'mie', 'mie2D'))
+
+
+def default_cost_func(keys):
+    """Returns computational costs which are independent of the keys."""
+    return {'CpuTime': 1., 'TotalTime': 1., 'TotalMemory_GB': 0.1}
+
+
+class MockDaemon(object):
+    """Mimics the *new* `jcmwave.daemon` interface. Finished jobs are
+    returned in order of submission, `n_per_wait` at a time if
+    `break_condition` is 'any'."""
+
+    def __init__(self, backend, n_per_wait=1):
+        self.backend = backend
+        self.n_per_wait = n_per_wait
+        self.active_daemon = True  # <- marks the new daemon interface
+        self._resource_counter = 0
+        self.resources_added = []
+
+    def _add_resource(self, **kwargs):
+        self._resource_counter += 1
+        self.resources_added.append(kwargs)
+        return [self._resource_counter]
+
+    def add_workstation(self, **kwargs):
+        return self._add_resource(**kwargs)
+
+    def add_queue(self, **kwargs):
+        return self._add_resource(**kwargs)
+
+    def daemonCheck(self, warn=True):
+        return len(self.resources_added) > 0
+
+    def cancel(self, job_ids):
+        for job_id in job_ids:
+            self.backend.hung.pop(job_id, None)
+            self.backend.pending.pop(job_id, None)
+            self.backend.cancelled.append(job_id)
+
+    def shutdown(self):
+        self.resources_added = []
+
+    def wait(self, job_ids=None, break_condition='all', timeout=None,
+             resultbag=None, verbose=True):
+        if job_ids is None:
+            job_ids = list(self.backend.pending)
+        elif not any([j in self.backend.pending or j in self.backend.hung
+                      for j in job_ids]):
+            raise RuntimeError('Unknown job ids: {}'.format(job_ids))
+        job_ids = [j for j in job_ids if j in self.backend.pending]
+        if len(job_ids) == 0 and timeout is not None:
+            # Only hanging jobs
+            return {}, {}
+        if break_condition == 'any':
+            job_ids = job_ids[:self.n_per_wait]
+        results = {}
+        for job_id in job_ids:
+            results[job_id] = self.backend.pending.pop(job_id)
+        return results, {}
+
+
+class MockJCM(object):
+    """Mimics the parts of the `jcmwave` module which are used by pypmj."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def startup(self):
+        pass
+
+    def geo(self, project_dir=None, keys=None, working_dir=None, **kwargs):
+        self.backend.n_geo_calls += 1
+
+    def solve(self, project_file, keys=None, working_dir=None, mode='solve',
+              **kwargs):
+        self.backend.project_file = project_file
+        return self.backend.submit(keys, working_dir,
+                                   kwargs.get('resource_ids', None))
+
+    def view(self, *args, **kwargs):
+        pass
+
+    def loadtable(self, file_name, **kwargs):
+        with open(file_name, 'r') as f:
+            return json.load(f)
+
+
+class MockBackend(object):
+    """Holds the state of the mocked solver.
+
+    Parameters
+    ----------
+    cost_func : callable or NoneType, default None
+        Function of the simulation keys returning a dict of computational
+        costs. If None, `default_cost_func` is used.
+    fail_func : callable or NoneType, default None
+        Function of the simulation keys returning True if the simulation
+        should fail.
+    hang_func : callable or NoneType, default None
+        Function of the simulation keys returning True if the first job for
+        these keys should hang, i.e. never finish unless it is cancelled.
+    n_per_wait : int, default 1
+        Number of jobs returned by each `daemon.wait` call with
+        `break_condition='any'`.
+    write_files : bool, default False
+        Whether to write the computational costs of successful jobs as JSON
+        to '<project name>_results/computational_costs.jcm' in the working
+        directory (readable using the mocked `loadtable`). Each post process
+        of the project file then also writes a table to its
+        `OutputFileName`, which is returned in the results as well.
+
+    """
+
+    def __init__(self, cost_func=None, fail_func=None, n_per_wait=1,
+                 hang_func=None, write_files=False):
+        if cost_func is None:
+            cost_func = default_cost_func
+        self.cost_func = cost_func
+        self.fail_func = fail_func
+        self.hang_func = hang_func
+        self.write_files = write_files
+        self.project_file = 'project.jcmp'
+        self.pending = {}
+        self.hung = {}
+        self.cancelled = []
+        self._hung_keys = set()
+        self._job_counter = 0
+        self.n_geo_calls = 0
+        self.n_solve_calls = 0
+        self.max_concurrent = {}
+        self.jcm = MockJCM(self)
+        self.daemon = MockDaemon(self, n_per_wait)
+
+    def submit(self, keys, working_dir, resource_ids=None):
+        self._job_counter += 1
+        self.n_solve_calls += 1
+        job_id = self._job_counter
+        failed = self.fail_func is not None and self.fail_func(keys)
+        ccosts = {'title': 'ComputationalCosts'}
+        ccosts.update(self.cost_func(keys))
+        project_name = os.path.splitext(
+                                os.path.basename(self.project_file))[0]
+        fieldbag = os.path.join(working_dir, project_name + '_results',
+                                'fieldbag.jcm')
+        self.pending[job_id] = {
+            'logs': {'Log': {'Out': '', 'Error': ''},
+                     'ExitCode': 1 if failed else 0},
+            'results': [] if failed else [{'computational_costs': ccosts,
+                                           'file': fieldbag}],
+            'resource_id': 1 if not resource_ids else resource_ids[0]}
+        if self.write_files and not failed:
+            results_dir = os.path.dirname(fieldbag)
+            if not os.path.isdir(results_dir):
+                os.makedirs(results_dir)
+            with open(os.path.join(results_dir, 'computational_costs.jcm'),
+                      'w') as f:
+                json.dump(ccosts, f)
+            self._write_post_process_tables(keys, working_dir,
+                                            self.pending[job_id]['results'])
+
+        # Let the first job for these keys hang if desired
+        if self.hang_func is not None and self.hang_func(keys):
+            key_id = repr(sorted([(k, str(v)) for k, v in keys.items()
+                                  if k != 'wdir']))
+            if not key_id in self._hung_keys:
+                self._hung_keys.add(key_id)
+                self.hung[job_id] = self.pending.pop(job_id)
+                return job_id
+
+        # Track the maximum number of concurrent jobs per resource
+        resource_id = self.pending[job_id]['resource_id']
+        n_concurrent = len([j for j in self.pending.values()
+                            if j['resource_id'] == resource_id])
+        self.max_concurrent[resource_id] = max(
+                        self.max_concurrent.get(resource_id, 0), n_concurrent)
+        return job_id
+
+
+    def _write_post_process_tables(self, keys, working_dir, results):
+        """Writes a table for each `OutputFileName` of the project file and
+        appends it to the `results`."""
+        with open(self.project_file, 'r') as f:
+            names = re.findall(r'OutputFileName\s*=\s*"([^"]*)"', f.read())
+        for i, name in enumerate(names):
+            table = {'title': os.path.basename(name), 'index': i,
+                     'radius': keys.get('radius')}
+            file_ = os.path.join(working_dir, name)
+            if not os.path.isdir(os.path.dirname(file_)):
+                os.makedirs(os.path.dirname(file_))
+            with open(file_, 'w') as f:
+                json.dump(table, f)
+            results.append(table)
+
+
+def install(storage_base, **backend_kwargs):
+    """Installs a `MockBackend` as jcmwave/daemon in the pypmj namespace,
+    imports the core classes and returns the backend. `storage_base` is
+    configured as the Storage->base directory. `backend_kwargs` are passed to
+    `MockBackend`."""
+    import pypmj
+    if 'pypmj.core' in sys.modules:
+        raise RuntimeError('pypmj.core was already imported. The mocked ' +
+                           'backend must be installed before.')
+    backend = MockBackend(**backend_kwargs)
+
+    # Configure pypmj as `import_jcmwave` would do
+    pypmj._config.set('JCMsuite', 'root', os.path.dirname(storage_base))
+    pypmj._config.set('JCMsuite', 'dir', os.path.basename(storage_base))
+    pypmj._config.set('Storage', 'base', storage_base)
+    pypmj.jcm = backend.jcm
+    pypmj.daemon = backend.daemon
+    pypmj.__jcm_version__ = MOCK_JCM_VERSION
+    pypmj.jcmwave_imported = True
+    pypmj._set_up_resources(backend.daemon)
+    pypmj.utils.daemon = backend.daemon
+
+    from pypmj import core
+    for name in ['JCMProject', 'Simulation', 'ResourceManager',
+                 'SimulationSet', 'SimulationSetGroup', 'ConvergenceTest',
+                 'AdaptiveScan', 'QuantityMinimizer']:
+        setattr(pypmj, name, getattr(core, name))
+    return backend
+
+
+if __name__ == '__main__':
+    pass
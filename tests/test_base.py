@@ -136,6 +136,7 @@ jpy.load_extension('materials')
 EXT_MATERIALS_LOADED = hasattr(jpy, 'MaterialData')
 
 # Import remaining modules
+import json
 import logging
 import numpy as np
 from shutil import rmtree
@@ -207,6 +208,35 @@ class Test_JCMbasics(unittest.TestCase):
         jpy.resources['localhost'].add_repeatedly()
         jpy.daemon.shutdown()
 
+    def test_parallelization_add_concurrently(self):
+        resources = jpy.parallelization.ResourceDict()
+        resources['localhost'] = jpy.resources['localhost']
+        resources.add_all_concurrently(n_shots=3, wait_seconds=1)
+        resources.wait_for_pending()
+        self.assertEqual(resources.get_pending_resources(), [])
+        self.assertTrue(resources['localhost'].resourceIDs is not None)
+        jpy.daemon.shutdown()
+
+    def test_resource_scheduler(self):
+        from pypmj.parallelization import (DaemonResource, ResourceDict,
+                                           ResourceScheduler)
+        resources = ResourceDict()
+        for nick, mem in [('small', 8.), ('large', 16.)]:
+            resources[nick] = DaemonResource(jpy.daemon, nick, '', None, 4,
+                                             1, 'Workstation', nick,
+                                             memory_GB=mem)
+        scheduler = ResourceScheduler(resources)
+        for job_id in range(6):
+            nick = scheduler.select_resource(5.)
+            if nick is None:
+                break
+            scheduler.assign(job_id, nick, 5.)
+        self.assertEqual(len(scheduler.get_jobs('small')), 1)
+        self.assertEqual(len(scheduler.get_jobs('large')), 3)
+        self.assertTrue(scheduler.select_resource(5.) is None)
+        self.assertEqual(scheduler.release(0), 'large')
+        self.assertEqual(scheduler.select_resource(5.), 'large')
+
     def test_simuSet_basic(self):
         project = jpy.JCMProject(DEFAULT_PROJECT, working_dir=self.tmpDir)
 
@@ -249,6 +279,27 @@ class Test_JCMbasics(unittest.TestCase):
                 self.assertDictEqual(gtype, allGeoKeys[i])
         simuset.close_store()
 
+    def test_submission_journal(self):
+        project = jpy.JCMProject(DEFAULT_PROJECT, working_dir=self.tmpDir)
+        simuset = jpy.SimulationSet(project, MIE_KEYS, **self.DF_ARGS)
+        simuset.make_simulation_schedule()
+        journal = jpy.SubmissionJournal(os.path.join(simuset.storage_dir,
+                                                     'journal.jsonl'))
+        for job_id, sim in enumerate(simuset.simulations[:3]):
+            sim.job_id = job_id
+            journal.on_submit(simuset, sim)
+        journal.on_stored(simuset, simuset.simulations[0])
+        journal.on_failed(simuset, simuset.simulations[1])
+        journal.close()
+        self.assertEqual(list(journal.get_open_submissions().keys()), [2])
+        journal.remove()
+        self.assertFalse(os.path.isfile(journal.file_path))
+        # Harvested post process results are matched by their file names
+        files = simuset._get_post_process_files(simuset.simulations[0])
+        self.assertEqual([os.path.basename(f) for f in files],
+                         ['energyflux_scattered.jcm'])
+        simuset.close_store()
+
 
 # ==============================================================================
 class Test_Run_JCM(unittest.TestCase):
@@ -282,9 +333,358 @@ class Test_Run_JCM(unittest.TestCase):
         _, _ = self.sset.solve_single_simulation(sim)
         self.assertTrue(hasattr(sim, 'fieldbag_file'))
 
+    def test_submit_simulation(self):
+        sim = self.sset.simulations[0]
+        self.sset.compute_geometry(sim)
+        future = sim.submit()
+        results, _ = future.result(timeout=600)
+        self.assertTrue(future.done())
+        self.assertTrue('Finished' in sim.status)
+
     def test_plain_run(self):
         self.sset.run()
 
+    def test_run_with_timings(self):
+        self.sset.run(store_timings=True)
+        data = self.sset.get_store_data()
+        for col in ['t_submit', 't_finished', 't_store_start']:
+            self.assertTrue(col in data.columns)
+        report = self.sset.get_timing_report()
+        self.assertEqual(report.loc['submission', 'count'], 6)
+        self.assertTrue(report.loc['overhead', 'total'] <=
+                        report.loc['run', 'total'])
+        self.assertEqual(report.loc['overhead', 'count'], 6)
+
+        # Parallel phases are only compared to the lifetimes of the sims
+        self.assertTrue(np.isnan(report.loc['waiting', 'fraction_of_run']))
+        self.assertTrue(report.loc['waiting', 'fraction_of_sim_time'] <= 1.)
+
+    def test_run_with_hooks(self):
+        stored = []
+        self.sset.hooks.register('on_stored',
+                                 lambda sset, sim: stored.append(sim.number))
+        profiler = jpy.ProfilerHook()
+        self.sset.hooks.add(profiler)
+        self.sset.run()
+        self.assertEqual(sorted(stored), list(range(6)))
+        self.assertTrue(profiler.get_report() is not None)
+
+    def test_run_end_hooks_on_interrupt(self):
+        def interrupt(sset, sim):
+            raise KeyboardInterrupt()
+        df_args = dict(self.DF_ARGS)
+        df_args['storage_folder'] = os.path.join('tmp_storage_folder',
+                                                 'interrupted')
+        profiler = jpy.ProfilerHook()
+        sset = jpy.SimulationSet(self.project, MIE_KEYS_SINGLE,
+                                 hooks=profiler, **df_args)
+        sset.make_simulation_schedule()
+        sset.hooks.register('on_submit', interrupt)
+        with self.assertRaises(KeyboardInterrupt):
+            sset.run()
+        self.assertTrue(profiler.get_report() is not None)
+        sset.close_store()
+
+    def test_run_with_metrics(self):
+        json_file = os.path.join(self.tmpDir, 'metrics.json')
+        exporter = jpy.MetricsExporter(json_file=json_file)
+        self.sset.hooks.add(exporter)
+        self.sset.run()
+        with open(json_file, 'r') as f:
+            metrics = json.load(f)
+        self.assertEqual(metrics['completed'], 6)
+        self.assertEqual(metrics['in_flight'], 0)
+
+    def test_lpt_submission_order(self):
+        self.sset.run()
+        # Fit the cost model to costs which grow with the radius, so that
+        # the largest radius is expected to take longest
+        data = self.sset.get_store_data()
+        data['TotalTime'] = 100. * data['radius']
+        model = self.sset.fit_cost_model(data=data)
+        self.assertTrue(model is not None)
+        df_args = dict(self.DF_ARGS)
+        df_args['storage_folder'] = os.path.join('tmp_storage_folder', 'lpt')
+        sset = jpy.SimulationSet(self.project, MIE_KEYS, **df_args)
+        sset.cost_model = model
+        sset.make_simulation_schedule(submission_order='lpt')
+        self.assertEqual(sset.num_sims_to_do(), 6)
+        self.assertEqual(sset.get_submission_order(), [5, 4, 3, 2, 1, 0])
+        predicted = sset.predict_costs()
+        self.assertTrue((predicted > 0.).all())
+        sset.run()
+        self.assertTrue(sset.all_done())
+        sset.close_store()
+
+    def test_space_filling_submission_order(self):
+        self.sset.make_simulation_schedule(submission_order='space_filling')
+        order = self.sset.get_submission_order()
+        self.assertEqual(order, [0, 5, 2, 3, 1, 4])
+        self.sset.run()
+        self.assertTrue(self.sset.all_done())
+
+    def test_plan(self):
+        report = self.sset.plan()
+        self.assertEqual(report['n_new'], 6)
+        self.sset.run()
+        self.sset.make_simulation_schedule()
+        report = self.sset.plan(data=self.sset.get_store_data())
+        self.assertEqual(report['n_new'], 0)
+        self.assertTrue(report['n_history_samples'] >= 6)
+        self.assertTrue(report['recommended_wdir_mode'] in
+                        ['keep', 'zip', 'delete'])
+
+        # Duplicates and symmetric simulations are not solved
+        df_args = dict(self.DF_ARGS)
+        df_args['storage_folder'] = os.path.join('tmp_storage_folder',
+                                                 'plan_derived')
+        rule = jpy.SymmetryRule({'radius': lambda r: r + 0.1})
+        sset = jpy.SimulationSet(self.project,
+                                 {'geometry': {'radius': [0.3, 0.3, 0.4,
+                                                          0.35]}},
+                                 combination_mode='list', symmetries=rule,
+                                 **df_args)
+        sset.make_simulation_schedule()
+        report = sset.plan()
+        self.assertEqual(report['n_new'], 2)
+        self.assertEqual(report['n_skipped'], 2)
+        self.assertEqual(report['n_new'], sset.num_sims_to_do())
+        sset.close_store()
+
+    def test_run_with_memory_limit(self):
+        localhost = self.sset.get_current_resources()['localhost']
+        try:
+            localhost.memory_GB = 1.
+            self.sset.run(memory_per_sim=0.6)
+        finally:
+            localhost.memory_GB = None
+        self.assertTrue(self.sset.all_done())
+
+    def test_run_with_memory_per_sim_callable(self):
+        memory = self.sset.predict_memory(lambda keys: keys['radius'])
+        self.assertEqual(list(memory.index), list(range(6)))
+        self.assertAlmostEqual(memory[0], 0.3)
+        localhost = self.sset.get_current_resources()['localhost']
+        try:
+            localhost.memory_GB = 1.
+            self.sset.run(memory_per_sim=lambda keys: 2. * keys['radius'])
+        finally:
+            localhost.memory_GB = None
+        self.assertTrue(self.sset.all_done())
+
+    def test_run_with_geometry_affinity(self):
+        self.sset.run(geometry_affinity=True)
+        self.assertTrue(self.sset.all_done())
+        resource_ids = {}
+        for sim in self.sset.simulations:
+            geo = tuple([sim.keys[k] for k in self.sset.geometry])
+            resource_ids.setdefault(geo, set()).add(sim.resource_id)
+        for ids in resource_ids.values():
+            self.assertEqual(len(ids), 1)
+
+    def test_run_with_straggler_policy(self):
+        policy = jpy.StragglerPolicy(factor=5., min_runtime=1., timeout=600.)
+        self.assertTrue(policy.is_timed_out(601.))
+        self.assertFalse(policy.is_timed_out(599.))
+        self.sset.run(straggler_policy=policy)
+        self.assertTrue(self.sset.all_done())
+        self.assertTrue(policy.n_speculative <= self.sset.num_sims)
+
+    def test_run_with_retry_policy(self):
+        policy = jpy.RetryPolicy(max_retries=2, backoff=1.,
+                                 backoff_factor=3.)
+        self.assertEqual(policy.get_delay(0), 1.)
+        policy.record(0)
+        self.assertEqual(policy.get_delay(0), 3.)
+        self.sset.run(retry_policy=policy)
+        self.assertTrue(self.sset.all_done())
+        self.assertEqual(len(self.sset.failed_simulations), 0)
+
+    def test_run_simulation_set_group(self):
+        df_args = dict(self.DF_ARGS)
+        df_args['storage_folder'] = os.path.join('tmp_storage_folder',
+                                                 'single')
+        sset_single = jpy.SimulationSet(self.project, MIE_KEYS_SINGLE,
+                                        **df_args)
+        sset_single.make_simulation_schedule()
+        group = jpy.SimulationSetGroup([self.sset, sset_single],
+                                       weights=[2., 1.])
+        group.run(N=2)
+        self.assertTrue(group.all_done())
+        self.assertEqual(len(sset_single.get_store_data()), 1)
+        sset_single.close_store()
+
+    def test_run_simulation_set_group_incrementally(self):
+        df_args = dict(self.DF_ARGS)
+        df_args['storage_folder'] = os.path.join('tmp_storage_folder',
+                                                 'incremental')
+        sset = jpy.SimulationSet(self.project,
+                                 {'geometry': {'radius': [0.3, 0.35]}},
+                                 combination_mode='list', **df_args)
+        sset.make_simulation_schedule()
+        group = jpy.SimulationSetGroup([sset])
+        self.assertTrue(group.start(N=1, additional_keys={'extra_key': 1}))
+        finished = []
+        try:
+            for _, sim in group.iter_finished():
+                finished.append(sim.number)
+                if len(finished) == 1:
+                    group.append(sset, sset.append_simulations(
+                                                        [{'radius': 0.4}]))
+        finally:
+            group.finish()
+        self.assertEqual(sorted(finished), [0, 1, 2])
+        self.assertTrue(sset.all_done())
+        self.assertEqual(len(sset.get_store_data()), 3)
+        self.assertRaises(ValueError, group.append, self.sset, [0])
+        sset.close_store()
+
+    def test_append_simulations(self):
+        df_args = dict(self.DF_ARGS)
+        df_args['storage_folder'] = os.path.join('tmp_storage_folder',
+                                                 'appended')
+        sset = jpy.SimulationSet(self.project,
+                                 {'geometry': {'radius': [0.3, 0.35]}},
+                                 combination_mode='list', **df_args)
+        sset.make_simulation_schedule()
+        sset.run()
+        numbers = sset.append_simulations([{'radius': 0.4}])
+        self.assertEqual(numbers, [2])
+        sset.run()
+        self.assertTrue(sset.all_done())
+        self.assertEqual(len(sset.get_store_data()), 3)
+        sset.close_store()
+
+    def test_constraints(self):
+        df_args = dict(self.DF_ARGS)
+        df_args['storage_folder'] = os.path.join('tmp_storage_folder',
+                                                 'constrained')
+        sset = jpy.SimulationSet(self.project, MIE_KEYS,
+                                 constraints='radius < 0.35', **df_args)
+        sset.make_simulation_schedule()
+        self.assertEqual(sset.num_sims, 3)
+        self.assertTrue((sset.simulation_properties['radius'] < 0.35).all())
+        sset.run()
+        self.assertTrue(sset.all_done())
+        sset.close_store()
+
+    def test_callable_constraints(self):
+        df_args = dict(self.DF_ARGS)
+        df_args['storage_folder'] = os.path.join('tmp_storage_folder',
+                                                 'constrained_callable')
+        sset = jpy.SimulationSet(self.project, MIE_KEYS,
+                                 constraints=lambda k: k['radius'] < 0.35,
+                                 **df_args)
+        sset.make_simulation_schedule()
+        self.assertEqual(sset.num_sims, 3)
+        self.assertTrue((sset.simulation_properties['radius'] < 0.35).all())
+        sset.close_store()
+
+        # Callables and strings can be combined
+        sset2 = jpy.SimulationSet(self.project, MIE_KEYS,
+                                  constraints=[lambda k: k['radius'] < 0.35,
+                                               'radius > 0.31'], **df_args)
+        sset2.make_simulation_schedule()
+        self.assertEqual(sset2.num_sims, 2)
+        sset2.close_store()
+
+    def test_deduplication(self):
+        df_args = dict(self.DF_ARGS)
+        df_args['storage_folder'] = os.path.join('tmp_storage_folder',
+                                                 'deduplicated')
+        sset = jpy.SimulationSet(self.project,
+                                 {'geometry': {'radius': [0.3, 0.35, 0.3]}},
+                                 combination_mode='list', **df_args)
+        sset.make_simulation_schedule()
+        self.assertEqual(sset.num_sims_to_do(), 2)
+        submitted = []
+        sset.hooks.register('on_submit', lambda sset, sim:
+                            submitted.append(sim.keys['radius']))
+        sset.run(processing_func=DEFAULT_PROCESSING_FUNC)
+        self.assertTrue(sset.all_done())
+        self.assertEqual(sorted(submitted), [0.3, 0.35])
+        data = sset.get_store_data()
+        self.assertEqual(len(data), 3)
+
+        # The simulations are sorted, so that the duplicates are 0 and 1
+        self.assertEqual(list(data.sort_index()['radius']), [0.3, 0.3, 0.35])
+        self.assertEqual(data.loc[0, 'SCS'], data.loc[1, 'SCS'])
+        self.assertNotEqual(data.loc[0, 'SCS'], data.loc[2, 'SCS'])
+        sset.close_store()
+
+    def test_symmetries(self):
+        df_args = dict(self.DF_ARGS)
+        df_args['storage_folder'] = os.path.join('tmp_storage_folder',
+                                                 'symmetric')
+        # Not a physical symmetry, only used to test the result synthesis
+        rule = jpy.SymmetryRule({'radius': lambda r: r + 0.05})
+        sset = jpy.SimulationSet(self.project,
+                                 {'geometry': {'radius': [0.3, 0.35]}},
+                                 combination_mode='list', symmetries=rule,
+                                 **df_args)
+        sset.make_simulation_schedule()
+        self.assertEqual(sset.num_sims_to_do(), 1)
+        sset.run(processing_func=DEFAULT_PROCESSING_FUNC)
+        self.assertTrue(sset.all_done())
+        data = sset.get_store_data()
+        self.assertEqual(data.loc[1, 'radius'], 0.35)
+        self.assertEqual(data.loc[0, 'SCS'], data.loc[1, 'SCS'])
+        sset.close_store()
+
+    def test_symmetries_with_callables(self):
+        df_args = dict(self.DF_ARGS)
+        df_args['storage_folder'] = os.path.join('tmp_storage_folder',
+                                                 'symmetric_callable')
+        # Not a physical symmetry, only used to test the result synthesis
+        rule = jpy.SymmetryRule(
+                    lambda keys: keys.assign(radius=keys['radius'] + 0.05),
+                    result_map=lambda data: data.assign(SCS=2. * data['SCS']))
+        sset = jpy.SimulationSet(self.project,
+                                 {'geometry': {'radius': [0.3, 0.35]}},
+                                 combination_mode='list', symmetries=rule,
+                                 **df_args)
+        sset.make_simulation_schedule()
+        self.assertEqual(sset.num_sims_to_do(), 1)
+        sset.run(processing_func=DEFAULT_PROCESSING_FUNC)
+        self.assertTrue(sset.all_done())
+        data = sset.get_store_data()
+        self.assertEqual(data.loc[1, 'radius'], 0.35)
+        self.assertEqual(data.loc[1, 'SCS'], 2. * data.loc[0, 'SCS'])
+        sset.close_store()
+        self.assertRaises(TypeError, jpy.SymmetryRule, 'radius')
+        self.assertRaises(TypeError, jpy.SymmetryRule, {}, result_map=2.)
+
+    def test_surrogate(self):
+        self.sset.run(processing_func=DEFAULT_PROCESSING_FUNC)
+        data = self.sset.get_store_data()
+        for method in ['rbf', 'linear', 'gp']:
+            surrogate = self.sset.surrogate('SCS', method=method)
+            self.assertEqual(surrogate.features, ['radius'])
+            values, errors = surrogate.predict({'radius': [0.3, 0.33]},
+                                               return_error=True)
+            self.assertAlmostEqual(values['SCS'][0], data['SCS'][0],
+                                   places=4)
+            self.assertTrue(np.all(np.isfinite(errors['SCS'])))
+
+    def test_adaptive_scan(self):
+        df_args = dict(self.DF_ARGS)
+        df_args['storage_folder'] = os.path.join('tmp_storage_folder',
+                                                 'adaptive')
+        keys = {'geometry': {'radius': np.linspace(0.3, 0.4, 3)}}
+        scan = jpy.AdaptiveScan(self.project, keys, 'SCS', **df_args)
+        scan.run(processing_func=DEFAULT_PROCESSING_FUNC, max_sims=6,
+                 batch_size=2)
+        self.assertEqual(len(scan.get_scan_data()), 6)
+        self.assertEqual(len(scan.get_history()), 3)
+        scan.close_store()
+
+    @unittest.skipIf(sys.version_info < (3, 6), 'needs Python 3.6 or higher')
+    def test_run_async(self):
+        import asyncio
+        loop = asyncio.get_event_loop()
+        loop.run_until_complete(self.sset.run_async(poll_interval=0.1, N=2))
+        self.assertTrue(self.sset.all_done())
+
     def test_run_and_proc(self):
         self.sset.run(processing_func=DEFAULT_PROCESSING_FUNC)
         self.assertTrue('SCS' in self.sset.simulations[0]._results_dict)
@@ -99,6 +99,18 @@ class Test_ConvergenceTest(unittest.TestCase):
         self.assertTrue('deviation_SCS' in self.ctest.analyzed_data.columns)
         self.ctest.write_analyzed_data_to_file()
 
+    def test_run_convergence_test_concurrently(self):
+        # Without a special resource for the reference, both sets are run in
+        # a single SimulationSetGroup
+        self.ctest.make_simulation_schedule()
+        self.ctest.use_only_resources('localhost')
+        self.ctest.run(run_ref_with_max_cores=False,
+                       processing_func=DEFAULT_PROCESSING_FUNC)
+        self.assertTrue(self.ctest.sset_ref.all_done())
+        self.assertTrue(self.ctest.sset_test.all_done())
+        self.ctest.analyze_convergence_results('SCS')
+        self.assertTrue('deviation_SCS' in self.ctest.analyzed_data.columns)
+
 if __name__ == '__main__':
     this_test = os.path.splitext(os.path.basename(__file__))[0]
     logger.info('This is {}'.format(this_test))
@@ -0,0 +1,178 @@
+"""Unit tests for the QuantityMinimizer of pypmj.
+
+The tests run without JCMsuite using the mocked backend in
+`mock_jcmwave.py`, so that the numbers of solved simulations and of computed
+geometries can be checked. As the mocked backend must be installed before
+`pypmj.core` is imported, run this script in its own process from the `tests`
+directory.
+
+Authors : Carlo Barth
+
+"""
+
+from datetime import date
+import os
+import sys
+from shutil import rmtree
+import tempfile
+import unittest
+
+import mock_jcmwave
+if 'pypmj.core' in sys.modules:
+    raise unittest.SkipTest('pypmj.core was already imported, so that the ' +
+                            'mocked backend cannot be installed.')
+
+
+def cost_func(keys):
+    """Returns computational costs with a `TotalTime` which is minimal for a
+    radius of 0.35."""
+    ccosts = mock_jcmwave.default_cost_func(keys)
+    ccosts['TotalTime'] = (keys['radius'] - 0.35)**2 + 1.
+    return ccosts
+
+TMP_DIR = tempfile.mkdtemp(prefix='pypmj_test_')
+BACKEND = mock_jcmwave.install(TMP_DIR, cost_func=cost_func)
+
+import pypmj as jpy
+import logging
+import numpy as np
+logger = logging.getLogger(__name__)
+
+# Globals
+MIE_KEYS_SINGLE = {'constants': {}, 'parameters': {'wavelength': 0.5},
+                   'geometry': {'radius': 0.3}}
+
+
+# ==============================================================================
+class Test_QuantityMinimizer(unittest.TestCase):
+
+    tmpDir = os.path.join(TMP_DIR, 'tmp')
+    DF_ARGS = {'duplicate_path_levels': 0,
+               'storage_folder': 'tmp_storage_folder',
+               'storage_base': TMP_DIR}
+
+    def setUp(self):
+        self.project = jpy.JCMProject(mock_jcmwave.DEFAULT_PROJECT,
+                                      working_dir=self.tmpDir)
+        self.qm = jpy.QuantityMinimizer(self.project, MIE_KEYS_SINGLE,
+                                        **self.DF_ARGS)
+        self.n_solve_calls = BACKEND.n_solve_calls
+        self.n_geo_calls = BACKEND.n_geo_calls
+
+    def tearDown(self):
+        BACKEND.fail_func = None
+        self.qm.close_store()
+        for dir_ in [self.tmpDir, self.qm.storage_dir]:
+            if os.path.exists(dir_):
+                rmtree(dir_)
+
+    def get_n_solved(self):
+        return BACKEND.n_solve_calls - self.n_solve_calls
+
+    def get_n_geometries(self):
+        return BACKEND.n_geo_calls - self.n_geo_calls
+
+    def test_minimize_quantity(self):
+        self.qm.minimize_quantity('radius', 'TotalTime',
+                                  options={'xatol': 1.e-4})
+        self.assertAlmostEqual(self.qm.minimization_result.x[0], 0.35,
+                               places=3)
+        self.assertEqual(self.get_n_solved(), len(self.qm.simulations))
+
+    def test_cache_hits(self):
+        # Both trajectories evaluate the same values, which are only solved
+        # once
+        self.qm.minimize_quantity_parallel('radius', 'TotalTime',
+                                           x0=[0.31, 0.31],
+                                           options={'xatol': 1.e-4})
+        self.assertGreater(self.qm.n_cache_hits, 0)
+        self.assertEqual(self.get_n_solved(), len(self.qm.simulations))
+        results = self.qm.minimization_results
+        self.assertEqual(results[0].x[0], results[1].x[0])
+
+    def test_store_hits(self):
+        self.qm.minimize_quantity_parallel('radius', 'TotalTime', x0=[0.31],
+                                           options={'xatol': 1.e-4})
+        n_solved = self.get_n_solved()
+        self.assertEqual(self.qm.n_store_hits, 0)
+
+        # A repeated minimization takes all results from the HDF5 store
+        self.qm.minimize_quantity_parallel('radius', 'TotalTime', x0=[0.31],
+                                           options={'xatol': 1.e-4})
+        self.assertEqual(self.get_n_solved(), n_solved)
+        self.assertEqual(self.qm.n_store_hits, n_solved)
+
+    def test_geometry_reuse(self):
+        # `wavelength` is a parameter key, so the geometry is only computed
+        # once
+        self.qm.minimize_quantity('wavelength', 'TotalTime',
+                                  options={'maxiter': 5})
+        self.assertGreater(self.get_n_solved(), 1)
+        self.assertEqual(self.get_n_geometries(), 1)
+
+    def test_geometry_recomputed_for_geometry_keys(self):
+        self.qm.minimize_quantity('radius', 'TotalTime',
+                                  options={'maxiter': 5})
+        self.assertGreater(self.get_n_solved(), 1)
+        self.assertEqual(self.get_n_geometries(), self.get_n_solved())
+
+    def test_multistart(self):
+        # The minimum at a radius of 0.35 is outside of the bounds
+        self.qm.minimize_quantity_parallel('radius', 'TotalTime',
+                                           bounds=(0.2, 0.3), n_starts=2,
+                                           options={'xatol': 1.e-4})
+        self.assertEqual(len(self.qm.minimization_results), 2)
+        for result in self.qm.minimization_results:
+            self.assertTrue(0.2 <= result.x[0] <= 0.3)
+        self.assertAlmostEqual(self.qm.minimization_result.x[0], 0.3,
+                               places=3)
+        self.assertTrue((self.qm.get_store_data()['radius'] <= 0.3).all())
+
+    def test_differential_evolution(self):
+        self.qm.minimize_quantity_parallel('radius', 'TotalTime',
+                                           method='differential_evolution',
+                                           bounds=(0.2, 0.5), seed=0,
+                                           maxiter=5)
+        self.assertAlmostEqual(self.qm.minimization_result.x[0], 0.35,
+                               places=2)
+        self.assertEqual(self.get_n_solved(), len(self.qm.simulations))
+        self.assertRaises(ValueError, self.qm.minimize_quantity_parallel,
+                          'radius', 'TotalTime',
+                          method='differential_evolution')
+
+    def test_failed_evaluation(self):
+        BACKEND.fail_func = lambda keys: keys['radius'] > 0.33
+        self.qm.minimize_quantity_parallel('radius', 'TotalTime', x0=[0.31],
+                                           options={'xatol': 1.e-4})
+        result = self.qm.minimization_result
+        self.assertTrue(result.x[0] <= 0.33)
+        self.assertTrue(np.isfinite(result.fun))
+
+        # Failed simulations are excluded and evaluate to infinity
+        self.assertGreater(len(self.qm.excluded_sim_numbers), 0)
+        self.assertEqual(self.qm._solve_batch([0.4]), [np.inf])
+
+
+if __name__ == '__main__':
+    this_test = os.path.splitext(os.path.basename(__file__))[0]
+    logger.info('This is {}'.format(this_test))
+
+    # list of all test suites
+    suites = [
+        unittest.TestLoader().loadTestsFromTestCase(Test_QuantityMinimizer)]
+
+    # Get a log file for the test output
+    log_dir = os.path.abspath('logs')
+    if not os.path.isdir(log_dir):
+        os.makedirs(log_dir)
+    today_fmt = date.today().strftime("%y%m%d")
+    test_log_file = os.path.join(log_dir, '{}_{}.log'.format(today_fmt,
+                                                             this_test))
+    logger.info('Writing test logs to: {}'.format(test_log_file))
+    with open(test_log_file, 'w') as f:
+        for suite in suites:
+            unittest.TextTestRunner(f, verbosity=2).run(suite)
+    with open(test_log_file, 'r') as f:
+        content = f.read()
+    logger.info('\n\nTest results:\n' + 80 * '=' + '\n' + content)
+    rmtree(TMP_DIR)